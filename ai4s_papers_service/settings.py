@@ -157,4 +157,18 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # PDF Parser API Configuration
-PDF_PARSER_API_URL = os.getenv('PDF_PARSER_API_URL', 'https://yfb222333--pdf-parser-parse-pdf-upload.modal.run')
+# Async job API of the parser (POST /jobs, GET /jobs/{job_id}/result)
+PDF_PARSER_JOBS_API_URL = os.getenv('PDF_PARSER_JOBS_API_URL', 'https://yfb222333--pdf-parser-parse-jobs-api.modal.run')
+PDF_PARSER_JOB_TIMEOUT_SECONDS = float(os.getenv('PDF_PARSER_JOB_TIMEOUT_SECONDS', '1800'))
+PDF_PARSER_JOB_POLL_SECONDS = float(os.getenv('PDF_PARSER_JOB_POLL_SECONDS', '5'))
+
+# Papers listing pagination (GET /api/papers)
+PAPERS_PAGE_SIZE = int(os.getenv('PAPERS_PAGE_SIZE', '100'))
+PAPERS_MAX_PAGE_SIZE = int(os.getenv('PAPERS_MAX_PAGE_SIZE', '1000'))
+
+# Bulk paper ingest (POST /api/papers/bulk)
+PAPERS_BULK_MAX_ITEMS = int(os.getenv('PAPERS_BULK_MAX_ITEMS', '1000'))
+# total size of the files uploaded in one bulk request
+PAPERS_BULK_MAX_UPLOAD_BYTES = int(os.getenv('PAPERS_BULK_MAX_UPLOAD_BYTES', str(1024**3)))
+# papers whose file bytes are read and inserted together - bounds memory and INSERT size
+PAPERS_BULK_INSERT_BATCH = int(os.getenv('PAPERS_BULK_INSERT_BATCH', '50'))
@@ -140,7 +140,9 @@ export default {
             },
             body: JSON.stringify({
                 parameters: {
-                    s3_object_url: s3_object_url
+                    s3_object_url: s3_object_url,
+                    // md5 lets the flow skip files that are already processed
+                    origin_filemd5: (event.checksums && event.checksums.md5) || event.object.eTag || null
                 }
             })
         });
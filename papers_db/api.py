@@ -1,64 +1,90 @@
 import json
+import time
+import asyncio
+import base64
+import binascii
 from ninja import NinjaAPI, Form, File  
+from ninja.errors import HttpError
 from ninja.files import UploadedFile
 from typing import Optional
-from .models import Paper
-from .schemas import PaperOut, PaperIn, PaperFileUpload
+from .models import Paper, PaperContent, update_search_vector
+from .schemas import PaperOut, PaperIn, PaperFileUpload, PaperPageOut, PaperBulkOut, PaperMd5LookupIn, PaperMd5LookupOut
+from pydantic import ValidationError
 import httpx
 from django.conf import settings
 from asgiref.sync import sync_to_async
 import hashlib
 from django.db import transaction
+from django.db.models import F, Q
 
 
 # Create API instance
 api = NinjaAPI(title="Papers API", csrf=False)
 
-# PDF Parser API URL from Django settings
-PDF_PARSER_API_URL = settings.PDF_PARSER_API_URL
+# PDF Parser job API from Django settings
+PDF_PARSER_JOBS_API_URL = settings.PDF_PARSER_JOBS_API_URL
+PDF_PARSER_JOB_TIMEOUT_SECONDS = settings.PDF_PARSER_JOB_TIMEOUT_SECONDS
+PDF_PARSER_JOB_POLL_SECONDS = settings.PDF_PARSER_JOB_POLL_SECONDS
+
+# Paper listing page size from Django settings
+PAPERS_PAGE_SIZE = settings.PAPERS_PAGE_SIZE
+PAPERS_MAX_PAGE_SIZE = settings.PAPERS_MAX_PAGE_SIZE
+
+# Max papers accepted by one bulk ingest request
+PAPERS_BULK_MAX_ITEMS = settings.PAPERS_BULK_MAX_ITEMS
+PAPERS_BULK_MAX_UPLOAD_BYTES = settings.PAPERS_BULK_MAX_UPLOAD_BYTES
+PAPERS_BULK_INSERT_BATCH = settings.PAPERS_BULK_INSERT_BATCH
+
+# Columns never needed by PaperOut - keep them out of the listing SELECT
+# (file bytes live in PaperContent and are never joined here)
+PAPER_LIST_DEFERRED_FIELDS = ['abstract', 'search_vector']
 
 async def parse_pdf_with_modal_async(origin_content: bytes, filename: str) -> str:
-    """Call Modal GPU API to parse PDF content - ASYNC VERSION"""
-    print(f'=== DEBUG: Calling Modal GPU API for PDF parsing (async) ===: {filename}')
-    print(f'=== DEBUG: PDF_PARSER_API_URL = {PDF_PARSER_API_URL} ===')
+    """Parse PDF content via the Modal parser job API - submit, then poll without holding a connection"""
+    print(f'=== DEBUG: Submitting PDF parse job (async) ===: {filename}')
+    print(f'=== DEBUG: PDF_PARSER_JOBS_API_URL = {PDF_PARSER_JOBS_API_URL} ===')
     
-    if not PDF_PARSER_API_URL or PDF_PARSER_API_URL == "":
-        print('=== ERROR: PDF_PARSER_API_URL not set! ===')
+    if not PDF_PARSER_JOBS_API_URL or PDF_PARSER_JOBS_API_URL == "":
+        print('=== ERROR: PDF_PARSER_JOBS_API_URL not set! ===')
         return ''
     
     try:
-        print(f'=== DEBUG: Using direct file upload endpoint ===: {PDF_PARSER_API_URL}')
         print(f'=== DEBUG: File size: {len(origin_content)} bytes ===')
         
-        # Use async HTTP client with direct file upload
-        async with httpx.AsyncClient(timeout=300.0) as client:
+        async with httpx.AsyncClient(timeout=60.0) as client:
             
             # Prepare multipart form data for direct upload
             files = {
                 'file': (filename, origin_content, 'application/pdf')
             }
             data = {
-                'engine': 'marker'  # or 'docling'
+                'engine': 'marker'  # or 'docling' / 'text'
             }
             
-            print(f'=== DEBUG: Starting async file upload to Modal API ===')
-            
-            response = await client.post(PDF_PARSER_API_URL, files=files, data=data)
+            response = await client.post(f'{PDF_PARSER_JOBS_API_URL}/jobs', files=files, data=data)
+            response.raise_for_status()
+            job = response.json()
+            print(f'=== DEBUG: Parse job submitted ===: {job["job_id"]} status={job["status"]}')
             
-            print(f'=== DEBUG: Modal response status ===: {response.status_code}')
-            print(f'=== DEBUG: Modal response headers ===: {dict(response.headers)}')
+            deadline = time.monotonic() + PDF_PARSER_JOB_TIMEOUT_SECONDS
+            while True:
+                response = await client.get(f'{PDF_PARSER_JOBS_API_URL}/jobs/{job["job_id"]}/result')
+                response.raise_for_status()
+                if response.status_code == 200:
+                    break
+                if time.monotonic() >= deadline:
+                    print(f'=== ERROR: Parse job timed out ===: {job["job_id"]}')
+                    return ''
+                await asyncio.sleep(PDF_PARSER_JOB_POLL_SECONDS)
             
-            if response.status_code == 200:
-                result = await response.json()
-                print(f'=== DEBUG: Modal returned success ===: {result.get("success", False)}')
-                print(f'=== DEBUG: Modal response data keys ===: {list(result.keys())}')
-                markdown = result.get('markdown', '')
-                print(f'=== DEBUG: Markdown length ===: {len(markdown)} characters')
-                return markdown
-            else:
-                print(f'=== ERROR: Modal API failed ===: {response.status_code}')
-                print(f'=== ERROR: Modal response text ===: {response.text}')
+            result = response.json()
+            print(f'=== DEBUG: Modal returned success ===: {result.get("success", False)}')
+            if not result.get('success', True):
+                print(f'=== ERROR: Modal parse failed ===: {result.get("error")}')
                 return ''
+            markdown = result.get('markdown', '')
+            print(f'=== DEBUG: Markdown length ===: {len(markdown)} characters')
+            return markdown
                 
     except httpx.TimeoutException as e:
         print(f'=== ERROR: Modal API timeout ===: {str(e)}')
@@ -76,6 +102,41 @@ def calculate_md5(content: bytes) -> str:
     """Calculate MD5 hash of binary content"""
     return hashlib.md5(content).hexdigest()
 
+def calculate_upload_md5(uploaded_file) -> str:
+    """MD5 of an uploaded file, streamed chunk by chunk without keeping the bytes"""
+    md5 = hashlib.md5()
+    for chunk in uploaded_file.chunks():
+        md5.update(chunk)
+    return md5.hexdigest()
+
+def read_upload(uploaded_file, md5=None) -> bytearray:
+    """
+    Read an uploaded file chunk by chunk into one preallocated buffer,
+    feeding each chunk to md5 on the way when given - a single whole-file copy
+    """
+    content = bytearray(uploaded_file.size)
+    view = memoryview(content)
+    position = 0
+    for chunk in uploaded_file.chunks():
+        if md5 is not None:
+            md5.update(chunk)
+        view[position:position + len(chunk)] = chunk
+        position += len(chunk)
+    view.release()
+    # size reported by the client can be larger than what actually arrived
+    if position != len(content):
+        del content[position:]
+    return content
+
+def read_upload_with_md5(uploaded_file) -> tuple:
+    """
+    Read an uploaded file and hash it in the same pass
+    Returns (content, md5)
+    """
+    md5 = hashlib.md5()
+    content = read_upload(uploaded_file, md5)
+    return content, md5.hexdigest()
+
 def deactivate_duplicate_papers(origin_filemd5: str) -> int:
     """
     Deactivate papers with the same PDF MD5 hash
@@ -101,10 +162,87 @@ def deactivate_duplicate_papers(origin_filemd5: str) -> int:
     return count
 
 
-@api.get("/papers", response=list[PaperOut])
-def list_papers(request):
-    """Get all papers - only active ones"""
-    return Paper.objects.filter(is_active=True)  # type: ignore
+def encode_papers_cursor(paper: Paper) -> str:
+    """Encode the keyset (year, title, id) of the last paper on a page"""
+    raw = json.dumps([paper.year, paper.title, paper.id], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_papers_cursor(cursor: str) -> tuple:
+    """Decode a cursor produced by encode_papers_cursor, raise 400 if malformed"""
+    try:
+        year, title, paper_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError, binascii.Error):
+        raise HttpError(400, "Invalid cursor")
+    return year, title, paper_id
+
+
+@api.get("/papers", response=PaperPageOut)
+def list_papers(request,
+                cursor: Optional[str] = None,
+                limit: int = PAPERS_PAGE_SIZE,
+                primary_domain: Optional[str] = None,
+                year: Optional[int] = None):
+    """
+    Get active papers - keyset paginated on (-year, title, id), papers without a year last
+    Pass next_cursor of the previous page as cursor to get the next page
+    """
+    limit = max(1, min(limit, PAPERS_MAX_PAGE_SIZE))
+
+    query = Paper.objects.filter(is_active=True).defer(*PAPER_LIST_DEFERRED_FIELDS)
+    if primary_domain:
+        query = query.filter(primary_domain=primary_domain)
+    if year is not None:
+        query = query.filter(year=year)
+
+    if cursor:
+        last_year, last_title, last_id = decode_papers_cursor(cursor)
+        after_in_year = Q(title__gt=last_title) | Q(title=last_title, id__gt=last_id)
+        if last_year is None:
+            # already among the papers without a year
+            query = query.filter(Q(year__isnull=True) & after_in_year)
+        else:
+            query = query.filter(
+                Q(year__lt=last_year) |
+                Q(year=last_year) & after_in_year |
+                Q(year__isnull=True)
+            )
+
+    # fetch one extra row to know whether there is a next page
+    # NULL years sorted explicitly last - Postgres puts them first under plain -year (papers_active_keyset_idx matches)
+    papers = list(query.order_by(F('year').desc(nulls_last=True), 'title', 'id')[:limit + 1])
+    has_next = len(papers) > limit
+    papers = papers[:limit]
+
+    return {
+        "items": papers,
+        "next_cursor": encode_papers_cursor(papers[-1]) if has_next else None,
+    }
+
+
+@api.post("/papers/lookup-md5", response=PaperMd5LookupOut)
+def lookup_papers_by_md5(request, payload: PaperMd5LookupIn):
+    """
+    Which origin file MD5s are already stored on an active paper
+    Lets the workflow skip download/parse/LLM for files it has processed before
+    """
+    md5s = list(dict.fromkeys(md5.strip().lower() for md5 in payload.md5s if md5 and md5.strip()))
+    if len(md5s) > PAPERS_BULK_MAX_ITEMS:
+        raise HttpError(413, f"Too many md5s in one request: {len(md5s)} > {PAPERS_BULK_MAX_ITEMS}")
+    
+    found = {}
+    # newest paper wins if (unexpectedly) several active papers share an md5
+    rows = (
+        Paper.objects.filter(origin_filemd5__in=md5s, is_active=True)
+        .order_by('id')
+        .values_list('origin_filemd5', 'id', 'fastgpt_collectionId')
+    )
+    for origin_filemd5, paper_id, fastgpt_collectionId in rows:
+        found[origin_filemd5] = {"paper_id": paper_id, "fastgpt_collectionId": fastgpt_collectionId}
+    
+    return {
+        "found": found,
+        "missing": [md5 for md5 in md5s if md5 not in found],
+    }
 
 
 @api.patch("/papers/{paper_id}/fastgpt-collectionId")
@@ -130,37 +268,181 @@ def create_paper(request):
     # 检查请求类型
     if request.content_type.startswith('multipart/form-data'):
         # Multipart请求 - 处理文件上传
-        form_data = request.POST.dict()
+        paper = Paper(**request.POST.dict())
         
         # 获取上传的文件
         origin_file = request.FILES.get('origin_file', None) or request.FILES.get('pdf_file', None)
         markdown_file = request.FILES.get('markdown_file')
         
-        paper_data = form_data.copy()
-        
-        # 处理文件内容
+        # 处理文件内容 - 分块读取的同时计算MD5, 每个文件只计算一次
         if origin_file:
-            # 读取文件内容为字节
-            origin_content = origin_file.read()
-            paper_data['origin_filename'] = origin_file.name
-            paper_data['origin_content'] = origin_content
+            origin_content, origin_filemd5 = read_upload_with_md5(origin_file)
+            paper.origin_filename = origin_file.name
+            paper.set_file_content('origin_content', origin_content, origin_filemd5)
             
-            # Calculate MD5 and handle deduplication
-            origin_filemd5 = calculate_md5(origin_content)
+            # Handle deduplication
             deactivate_duplicate_papers(origin_filemd5)
         
         if markdown_file:
-            markdown_content = markdown_file.read()
-            paper_data['markdown_content'] = markdown_content
-            paper_data['markdown_filename'] = markdown_file.name
+            markdown_content, markdown_filemd5 = read_upload_with_md5(markdown_file)
+            paper.markdown_filename = markdown_file.name
+            paper.set_file_content('markdown_content', markdown_content, markdown_filemd5)
             
     else:
-        # JSON请求 - 纯元数据
-        paper_data = request.json
+        # JSON请求 - 纯元数据 (忽略服务端维护的字段)
+        paper_data = json.loads(request.body)
+        for server_field in ('id', 'created_at', 'updated_at'):
+            paper_data.pop(server_field, None)
+        paper = Paper(**paper_data)
     
     
-    # 统一创建Paper对象
-    return Paper.objects.create(**paper_data)
+    # 统一保存Paper对象
+    paper.save()
+    return paper
+
+
+def parse_bulk_items(raw_text: str) -> list:
+    """
+    Parse bulk metadata - NDJSON (one object per line) or a JSON array
+    Returns a list of dicts, or an error string for lines that are not valid JSON objects
+    """
+    stripped = raw_text.strip()
+    if stripped.startswith('['):
+        try:
+            items = json.loads(stripped)
+        except ValueError as e:
+            raise HttpError(400, f"Invalid JSON array: {e}")
+        lines = items
+    else:
+        lines = []
+        for line in stripped.splitlines():
+            if not line.strip():
+                continue
+            try:
+                lines.append(json.loads(line))
+            except ValueError as e:
+                lines.append(f"Invalid JSON line: {e}")
+    return [item if isinstance(item, (dict, str)) else "Item must be a JSON object" for item in lines]
+
+
+@api.post("/papers/bulk", response=PaperBulkOut)
+@transaction.atomic
+def create_papers_bulk(request):
+    """
+    Create many papers in one request - 批量导入
+    - application/x-ndjson (or JSON array): metadata only, one paper per line
+    - multipart/form-data: field "papers" holds the NDJSON/JSON metadata, items may name
+      their uploaded files with "origin_file" / "markdown_file" keys
+    Duplicates (same origin_filemd5) are resolved for the whole batch with one query,
+    rows are inserted with bulk_create, and every item gets its own result
+    Files are hashed by streaming them for the dedup; their bytes are only read (once, unhashed)
+    PAPERS_BULK_INSERT_BATCH papers at a time, right before their insert
+    """
+    if request.content_type.startswith('multipart/form-data'):
+        raw_items = parse_bulk_items(request.POST.get('papers', ''))
+    else:
+        raw_items = parse_bulk_items(request.body.decode('utf-8'))
+    
+    if len(raw_items) > PAPERS_BULK_MAX_ITEMS:
+        raise HttpError(413, f"Too many papers in one request: {len(raw_items)} > {PAPERS_BULK_MAX_ITEMS}")
+    # lists(): a repeated field name carries several files, values() would only count the last
+    upload_bytes = sum(uploaded_file.size for _, uploaded_files in request.FILES.lists() for uploaded_file in uploaded_files)
+    if upload_bytes > PAPERS_BULK_MAX_UPLOAD_BYTES:
+        raise HttpError(413, f"Uploaded files too large for one request: {upload_bytes} > {PAPERS_BULK_MAX_UPLOAD_BYTES} bytes")
+    
+    results = [{"index": index, "status": "error"} for index in range(len(raw_items))]
+    pending = []  # (index, paper, {content_field: uploaded_file})
+    
+    for index, item in enumerate(raw_items):
+        if isinstance(item, str):
+            results[index]["error"] = item
+            continue
+        
+        item = dict(item)
+        origin_field = item.pop('origin_file', None)
+        markdown_field = item.pop('markdown_file', None)
+        try:
+            paper_data = PaperIn(**item).model_dump(exclude_unset=True)
+        except ValidationError as e:
+            results[index]["error"] = str(e)
+            continue
+        
+        paper = Paper(**paper_data)
+        if paper.year is None:
+            paper.year = 2025
+        uploads = {}
+        
+        if origin_field:
+            origin_file = request.FILES.get(origin_field)
+            if origin_file is None:
+                results[index]["error"] = f"Missing uploaded file: {origin_field}"
+                continue
+            uploads['origin_content'] = origin_file
+            paper.origin_filemd5 = calculate_upload_md5(origin_file)
+            paper.origin_filename = origin_file.name
+        
+        if markdown_field:
+            markdown_file = request.FILES.get(markdown_field)
+            if markdown_file is None:
+                results[index]["error"] = f"Missing uploaded file: {markdown_field}"
+                continue
+            uploads['markdown_content'] = markdown_file
+            paper.markdown_filemd5 = calculate_upload_md5(markdown_file)
+            paper.markdown_filename = markdown_file.name
+        
+        pending.append((index, paper, uploads))
+    
+    # Duplicates inside the batch - the last uploaded occurrence wins, like sequential uploads
+    last_index_by_md5 = {
+        paper.origin_filemd5: index
+        for index, paper, uploads in pending
+        if 'origin_content' in uploads
+    }
+    to_create = []
+    for index, paper, uploads in pending:
+        if 'origin_content' in uploads and last_index_by_md5[paper.origin_filemd5] != index:
+            results[index].update(
+                status="skipped",
+                origin_filemd5=paper.origin_filemd5,
+                error=f"Duplicate of item {last_index_by_md5[paper.origin_filemd5]} in this batch",
+            )
+            continue
+        to_create.append((index, paper, uploads))
+    
+    # Duplicates already stored - one UPDATE for the whole batch
+    deactivated = 0
+    if last_index_by_md5:
+        deactivated = Paper.objects.filter(
+            origin_filemd5__in=list(last_index_by_md5),
+            is_active=True
+        ).update(is_active=False)
+        print(f"=== DEDUP: Deactivated {deactivated} duplicate papers for bulk ingest ===")
+    
+    created_ids = []
+    for start in range(0, len(to_create), PAPERS_BULK_INSERT_BATCH):
+        batch = to_create[start:start + PAPERS_BULK_INSERT_BATCH]
+        created_papers = Paper.objects.bulk_create([paper for _, paper, _ in batch])
+        # only this batch's file bytes are in memory, released before the next batch is read
+        paper_contents = [
+            PaperContent(paper=paper, **{field: read_upload(uploaded_file) for field, uploaded_file in uploads.items()})
+            for (_, _, uploads), paper in zip(batch, created_papers)
+            if uploads
+        ]
+        PaperContent.objects.bulk_create(paper_contents)
+        del paper_contents
+        
+        for (index, _, _), paper in zip(batch, created_papers):
+            results[index].update(status="created", id=paper.id, origin_filemd5=paper.origin_filemd5)
+            created_ids.append(paper.id)
+    update_search_vector(Paper.objects.filter(id__in=created_ids))
+    
+    return {
+        "created": len(created_ids),
+        "skipped": sum(1 for r in results if r["status"] == "skipped"),
+        "failed": sum(1 for r in results if r["status"] == "error"),
+        "deactivated": deactivated,
+        "results": results,
+    }
 
 
 # @api.post("/papers/upload-parse", response=PaperOut)
@@ -1,9 +1,16 @@
 from ninja import NinjaAPI, Schema
-from django.db.models import Count, Q
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import BinaryField, Count, F, Q
+from django.db.models.functions import Length, Substr
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
 from typing import Optional
-from .models import Paper
+from .models import Paper, PaperContent, PAPER_SEARCH_CONFIG
 from .schemas import PaperOut
 from datetime import datetime
+import secrets
 
 # Create separate API instance for file operations
 file_api = NinjaAPI(title="Files API", version="1.0.0", urls_namespace="file_api", csrf=False)
@@ -19,6 +26,9 @@ PRIMARY_DOMAINS_LIST = [
     "unknown"
 ]
 
+# PDF bytes read from the database per query when streaming
+PDF_STREAM_CHUNK_SIZE = 256 * 1024
+
 class FileListRequest(Schema):
     parentId: Optional[str] = None
     searchKey: Optional[str] = None
@@ -49,18 +59,30 @@ def list_files(request, payload: FileListRequest):
         }
     
     # Return papers in domain - only active ones
-    query = Paper.objects.filter(primary_domain=payload.parentId.rstrip('/'), is_active=True)
+    query = (
+        Paper.objects.filter(primary_domain=payload.parentId.rstrip('/'), is_active=True)
+        .only('id', 'title', 'year', 'origin_filename')
+    )
     
     # Add search filter
     search_key = payload.searchKey or ""
-    if search_key:
-        query = query.filter(
+    if search_key and connection.vendor == 'postgresql':
+        # GIN-indexed full-text search, ranked by the weighted search_vector
+        search_query = SearchQuery(search_key, config=PAPER_SEARCH_CONFIG, search_type='websearch')
+        papers = (
+            query.filter(search_vector=search_query)
+            .annotate(rank=SearchRank(F('search_vector'), search_query))
+            .order_by('-rank', '-year', 'title')
+        )
+    elif search_key:
+        # Fallback for non-PostgreSQL databases (e.g. SQLite in tests)
+        papers = query.filter(
             Q(title__icontains=search_key) |
             Q(authors__icontains=search_key) |
             Q(keywords__icontains=search_key)
-        )
-    
-    papers = query.order_by('-year', 'title')
+        ).order_by('-year', 'title')
+    else:
+        papers = query.order_by('-year', 'title')
     
     files = []
     for paper in papers:
@@ -94,7 +116,8 @@ def get_file_content(request, id: str):
     # content = paper.markdown_content or None
     content = bytes(paper.markdown_content).decode('utf-8') if paper.markdown_content else None
 
-    preview_url = f"/api/file/pdf/{paper.id}" if paper.origin_content else None
+    # origin_filemd5 is set whenever a PDF is stored - avoids loading the PDF bytes
+    preview_url = f"/api/file/pdf/{paper.id}" if paper.origin_filemd5 else None
     
     return {
         "code": 200,
@@ -107,13 +130,130 @@ def get_file_content(request, id: str):
         }
     }
 
+def parse_range_header(range_header: str, file_size: int) -> Optional[list]:
+    """
+    Parse "bytes=0-99,200-,-50" into inclusive (start, end) pairs
+    Returns None for a missing or malformed header (serve the whole file)
+    and [] when no range is satisfiable (416)
+    """
+    if not range_header or not range_header.startswith('bytes='):
+        return None
+    
+    ranges = []
+    for part in range_header[len('bytes='):].split(','):
+        part = part.strip()
+        if '-' not in part:
+            return None
+        start_str, end_str = part.split('-', 1)
+        try:
+            if start_str:
+                start = int(start_str)
+                end = int(end_str) if end_str else file_size - 1
+                if end_str and start > end:
+                    return None
+            else:
+                # suffix range: last N bytes
+                suffix_length = int(end_str)
+                start = max(file_size - suffix_length, 0)
+                end = file_size - 1
+        except ValueError:
+            return None
+        if start < file_size:
+            ranges.append((start, min(end, file_size - 1)))
+    return ranges
+
+def iter_pdf_chunks(paper_id: int, start: int, end: int):
+    """Read origin_content[start:end+1] from the database chunk by chunk"""
+    position = start
+    while position <= end:
+        length = min(PDF_STREAM_CHUNK_SIZE, end - position + 1)
+        chunk = (
+            PaperContent.objects.filter(paper_id=paper_id)
+            .annotate(chunk=Substr('origin_content', position + 1, length, output_field=BinaryField()))
+            .values_list('chunk', flat=True)
+            .first()
+        )
+        if not chunk:
+            return
+        yield bytes(chunk)
+        position += length
+
+def iter_multipart_byteranges(paper_id: int, ranges: list, parts_headers: list, boundary: str):
+    """Stream a multipart/byteranges body for several ranges"""
+    for (start, end), part_headers in zip(ranges, parts_headers):
+        yield part_headers
+        yield from iter_pdf_chunks(paper_id, start, end)
+        yield b'\r\n'
+    yield f'--{boundary}--\r\n'.encode('ascii')
+
 @file_api.get("/pdf/{paper_id}")
 def serve_pdf(request, paper_id: int):
-    """Serve PDF content"""
-    from django.http import HttpResponse
+    """
+    Serve PDF content - streamed from the database in chunks
+    Supports Range (single and multi), ETag (origin_filemd5) and conditional GET
+    """
+    paper = Paper.objects.only('id', 'origin_filename', 'origin_filemd5', 'updated_at').get(id=paper_id)
     
-    paper = Paper.objects.get(id=paper_id)
-    response = HttpResponse(paper.origin_content, content_type='application/pdf')
+    etag = quote_etag(paper.origin_filemd5) if paper.origin_filemd5 else None
+    last_modified = int(paper.updated_at.timestamp())
+    
+    # If-None-Match / If-Modified-Since -> 304, If-Match / If-Unmodified-Since -> 412
+    conditional_response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional_response is not None:
+        return conditional_response
+    
+    file_size = (
+        PaperContent.objects.filter(paper_id=paper_id, origin_content__isnull=False)
+        .annotate(size=Length('origin_content'))
+        .values_list('size', flat=True)
+        .first()
+    )
+    if file_size is None:
+        raise Http404("No PDF content for this paper")
+    
+    # Ignore Range if If-Range does not match the current version
+    ranges = parse_range_header(request.headers.get('Range', ''), file_size)
+    if_range = request.headers.get('If-Range')
+    if ranges and if_range and if_range != etag and parse_http_date_safe(if_range) != last_modified:
+        ranges = None
+    
+    if ranges == []:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{file_size}'
+    elif not ranges:
+        response = StreamingHttpResponse(iter_pdf_chunks(paper_id, 0, file_size - 1), content_type='application/pdf')
+        response['Content-Length'] = str(file_size)
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(iter_pdf_chunks(paper_id, start, end), status=206, content_type='application/pdf')
+        response['Content-Range'] = f'bytes {start}-{end}/{file_size}'
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        boundary = secrets.token_hex(16)
+        parts_headers = [
+            (
+                f'--{boundary}\r\n'
+                f'Content-Type: application/pdf\r\n'
+                f'Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n'
+            ).encode('ascii')
+            for start, end in ranges
+        ]
+        content_length = (
+            sum(len(h) for h in parts_headers)
+            + sum(end - start + 1 + 2 for start, end in ranges)
+            + len(f'--{boundary}--\r\n')
+        )
+        response = StreamingHttpResponse(
+            iter_multipart_byteranges(paper_id, ranges, parts_headers, boundary),
+            status=206,
+            content_type=f'multipart/byteranges; boundary={boundary}'
+        )
+        response['Content-Length'] = str(content_length)
+    
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = http_date(last_modified)
+    if etag:
+        response['ETag'] = etag
     response['Content-Disposition'] = f'inline; filename="{paper.origin_filename or "paper.pdf"}"'
     return response
 
@@ -0,0 +1,139 @@
+"""
+Memory benchmark for paper file ingestion
+
+Compares the legacy path (read() the whole upload, hash it, hash it again in
+Paper.save()) with the single-pass path used by create_paper
+(read_upload_with_md5 + Paper.set_file_content). Each case runs in a forked
+child process so peak RSS is measured per case; database writes are rolled back.
+
+Usage:
+    python manage.py bench_ingest_memory --sizes 16 64 200
+"""
+
+import multiprocessing
+import os
+import resource
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from papers_db.api import calculate_md5, read_upload_with_md5
+from papers_db.models import Paper
+
+MB = 1024 * 1024
+
+
+def make_upload(size_mb: int) -> TemporaryUploadedFile:
+    """Spool a fake PDF of size_mb to disk, like Django does for large uploads"""
+    upload = TemporaryUploadedFile("bench.pdf", "application/pdf", size_mb * MB, None)
+    block = os.urandom(MB)
+    for _ in range(size_mb):
+        upload.write(block)
+    upload.seek(0)
+    return upload
+
+
+def current_rss_kb() -> int:
+    """Current resident set size in KB (Linux), 0 if unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError):
+        return 0
+
+
+def ingest_legacy(upload):
+    """Previous create_paper behaviour: read(), hash, then hash again in save()"""
+    origin_content = upload.read()
+    calculate_md5(origin_content)
+    paper = Paper(title="bench", authors="bench", primary_domain="test")
+    paper.origin_content = origin_content
+    paper.save()
+
+
+def ingest_streaming(upload):
+    """Current create_paper behaviour: hash while reading, hash exactly once"""
+    origin_content, origin_filemd5 = read_upload_with_md5(upload)
+    paper = Paper(title="bench", authors="bench", primary_domain="test")
+    paper.set_file_content('origin_content', origin_content, origin_filemd5)
+    paper.save()
+
+
+INGEST_MODES = {
+    'legacy': ingest_legacy,
+    'streaming': ingest_streaming,
+}
+
+
+def run_case(mode: str, size_mb: int) -> dict:
+    """Ingest one upload and report timing and memory, DB changes rolled back"""
+    upload = make_upload(size_mb)
+    rss_start_kb = current_rss_kb()
+    tracemalloc.start()
+    start_time = time.time()
+    try:
+        with transaction.atomic():
+            INGEST_MODES[mode](upload)
+            transaction.set_rollback(True)
+    finally:
+        elapsed = time.time() - start_time
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        upload.close()
+    max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        'mode': mode,
+        'size_mb': size_mb,
+        'seconds': elapsed,
+        'traced_peak_mb': traced_peak / MB,
+        'rss_growth_mb': max(max_rss_kb - rss_start_kb, 0) / 1024 if rss_start_kb else None,
+    }
+
+
+def _run_case_in_child(conn, mode, size_mb):
+    conn.send(run_case(mode, size_mb))
+    conn.close()
+
+
+class Command(BaseCommand):
+    help = "Benchmark peak memory of paper file ingestion (legacy vs single-pass)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[16, 64, 200], help="Upload sizes in MB")
+        parser.add_argument('--modes', nargs='+', default=list(INGEST_MODES), choices=list(INGEST_MODES))
+        parser.add_argument('--inline', action='store_true', help="Run in this process instead of forking per case")
+
+    def handle(self, *args, **options):
+        use_fork = not options['inline'] and 'fork' in multiprocessing.get_all_start_methods()
+
+        if settings.DEBUG:
+            self.stdout.write(self.style.WARNING(
+                "DEBUG=True: Django logs every query with its parameters, which copies the file bytes "
+                "several times. Run with DEBUG=False for numbers that match production."
+            ))
+
+        self.stdout.write(f"{'mode':<10} {'size MB':>8} {'time s':>8} {'traced peak MB':>15} {'peak/size':>10} {'RSS growth MB':>14}")
+        for size_mb in options['sizes']:
+            for mode in options['modes']:
+                if use_fork:
+                    # child must open its own DB connection
+                    connections.close_all()
+                    parent_conn, child_conn = multiprocessing.Pipe()
+                    process = multiprocessing.get_context('fork').Process(
+                        target=_run_case_in_child, args=(child_conn, mode, size_mb)
+                    )
+                    process.start()
+                    result = parent_conn.recv()
+                    process.join()
+                else:
+                    result = run_case(mode, size_mb)
+
+                rss_growth = f"{result['rss_growth_mb']:.1f}" if result['rss_growth_mb'] is not None else "n/a"
+                self.stdout.write(
+                    f"{result['mode']:<10} {result['size_mb']:>8} {result['seconds']:>8.2f} "
+                    f"{result['traced_peak_mb']:>15.1f} {result['traced_peak_mb'] / size_mb:>10.2f} {rss_growth:>14}"
+                )
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('papers_db', '0009_paper_fastgpt_collectionid'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='paper',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-year', 'title', 'id'], name='papers_active_keyset_idx'),
+        ),
+    ]
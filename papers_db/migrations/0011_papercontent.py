@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('papers_db', '0010_paper_active_keyset_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaperContent',
+            fields=[
+                ('paper', models.OneToOneField(help_text='Paper this content belongs to', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='content', serialize=False, to='papers_db.paper')),
+                ('origin_content', models.BinaryField(blank=True, help_text='PDF file binary content stored in PostgreSQL', null=True)),
+                ('markdown_content', models.BinaryField(blank=True, help_text='Markdown file binary content stored in PostgreSQL', null=True)),
+            ],
+            options={
+                'verbose_name': 'Paper Content',
+                'verbose_name_plural': 'Paper Contents',
+                'db_table': 'paper_contents',
+            },
+        ),
+    ]
@@ -0,0 +1,74 @@
+from django.db import migrations, transaction
+from django.db.models import Q
+
+# Papers moved per transaction - small batches keep row locks short on a live table
+BATCH_SIZE = 100
+
+
+def move_content_to_side_table(apps, schema_editor):
+    """Copy origin/markdown bytes from papers into paper_contents, batch by batch"""
+    Paper = apps.get_model('papers_db', 'Paper')
+    PaperContent = apps.get_model('papers_db', 'PaperContent')
+    db_alias = schema_editor.connection.alias
+
+    has_content = Q(origin_content__isnull=False) | Q(markdown_content__isnull=False)
+    last_id = 0
+    while True:
+        with transaction.atomic(using=db_alias):
+            rows = list(
+                Paper.objects.using(db_alias)
+                .filter(has_content, id__gt=last_id)
+                .order_by('id')
+                .values_list('id', 'origin_content', 'markdown_content')[:BATCH_SIZE]
+            )
+            if not rows:
+                break
+            # ignore_conflicts makes a re-run after a partial failure safe
+            PaperContent.objects.using(db_alias).bulk_create(
+                [
+                    PaperContent(paper_id=paper_id, origin_content=origin_content, markdown_content=markdown_content)
+                    for paper_id, origin_content, markdown_content in rows
+                ],
+                ignore_conflicts=True,
+            )
+        last_id = rows[-1][0]
+        print(f"=== MIGRATE: Moved content of papers up to id={last_id} ===")
+
+
+def move_content_back_to_papers(apps, schema_editor):
+    """Reverse: copy bytes from paper_contents back into papers, batch by batch"""
+    Paper = apps.get_model('papers_db', 'Paper')
+    PaperContent = apps.get_model('papers_db', 'PaperContent')
+    db_alias = schema_editor.connection.alias
+
+    last_id = 0
+    while True:
+        with transaction.atomic(using=db_alias):
+            rows = list(
+                PaperContent.objects.using(db_alias)
+                .filter(paper_id__gt=last_id)
+                .order_by('paper_id')
+                .values_list('paper_id', 'origin_content', 'markdown_content')[:BATCH_SIZE]
+            )
+            if not rows:
+                break
+            for paper_id, origin_content, markdown_content in rows:
+                Paper.objects.using(db_alias).filter(id=paper_id).update(
+                    origin_content=origin_content,
+                    markdown_content=markdown_content,
+                )
+        last_id = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    # Each batch commits on its own so the move does not hold one huge transaction
+    atomic = False
+
+    dependencies = [
+        ('papers_db', '0011_papercontent'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_content_to_side_table, move_content_back_to_papers),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:28
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('papers_db', '0012_move_paper_content'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='paper',
+            name='markdown_content',
+        ),
+        migrations.RemoveField(
+            model_name='paper',
+            name='origin_content',
+        ),
+    ]
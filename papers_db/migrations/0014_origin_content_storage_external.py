@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def set_origin_content_storage_external(apps, schema_editor):
+    """
+    Store PDF bytes uncompressed out-of-line in PostgreSQL TOAST.
+    PDFs barely compress, and EXTERNAL lets substring() fetch only the TOAST
+    chunks of the requested range instead of decompressing the whole value.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('ALTER TABLE paper_contents ALTER COLUMN origin_content SET STORAGE EXTERNAL')
+
+
+def reset_origin_content_storage(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('ALTER TABLE paper_contents ALTER COLUMN origin_content SET STORAGE EXTENDED')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('papers_db', '0013_remove_paper_content_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(set_origin_content_storage_external, reset_origin_content_storage),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:30
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, transaction
+
+# Papers backfilled per transaction
+BATCH_SIZE = 500
+
+
+def create_search_vector_index(apps, schema_editor):
+    """GIN index only exists on PostgreSQL - SQLite test databases skip it"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE INDEX IF NOT EXISTS papers_search_vector_gin ON papers USING gin (search_vector)')
+
+
+def drop_search_vector_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS papers_search_vector_gin')
+
+
+def backfill_search_vector(apps, schema_editor):
+    """Compute search_vector for existing papers, batch by batch"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Paper = apps.get_model('papers_db', 'Paper')
+    db_alias = schema_editor.connection.alias
+    search_vector = (
+        SearchVector('title', weight='A', config='english') +
+        SearchVector('keywords', weight='B', config='english') +
+        SearchVector('authors', weight='C', config='english') +
+        SearchVector('abstract', weight='D', config='english')
+    )
+
+    last_id = 0
+    while True:
+        ids = list(
+            Paper.objects.using(db_alias)
+            .filter(id__gt=last_id)
+            .order_by('id')
+            .values_list('id', flat=True)[:BATCH_SIZE]
+        )
+        if not ids:
+            break
+        with transaction.atomic(using=db_alias):
+            Paper.objects.using(db_alias).filter(id__in=ids).update(search_vector=search_vector)
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('papers_db', '0014_origin_content_storage_external'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paper',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, help_text='Weighted full-text search vector (title > keywords > authors > abstract)', null=True),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='paper',
+                    index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='papers_search_vector_gin'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(create_search_vector_index, drop_search_vector_index),
+            ],
+        ),
+        migrations.RunPython(backfill_search_vector, migrations.RunPython.noop),
+    ]
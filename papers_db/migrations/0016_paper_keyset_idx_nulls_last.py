@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:26
+
+from django.db import migrations, models
+
+
+def create_keyset_index(apps, schema_editor):
+    """NULLS LAST in an index only exists on PostgreSQL - SQLite test databases skip it"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS papers_active_keyset_idx ON papers (year DESC NULLS LAST, title, id) WHERE is_active'
+    )
+
+
+def drop_keyset_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS papers_active_keyset_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('papers_db', '0015_paper_search_vector'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='paper',
+            name='papers_active_keyset_idx',
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='paper',
+                    index=models.Index(models.OrderBy(models.F('year'), descending=True, nulls_last=True), models.F('title'), models.F('id'), condition=models.Q(('is_active', True)), name='papers_active_keyset_idx'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(create_keyset_index, drop_keyset_index),
+            ],
+        ),
+    ]
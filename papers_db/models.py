@@ -1,9 +1,37 @@
-from django.db import models
+from django.db import models, connection
 from django.core.validators import URLValidator
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.utils import timezone
 import hashlib
 
 
+# Full-text search configuration (PostgreSQL only)
+PAPER_SEARCH_CONFIG = 'english'
+PAPER_SEARCH_FIELDS = ('title', 'keywords', 'authors', 'abstract')
+
+# Weighted search vector: title > keywords > authors > abstract
+PAPER_SEARCH_VECTOR = (
+    SearchVector('title', weight='A', config=PAPER_SEARCH_CONFIG) +
+    SearchVector('keywords', weight='B', config=PAPER_SEARCH_CONFIG) +
+    SearchVector('authors', weight='C', config=PAPER_SEARCH_CONFIG) +
+    SearchVector('abstract', weight='D', config=PAPER_SEARCH_CONFIG)
+)
+
+
+# Content fields stored in PaperContent and the Paper field holding their MD5
+CONTENT_FILEMD5_FIELDS = {
+    'origin_content': 'origin_filemd5',
+    'markdown_content': 'markdown_filemd5',
+}
+
+
+def update_search_vector(queryset):
+    """Recompute search_vector for the given papers, no-op outside PostgreSQL"""
+    if connection.vendor != 'postgresql':
+        return 0
+    return queryset.update(search_vector=PAPER_SEARCH_VECTOR)
+
 
 class Paper(models.Model):
     """
@@ -89,13 +117,6 @@ class Paper(models.Model):
         help_text="MD5 hash of the PDF file"
     )
     
-    # File storage - for PostgreSQL binary storage
-    origin_content = models.BinaryField(
-        blank=True,
-        null=True,
-        help_text="PDF file binary content stored in PostgreSQL"
-    )
-
     origin_filelink = models.URLField(
         blank=True,
         null=True,
@@ -118,12 +139,6 @@ class Paper(models.Model):
         help_text="MD5 hash of the Markdown file"
     )
     
-    markdown_content = models.BinaryField(
-        blank=True,
-        null=True,
-        help_text="Markdown file binary content stored in PostgreSQL"
-    )
-
     fastgpt_collectionId = models.CharField(
         max_length=100,
         blank=True,
@@ -161,6 +176,14 @@ class Paper(models.Model):
         help_text="Comma-separated tags for organization"
     )
     
+    # Full-text search - maintained by save() on PostgreSQL
+    search_vector = SearchVectorField(
+        blank=True,
+        null=True,
+        editable=False,
+        help_text="Weighted full-text search vector (title > keywords > authors > abstract)"
+    )
+    
     class Meta:
         db_table = 'papers'
         verbose_name = 'Paper'
@@ -174,6 +197,12 @@ class Paper(models.Model):
             models.Index(fields=['origin_filemd5']),
             models.Index(fields=['is_active']),
             models.Index(fields=['origin_filemd5', 'is_active']),  # For deduplication queries
+            models.Index(
+                models.F('year').desc(nulls_last=True), models.F('title'), models.F('id'),
+                name='papers_active_keyset_idx',
+                condition=models.Q(is_active=True),
+            ),  # For keyset pagination of active papers, NULL years last
+            GinIndex(fields=['search_vector'], name='papers_search_vector_gin'),  # For full-text search
         ]
     
     def __str__(self):
@@ -193,8 +222,53 @@ class Paper(models.Model):
         return [keyword.strip() for keyword in str(self.keywords).split(',')]
     
     def has_files(self):
-        """Check if the paper has associated files."""
-        return bool(self.origin_content or self.markdown_content)
+        """Check if the paper has associated files (without loading them)."""
+        return bool(self.origin_filemd5 or self.markdown_filemd5)
+    
+    # File storage - bytes live in PaperContent, loaded per column on first access
+    def _get_content_field(self, field_name):
+        """Return pending bytes if set, otherwise load the column from PaperContent once"""
+        pending = self.__dict__.get('_pending_content', {})
+        if field_name in pending:
+            return pending[field_name]
+        
+        loaded = self.__dict__.setdefault('_loaded_content', {})
+        if field_name not in loaded:
+            if self.pk is None:
+                loaded[field_name] = None
+            else:
+                loaded[field_name] = PaperContent.objects.filter(paper_id=self.pk).values_list(field_name, flat=True).first()
+        return loaded[field_name]
+    
+    def _set_content_field(self, field_name, value, filemd5=None):
+        """Stage bytes to be written to PaperContent on the next save()"""
+        self.__dict__.setdefault('_pending_content', {})[field_name] = value
+        pending_filemd5 = self.__dict__.setdefault('_pending_filemd5', {})
+        if filemd5:
+            pending_filemd5[field_name] = filemd5
+        else:
+            pending_filemd5.pop(field_name, None)
+    
+    def set_file_content(self, field_name, content, filemd5=None):
+        """
+        Stage file bytes with an already known MD5 (e.g. hashed while reading the upload)
+        so save() does not hash the same bytes a second time
+        """
+        if field_name not in CONTENT_FILEMD5_FIELDS:
+            raise ValueError(f"Unknown content field: {field_name}")
+        self._set_content_field(field_name, content, filemd5)
+    
+    origin_content = property(
+        lambda self: self._get_content_field('origin_content'),
+        lambda self, value: self._set_content_field('origin_content', value),
+        doc="PDF file binary content (stored in PaperContent)"
+    )
+    
+    markdown_content = property(
+        lambda self: self._get_content_field('markdown_content'),
+        lambda self, value: self._set_content_field('markdown_content', value),
+        doc="Markdown file binary content (stored in PaperContent)"
+    )
     
     @property
     def short_title(self):
@@ -219,12 +293,61 @@ class Paper(models.Model):
         if self.year is None:
             self.year = 2025
             
-        # 自动计算原始文件的MD5
-        if self.origin_content:
-            self.origin_filemd5 = self._calculate_md5(self.origin_content)
+        pending_content = self.__dict__.get('_pending_content', {})
+        pending_filemd5 = self.__dict__.get('_pending_filemd5', {})
         
-        # 自动计算Markdown MD5  
-        if self.markdown_content:
-            self.markdown_filemd5 = self._calculate_md5(self.markdown_content)
+        # 自动计算原始文件和Markdown的MD5 (已知MD5时不重复计算)
+        for field_name, filemd5_field in CONTENT_FILEMD5_FIELDS.items():
+            if pending_content.get(field_name):
+                filemd5 = pending_filemd5.get(field_name) or self._calculate_md5(pending_content[field_name])
+                setattr(self, filemd5_field, filemd5)
             
         super().save(*args, **kwargs)
+        
+        # 更新全文检索向量(仅在检索字段可能变化时)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or set(update_fields) & set(PAPER_SEARCH_FIELDS):
+            update_search_vector(Paper.objects.filter(pk=self.pk))
+        
+        # 文件内容写入PaperContent副表
+        if pending_content:
+            PaperContent.objects.update_or_create(paper=self, defaults=pending_content)
+            self.__dict__.setdefault('_loaded_content', {}).update(pending_content)
+            self.__dict__['_pending_content'] = {}
+            self.__dict__['_pending_filemd5'] = {}
+
+
+class PaperContent(models.Model):
+    """
+    Heavy file content of a Paper (PDF and Markdown bytes).
+    Kept in a one-to-one side table so metadata queries on papers never touch the blobs.
+    """
+
+    paper = models.OneToOneField(
+        Paper,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='content',
+        help_text="Paper this content belongs to"
+    )
+
+    origin_content = models.BinaryField(
+        blank=True,
+        null=True,
+        help_text="PDF file binary content stored in PostgreSQL"
+    )
+
+    markdown_content = models.BinaryField(
+        blank=True,
+        null=True,
+        help_text="Markdown file binary content stored in PostgreSQL"
+    )
+
+    class Meta:
+        db_table = 'paper_contents'
+        verbose_name = 'Paper Content'
+        verbose_name_plural = 'Paper Contents'
+
+    def __str__(self):
+        """String representation of the paper content."""
+        return f"Content of paper {self.paper_id}"
@@ -1,15 +1,24 @@
 from ninja import ModelSchema, Schema
 from django.core.files.uploadedfile import UploadedFile
 from .models import Paper
-from typing import Optional
+from typing import Optional, List, Dict
 
 
 class PaperOut(ModelSchema):
-    """输出Paper数据 - 不包含文件内容"""
+    """输出Paper数据 - 不包含文件内容(文件内容在PaperContent)"""
+    # year 可以为NULL(批量导入/更新)，模型默认值会让ninja生成非空int
+    year: Optional[int] = None
+
     class Meta:
         model = Paper
         fields = "__all__"
-        exclude = ["origin_content", "markdown_content", "abstract"] 
+        exclude = ["abstract", "search_vector"] 
+
+
+class PaperPageOut(Schema):
+    """输出Paper分页数据 - next_cursor为None表示最后一页"""
+    items: List[PaperOut]
+    next_cursor: Optional[str] = None
 
 
 class PaperIn(ModelSchema):
@@ -17,7 +26,7 @@ class PaperIn(ModelSchema):
     class Meta:
         model = Paper
         fields = "__all__"
-        exclude = ["origin_content", "origin_filename", "markdown_filename", "markdown_content", "id", "created_at", "updated_at"] 
+        exclude = ["origin_filename", "markdown_filename", "id", "created_at", "updated_at", "search_vector"] 
 
 
 class PaperFileUpload(ModelSchema):
@@ -25,4 +34,39 @@ class PaperFileUpload(ModelSchema):
     class Meta:
         model = Paper
         fields = "__all__"
-        exclude = ["origin_content", "markdown_content", "id", "created_at", "updated_at"]
\ No newline at end of file
+        exclude = ["id", "created_at", "updated_at", "search_vector"]
+
+
+class PaperBulkItemResult(Schema):
+    """批量创建Paper - 单条结果 (status: created / skipped / error)"""
+    index: int
+    status: str
+    id: Optional[int] = None
+    origin_filemd5: Optional[str] = None
+    error: Optional[str] = None
+
+
+class PaperBulkOut(Schema):
+    """批量创建Paper - 汇总结果"""
+    created: int
+    skipped: int
+    failed: int
+    deactivated: int
+    results: List[PaperBulkItemResult]
+
+
+class PaperMd5LookupIn(Schema):
+    """按PDF MD5批量查询已存在的Paper"""
+    md5s: List[str]
+
+
+class PaperMd5Hit(Schema):
+    """已存在且有效的Paper"""
+    paper_id: int
+    fastgpt_collectionId: Optional[str] = None
+
+
+class PaperMd5LookupOut(Schema):
+    """按PDF MD5批量查询结果 - found按md5索引, missing为未存储的md5"""
+    found: Dict[str, PaperMd5Hit]
+    missing: List[str]
@@ -48,9 +48,10 @@ class PaperAPITest(TestCase):
         data = response.json() # type: ignore
         print(f"Response: {json.dumps(data, indent=2, ensure_ascii=False)}")
         
-        self.assertIsInstance(data, list)
-        self.assertEqual(len(data), 1)
-        self.assertEqual(data[0]['title'], 'Test Paper')
+        self.assertIsInstance(data['items'], list)
+        self.assertEqual(len(data['items']), 1)
+        self.assertEqual(data['items'][0]['title'], 'Test Paper')
+        self.assertIsNone(data['next_cursor'])
     
     def test_create_paper_json(self):
         """Test creating paper with JSON metadata only"""
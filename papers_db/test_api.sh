@@ -5,7 +5,9 @@ curl -X GET http://localhost:8000/api/papers
 
 curl -X GET https://ai4s-papers-service.deepmd.us/api/papers
 
-curl -X GET https://ai4s-papers-service.deepmd.us/api/papers
+# test get papers page by page (pass next_cursor of previous page as cursor)
+curl -X GET "http://localhost:8000/api/papers?limit=50&primary_domain=deepmd&year=2024"
+curl -X GET "http://localhost:8000/api/papers?limit=50&cursor=<next_cursor>"
 
 # curl -X POST https://ai4s-papers-service.deepmd.us/v1/file/list -H "Content-Type: application/json" -d '{}'
 
@@ -28,6 +30,19 @@ curl -X POST http://localhost:8000/api/papers/upload \
   -F "origin_file=@test_DeePMD-kit.pdf" \
   -F "markdown_file=@test_DeePMD-kit.md"
 
+# test bulk create papers (NDJSON metadata, one paper per line)
+printf '%s\n' \
+  '{"title": "bulk 1", "authors": "test", "year": 2024, "primary_domain": "test"}' \
+  '{"title": "bulk 2", "authors": "test", "year": 2023, "primary_domain": "test"}' \
+  | curl -X POST http://localhost:8000/api/papers/bulk \
+  -H "Content-Type: application/x-ndjson" --data-binary @-
+
+# test bulk create papers with files (items name their multipart file fields)
+curl -X POST http://localhost:8000/api/papers/bulk \
+  -F 'papers={"title": "bulk file 1", "authors": "test", "primary_domain": "test", "origin_file": "pdf_0", "markdown_file": "md_0"}' \
+  -F "pdf_0=@test_DeePMD-kit.pdf" \
+  -F "md_0=@test_DeePMD-kit.md"
+
 curl -X POST localhost:8000/api/fastgpt/v1/file/list \
   -H "Content-Type: application/json" -d '{}'
 
@@ -1,7 +1,12 @@
 from django.test import TestCase, Client
 from django.urls import reverse
+from django.core.files.uploadedfile import SimpleUploadedFile
+from unittest.mock import patch
+import hashlib
 import json
-from .models import Paper
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from .models import Paper, PaperContent
 from .schemas import PaperOut
 
 class PaperAPITest(TestCase):
@@ -72,13 +77,275 @@ class PaperAPITest(TestCase):
         # verify the created paper can be found
         list_response = self.client.get('/api/papers')
         self.assertEqual(list_response.status_code, 200) # type: ignore
-        papers = list_response.json() # type: ignore
+        papers = list_response.json()['items'] # type: ignore
         
         # search the created paper by test_domain
         found_paper = next((p for p in papers if p['primary_domain'] == 'test_domain'), None)
         self.assertIsNotNone(found_paper, "Cannot find created paper with test_domain")
         self.assertEqual(found_paper['authors'], self.test_paper.authors) # type: ignore
     
+    def test_list_papers_keyset_pagination(self):
+        """walk all pages with next_cursor, no paper missed or repeated"""
+        for i in range(4):
+            Paper.objects.create( # type: ignore
+                title=f"Paginated Paper {i}",
+                authors="Dr. Page",
+                year=2023 if i % 2 else 2025,
+                primary_domain="test_domain",
+            )
+        
+        seen_ids = []
+        cursor = None
+        while True:
+            params = {'limit': 2}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get('/api/papers', params)
+            self.assertEqual(response.status_code, 200) # type: ignore
+            page = response.json() # type: ignore
+            self.assertLessEqual(len(page['items']), 2)
+            seen_ids.extend(p['id'] for p in page['items'])
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        
+        expected_ids = list(Paper.objects.filter(is_active=True) # type: ignore
+                            .order_by('-year', 'title', 'id').values_list('id', flat=True))
+        self.assertEqual(seen_ids, expected_ids)
+    
+    def test_list_papers_keyset_pagination_null_years(self):
+        """papers without a year come last and are paged like the others, cursors from them work"""
+        for i in range(5):
+            Paper.objects.create( # type: ignore
+                title=f"Undated Paper {i}",
+                authors="Dr. Null",
+                primary_domain="test_domain",
+            )
+        # save() defaults the year, bulk ingest and updates can still store NULL
+        Paper.objects.filter(title__startswith="Undated Paper").update(year=None) # type: ignore
+        Paper.objects.create(title="Dated Paper", authors="Dr. Page", year=2020, primary_domain="test_domain") # type: ignore
+        
+        seen_titles = []
+        cursor = None
+        while True:
+            params = {'limit': 2}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get('/api/papers', params)
+            self.assertEqual(response.status_code, 200) # type: ignore
+            page = response.json() # type: ignore
+            seen_titles.extend(p['title'] for p in page['items'])
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        
+        self.assertEqual(seen_titles, [self.test_paper.title, "Dated Paper"] + [f"Undated Paper {i}" for i in range(5)])
+    
+    def test_list_papers_filters(self):
+        """filter papers by primary_domain and year"""
+        Paper.objects.create( # type: ignore
+            title="Other Domain Paper",
+            authors="Dr. Other",
+            year=2020,
+            primary_domain="abacus",
+        )
+        
+        response = self.client.get('/api/papers', {'primary_domain': 'abacus'})
+        titles = [p['title'] for p in response.json()['items']] # type: ignore
+        self.assertEqual(titles, ["Other Domain Paper"])
+        
+        response = self.client.get('/api/papers', {'year': 2024})
+        titles = [p['title'] for p in response.json()['items']] # type: ignore
+        self.assertEqual(titles, [self.test_paper.title])
+    
+    def test_list_papers_invalid_cursor(self):
+        """malformed cursor returns 400"""
+        response = self.client.get('/api/papers', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400) # type: ignore
+    
+    def test_paper_content_side_table(self):
+        """file bytes are stored in PaperContent and never queried by the listing"""
+        paper = Paper.objects.create( # type: ignore
+            title="Paper With Files",
+            authors="Dr. Bytes",
+            year=2024,
+            primary_domain="test_domain",
+            origin_content=b"%PDF-1.4 fake",
+            markdown_content=b"# Paper With Files",
+        )
+        
+        content = PaperContent.objects.get(paper_id=paper.id) # type: ignore
+        self.assertEqual(bytes(content.origin_content), b"%PDF-1.4 fake")
+        self.assertIsNotNone(paper.origin_filemd5)
+        self.assertTrue(paper.has_files())
+        
+        fresh = Paper.objects.get(id=paper.id) # type: ignore
+        self.assertEqual(bytes(fresh.markdown_content), b"# Paper With Files")
+        
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/papers')
+        self.assertEqual(response.status_code, 200) # type: ignore
+        self.assertFalse(any('paper_contents' in q['sql'] for q in ctx.captured_queries))
+    
+    def test_create_paper_multipart_hashes_once(self):
+        """multipart upload is hashed while read, save() does not hash again"""
+        pdf_bytes = b"%PDF-1.4 " + b"x" * 200000
+        md_bytes = b"# Uploaded Paper"
+        
+        with patch.object(Paper, '_calculate_md5') as mock_calculate_md5:
+            response = self.client.post('/api/papers', {
+                'title': "Uploaded Paper",
+                'authors': "Dr. Upload",
+                'year': 2024,
+                'primary_domain': "test_domain",
+                'origin_file': SimpleUploadedFile("upload.pdf", pdf_bytes, content_type="application/pdf"),
+                'markdown_file': SimpleUploadedFile("upload.md", md_bytes, content_type="text/markdown"),
+            })
+        self.assertEqual(response.status_code, 200) # type: ignore
+        mock_calculate_md5.assert_not_called()
+        
+        paper = Paper.objects.get(id=response.json()['id']) # type: ignore
+        self.assertEqual(paper.origin_filemd5, hashlib.md5(pdf_bytes).hexdigest())
+        self.assertEqual(paper.markdown_filemd5, hashlib.md5(md_bytes).hexdigest())
+        self.assertEqual(bytes(paper.origin_content), pdf_bytes)
+        self.assertEqual(paper.origin_filename, "upload.pdf")
+    
+    def test_create_papers_bulk_ndjson(self):
+        """bulk ingest NDJSON metadata, invalid items reported per line"""
+        lines = [
+            json.dumps({'title': "Bulk Paper 1", 'authors': "Dr. Bulk", 'primary_domain': "test_domain", 'year': 2021}),
+            json.dumps({'title': "Bulk Paper 2", 'authors': "Dr. Bulk", 'primary_domain': "test_domain"}),
+            json.dumps({'title': "Missing Authors", 'primary_domain': "test_domain"}),
+            "not json",
+        ]
+        response = self.client.post('/api/papers/bulk', "\n".join(lines), content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200) # type: ignore
+        
+        data = response.json() # type: ignore
+        self.assertEqual((data['created'], data['failed']), (2, 2))
+        self.assertEqual([r['status'] for r in data['results']], ['created', 'created', 'error', 'error'])
+        
+        paper = Paper.objects.get(id=data['results'][1]['id']) # type: ignore
+        self.assertEqual(paper.title, "Bulk Paper 2")
+        self.assertEqual(paper.year, 2025)
+    
+    def test_create_papers_bulk_multipart_dedup(self):
+        """bulk ingest files: batch and stored duplicates resolved together"""
+        pdf_bytes = b"%PDF-1.4 bulk duplicate"
+        existing = Paper.objects.create( # type: ignore
+            title="Existing Copy",
+            authors="Dr. Old",
+            primary_domain="test_domain",
+            origin_content=pdf_bytes,
+        )
+        
+        metadata = [
+            {'title': "First Copy", 'authors': "Dr. A", 'primary_domain': "test_domain", 'origin_file': "file_0"},
+            {'title': "Second Copy", 'authors': "Dr. B", 'primary_domain': "test_domain",
+             'origin_file': "file_1", 'markdown_file': "md_1"},
+            {'title': "Other Paper", 'authors': "Dr. C", 'primary_domain': "test_domain", 'origin_file': "file_2"},
+        ]
+        response = self.client.post('/api/papers/bulk', {
+            'papers': "\n".join(json.dumps(m) for m in metadata),
+            'file_0': SimpleUploadedFile("a.pdf", pdf_bytes, content_type="application/pdf"),
+            'file_1': SimpleUploadedFile("b.pdf", pdf_bytes, content_type="application/pdf"),
+            'md_1': SimpleUploadedFile("b.md", b"# Second Copy", content_type="text/markdown"),
+            'file_2': SimpleUploadedFile("c.pdf", b"%PDF-1.4 other", content_type="application/pdf"),
+        })
+        self.assertEqual(response.status_code, 200) # type: ignore
+        
+        data = response.json() # type: ignore
+        self.assertEqual([r['status'] for r in data['results']], ['skipped', 'created', 'created'])
+        self.assertEqual(data['deactivated'], 1)
+        
+        existing.refresh_from_db()
+        self.assertFalse(existing.is_active)
+        
+        second = Paper.objects.get(id=data['results'][1]['id']) # type: ignore
+        self.assertTrue(second.is_active)
+        self.assertEqual(second.origin_filemd5, hashlib.md5(pdf_bytes).hexdigest())
+        self.assertEqual(bytes(second.markdown_content), b"# Second Copy")
+        self.assertEqual(second.origin_filename, "b.pdf")
+    
+    @patch('papers_db.api.PAPERS_BULK_INSERT_BATCH', 2)
+    def test_create_papers_bulk_multipart_batched_insert(self):
+        """bulk ingest files: rows and bytes are inserted in batches of PAPERS_BULK_INSERT_BATCH"""
+        metadata = [
+            {'title': f"Batched {i}", 'authors': "Dr. Batch", 'primary_domain': "test_domain", 'origin_file': f"file_{i}"}
+            for i in range(5)
+        ]
+        files = {
+            f"file_{i}": SimpleUploadedFile(f"{i}.pdf", f"%PDF-1.4 batched {i}".encode(), content_type="application/pdf")
+            for i in range(5)
+        }
+        with patch('papers_db.api.PaperContent.objects.bulk_create', wraps=PaperContent.objects.bulk_create) as bulk_create, \
+                patch('papers_db.api.hashlib.md5', wraps=hashlib.md5) as md5:
+            response = self.client.post('/api/papers/bulk', {'papers': "\n".join(json.dumps(m) for m in metadata), **files})
+        self.assertEqual(response.status_code, 200) # type: ignore
+        
+        data = response.json() # type: ignore
+        self.assertEqual(data['created'], 5)
+        self.assertEqual([len(call.args[0]) for call in bulk_create.call_args_list], [2, 2, 1])
+        # each file hashed once
+        self.assertEqual(md5.call_count, 5)
+        paper = Paper.objects.get(id=data['results'][4]['id']) # type: ignore
+        self.assertEqual(bytes(paper.origin_content), b"%PDF-1.4 batched 4")
+        self.assertEqual(paper.origin_filemd5, hashlib.md5(b"%PDF-1.4 batched 4").hexdigest())
+    
+    @patch('papers_db.api.PAPERS_BULK_MAX_UPLOAD_BYTES', 10)
+    def test_create_papers_bulk_upload_too_large(self):
+        """bulk ingest files: total upload size over the limit is rejected with 413"""
+        metadata = {'title': "Too Large", 'authors': "Dr. Big", 'primary_domain': "test_domain", 'origin_file': "file_0"}
+        response = self.client.post('/api/papers/bulk', {
+            'papers': json.dumps(metadata),
+            'file_0': SimpleUploadedFile("big.pdf", b"%PDF-1.4 more than ten bytes", content_type="application/pdf"),
+        })
+        self.assertEqual(response.status_code, 413) # type: ignore
+        self.assertFalse(Paper.objects.filter(title="Too Large").exists()) # type: ignore
+    
+    @patch('papers_db.api.PAPERS_BULK_MAX_UPLOAD_BYTES', 20)
+    def test_create_papers_bulk_repeated_field_counts_every_file(self):
+        """bulk ingest files: files sharing a field name all count towards the upload limit"""
+        metadata = {'title': "Repeated Field", 'authors': "Dr. Many", 'primary_domain': "test_domain", 'origin_file': "file_0"}
+        response = self.client.post('/api/papers/bulk', {
+            'papers': json.dumps(metadata),
+            'file_0': [
+                SimpleUploadedFile(f"{i}.pdf", b"%PDF-1.4 twelve", content_type="application/pdf")
+                for i in range(3)
+            ],
+        })
+        self.assertEqual(response.status_code, 413) # type: ignore
+        self.assertFalse(Paper.objects.filter(title="Repeated Field").exists()) # type: ignore
+    
+    def test_lookup_papers_by_md5(self):
+        """batch md5 lookup returns active papers only"""
+        active = Paper.objects.create( # type: ignore
+            title="Stored Paper",
+            authors="Dr. Hash",
+            primary_domain="test_domain",
+            origin_content=b"%PDF-1.4 stored",
+            fastgpt_collectionId="collection-1",
+        )
+        inactive = Paper.objects.create( # type: ignore
+            title="Old Paper",
+            authors="Dr. Hash",
+            primary_domain="test_domain",
+            origin_content=b"%PDF-1.4 old",
+            is_active=False,
+        )
+        unknown_md5 = "0" * 32
+        
+        response = self.client.post('/api/papers/lookup-md5',
+            json.dumps({'md5s': [active.origin_filemd5, inactive.origin_filemd5, unknown_md5]}),
+            content_type='application/json')
+        self.assertEqual(response.status_code, 200) # type: ignore
+        
+        data = response.json() # type: ignore
+        self.assertEqual(data['found'], {
+            active.origin_filemd5: {'paper_id': active.id, 'fastgpt_collectionId': "collection-1"}
+        })
+        self.assertEqual(sorted(data['missing']), sorted([inactive.origin_filemd5, unknown_md5]))
+    
     # def test_get_empty_papers_list(self):
     #     """get papers list when database is empty"""
     #     response = self.client.get('/api/papers')
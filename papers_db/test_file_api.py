@@ -209,4 +209,87 @@ class FileAPITest(TestCase):
         
         print(f"Status Code: {response.status_code}") # type: ignore
         # Should return 404 or 500, Django will handle the error
-        self.assertNotEqual(response.status_code, 200) # type: ignore 
\ No newline at end of file
+        self.assertNotEqual(response.status_code, 200) # type: ignore 
+    
+    def test_serve_pdf_full_and_etag(self):
+        """Test streaming full PDF with ETag and conditional GET"""
+        print("\n=== Test: Serve PDF (Full + ETag) ===")
+        
+        pdf_bytes = b"%PDF-1.4 " + bytes(range(256)) * 8
+        paper = Paper.objects.create( # type: ignore
+            title="PDF Serve Paper",
+            authors="Author PDF",
+            year=2024,
+            primary_domain="test",
+            origin_filename="serve.pdf",
+            origin_content=pdf_bytes
+        )
+        
+        response = self.client.get(f'/api/fastgpt/pdf/{paper.id}')
+        self.assertEqual(response.status_code, 200) # type: ignore
+        self.assertEqual(b''.join(response.streaming_content), pdf_bytes) # type: ignore
+        self.assertEqual(response['Accept-Ranges'], 'bytes') # type: ignore
+        self.assertEqual(response['ETag'], f'"{paper.origin_filemd5}"') # type: ignore
+        self.assertEqual(response['Content-Length'], str(len(pdf_bytes))) # type: ignore
+        
+        response = self.client.get(f'/api/fastgpt/pdf/{paper.id}', HTTP_IF_NONE_MATCH=f'"{paper.origin_filemd5}"')
+        self.assertEqual(response.status_code, 304) # type: ignore
+        
+        last_modified = self.client.get(f'/api/fastgpt/pdf/{paper.id}')['Last-Modified'] # type: ignore
+        response = self.client.get(f'/api/fastgpt/pdf/{paper.id}', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304) # type: ignore
+    
+    def test_serve_pdf_ranges(self):
+        """Test single, multi and unsatisfiable Range requests"""
+        print("\n=== Test: Serve PDF (Range) ===")
+        
+        pdf_bytes = bytes(range(256)) * 4
+        paper = Paper.objects.create( # type: ignore
+            title="PDF Range Paper",
+            authors="Author Range",
+            year=2024,
+            primary_domain="test",
+            origin_content=pdf_bytes
+        )
+        url = f'/api/fastgpt/pdf/{paper.id}'
+        
+        response = self.client.get(url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206) # type: ignore
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(pdf_bytes)}') # type: ignore
+        self.assertEqual(b''.join(response.streaming_content), pdf_bytes[10:20]) # type: ignore
+        
+        response = self.client.get(url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), pdf_bytes[-5:]) # type: ignore
+        
+        response = self.client.get(url, HTTP_RANGE='bytes=0-3,100-103')
+        self.assertEqual(response.status_code, 206) # type: ignore
+        self.assertTrue(response['Content-Type'].startswith('multipart/byteranges')) # type: ignore
+        body = b''.join(response.streaming_content) # type: ignore
+        self.assertEqual(len(body), int(response['Content-Length'])) # type: ignore
+        self.assertIn(pdf_bytes[0:4], body)
+        self.assertIn(pdf_bytes[100:104], body)
+        
+        response = self.client.get(url, HTTP_RANGE=f'bytes={len(pdf_bytes) + 10}-')
+        self.assertEqual(response.status_code, 416) # type: ignore
+        
+        # stale If-Range falls back to the full file
+        response = self.client.get(url, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE='"stale-etag"')
+        self.assertEqual(response.status_code, 200) # type: ignore
+    
+    def test_search_papers_fallback(self):
+        """Test searchKey on non-PostgreSQL databases falls back to icontains"""
+        print("\n=== Test: Search Papers (Fallback) ===")
+        
+        response = self.client.post('/api/fastgpt/v1/file/list',
+                                  json.dumps({"parentId": "abacus/", "searchKey": "first-principles"}),
+                                  content_type='application/json')
+        self.assertEqual(response.status_code, 200) # type: ignore
+        
+        files = response.json()['data'] # type: ignore
+        self.assertEqual(len(files), 1)
+        self.assertIn('ABACUS Test Paper', files[0]['name'])
+        
+        response = self.client.post('/api/fastgpt/v1/file/list',
+                                  json.dumps({"parentId": "abacus/", "searchKey": "no-such-keyword"}),
+                                  content_type='application/json')
+        self.assertEqual(response.json()['data'], []) # type: ignore
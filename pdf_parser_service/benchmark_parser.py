@@ -0,0 +1,106 @@
+"""
+Per-request overhead benchmark for the PDF parser, runs locally on CPU
+
+Compares the old behaviour (build the converter / load models inside every
+request) with the resident PdfEngines used by PdfParserService (load once,
+reuse). Needs marker-pdf and/or docling installed locally; no Modal account.
+
+With --batch-size N it also compares N sequential marker parses against one
+PdfEngines.parse_batch_with_marker call (the MarkerBatchParser micro-batch path).
+
+Usage:
+    python benchmark_parser.py test.pdf --engines marker docling --requests 3
+    python benchmark_parser.py test.pdf --batch-size 4
+"""
+import argparse
+import os
+import statistics
+import time
+
+# 默认在CPU上运行，必须在导入marker/torch之前设置
+os.environ.setdefault("TORCH_DEVICE", "cpu")
+
+from pdf_parser import PdfEngines
+
+PARSE_METHODS = {
+    "marker": "parse_with_marker",
+    "docling": "parse_with_docling",
+}
+
+
+def run_per_request_load(engine: str, pdf_data: bytes, filename: str, requests: int) -> list:
+    """Old behaviour: every request loads its own models"""
+    timings = []
+    for _ in range(requests):
+        start_time = time.time()
+        engines = PdfEngines(engines=(engine,))
+        getattr(engines, PARSE_METHODS[engine])(pdf_data, filename)
+        timings.append(time.time() - start_time)
+    return timings
+
+
+def run_resident(engine: str, pdf_data: bytes, filename: str, requests: int) -> tuple:
+    """New behaviour: load once, then reuse for every request"""
+    start_time = time.time()
+    engines = PdfEngines(engines=(engine,))
+    load_seconds = time.time() - start_time
+
+    timings = []
+    for _ in range(requests):
+        start_time = time.time()
+        getattr(engines, PARSE_METHODS[engine])(pdf_data, filename)
+        timings.append(time.time() - start_time)
+    return load_seconds, timings
+
+
+def run_batch_comparison(pdf_data: bytes, filename: str, batch_size: int) -> None:
+    """Sequential vs micro-batched marker parsing of batch_size copies of the PDF"""
+    engines = PdfEngines(engines=("marker",))
+    items = [(pdf_data, f"{i}_{filename}") for i in range(batch_size)]
+
+    start_time = time.time()
+    for item in items:
+        engines.parse_with_marker(*item)
+    sequential_seconds = time.time() - start_time
+
+    start_time = time.time()
+    results = engines.parse_batch_with_marker(items)
+    batched_seconds = time.time() - start_time
+
+    pages = results[0]["metadata"]["batch_pages"]
+    print(f"\n{'mode':<11} {'docs':>5} {'pages':>6} {'seconds':>8} {'pages/s':>8}")
+    print(f"{'sequential':<11} {batch_size:>5} {pages:>6} {sequential_seconds:>8.2f} {pages / sequential_seconds:>8.2f}")
+    print(f"{'batched':<11} {batch_size:>5} {pages:>6} {batched_seconds:>8.2f} {pages / batched_seconds:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-request model load overhead")
+    parser.add_argument("pdf", help="PDF file to parse")
+    parser.add_argument("--engines", nargs="+", default=["marker"], choices=list(PARSE_METHODS))
+    parser.add_argument("--requests", type=int, default=3, help="Requests per mode")
+    parser.add_argument("--batch-size", type=int, default=0, help="Also compare sequential vs batched marker parsing")
+    args = parser.parse_args()
+
+    with open(args.pdf, "rb") as f:
+        pdf_data = f.read()
+    filename = os.path.basename(args.pdf)
+    print(f"PDF: {filename} ({len(pdf_data):,} bytes), device={os.environ['TORCH_DEVICE']}, requests={args.requests}")
+
+    results = []
+    for engine in args.engines:
+        before = run_per_request_load(engine, pdf_data, filename, args.requests)
+        load_seconds, after = run_resident(engine, pdf_data, filename, args.requests)
+        results.append((engine, before, load_seconds, after))
+
+    print(f"\n{'engine':<8} {'before s/req':>13} {'after s/req':>12} {'overhead s/req':>15} {'one-time load s':>16}")
+    for engine, before, load_seconds, after in results:
+        before_mean = statistics.mean(before)
+        after_mean = statistics.mean(after)
+        print(f"{engine:<8} {before_mean:>13.2f} {after_mean:>12.2f} {before_mean - after_mean:>15.2f} {load_seconds:>16.2f}")
+
+    if args.batch_size:
+        run_batch_comparison(pdf_data, filename, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
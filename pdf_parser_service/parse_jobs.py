@@ -0,0 +1,210 @@
+"""
+Asynchronous PDF parse jobs
+
+submit() returns a job id at once; the parse runs in the background and the
+result is fetched by id or POSTed to callback URLs. Job ids are derived from
+the PDF md5 + engine + options, so resubmitting the same PDF returns the
+existing job (or its finished result) instead of parsing again. Jobs submitted
+by pdf_url are keyed by the URL and the worker downloads the PDF, so submitting
+never waits on the transfer.
+
+Job records live in any dict-like store (modal.Dict in the service, a plain
+dict in tests) and the background work is started by an injected launch
+function, so the whole flow runs locally against a stand-in parser.
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Callable, Optional
+from urllib.parse import urlparse
+
+import requests
+from fastapi import FastAPI, File, Form, UploadFile
+from fastapi.responses import JSONResponse
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_FINISHED = (JOB_SUCCEEDED, JOB_FAILED)
+
+# queued/running jobs older than this are assumed lost (worker crashed) and are relaunched
+JOB_STALE_SECONDS = 3600
+CALLBACK_TIMEOUT_SECONDS = 30
+
+
+def make_job_id(source_key: str, engine: str, options: dict) -> str:
+    """Idempotency key: same PDF (md5, or URL for pdf_url jobs), engine and options -> same job"""
+    key = "\x1f".join([source_key, engine, json.dumps(options, sort_keys=True)])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+class ParseJobs:
+    """
+    store:  dict-like, job_id -> job record, "result:<job_id>" -> parse result
+    launch: launch(job_id, pdf_data, filename, engine, options), starts run() in the background;
+            pdf_data is None for pdf_url jobs, run() downloads it
+    """
+
+    def __init__(self, store, launch: Callable):
+        self.store = store
+        self.launch = launch
+
+    def submit(self, pdf_data: bytes, filename: str, engine: str, options: Optional[dict] = None, callback_url: Optional[str] = None) -> dict:
+        pdf_md5 = hashlib.md5(pdf_data).hexdigest()
+        source = {"pdf_md5": pdf_md5, "pdf_url": None, "filename": filename}
+        return self._submit(pdf_md5, source, pdf_data, engine, options or {}, callback_url)
+
+    def submit_url(self, pdf_url: str, engine: str, options: Optional[dict] = None, callback_url: Optional[str] = None) -> dict:
+        """Like submit(), but the worker downloads the PDF; pdf_md5 is filled in once it has"""
+        # presigned URLs carry the signature in the query string
+        source = {"pdf_md5": None, "pdf_url": pdf_url, "filename": os.path.basename(urlparse(pdf_url).path)}
+        return self._submit(f"url:{pdf_url}", source, None, engine, options or {}, callback_url)
+
+    def _submit(self, source_key: str, source: dict, pdf_data: Optional[bytes], engine: str, options: dict, callback_url: Optional[str]) -> dict:
+        job_id = make_job_id(source_key, engine, options)
+
+        job = self.store.get(job_id)
+        if job and not self._needs_relaunch(job):
+            print(f"复用已有任务: {job_id=} status={job['status']}")
+            if callback_url:
+                if job["status"] in JOB_FINISHED:
+                    self._deliver_callback(job, callback_url)
+                elif callback_url not in job["callback_urls"]:
+                    job["callback_urls"].append(callback_url)
+                    self.store[job_id] = job
+            return {**job, "deduplicated": True}
+
+        job = {
+            "job_id": job_id,
+            "status": JOB_QUEUED,
+            **source,
+            "engine": engine,
+            "options": options,
+            "callback_urls": [callback_url] if callback_url else [],
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+        }
+        self.store[job_id] = job
+        self.launch(job_id, pdf_data, source["filename"], engine, options)
+        return {**job, "deduplicated": False}
+
+    def _needs_relaunch(self, job: dict) -> bool:
+        if job["status"] == JOB_FAILED:
+            return True
+        last_change = job["started_at"] or job["submitted_at"]
+        return job["status"] not in JOB_FINISHED and time.time() - last_change > JOB_STALE_SECONDS
+
+    def run(self, job_id: str, pdf_data: Optional[bytes], filename: str, engine: str, options: dict, parse: Callable, fetch: Optional[Callable] = None) -> dict:
+        """
+        Worker side: parse(pdf_data, filename, engine, options) -> result dict, then record it and call back
+        fetch(pdf_url, origin_content) -> (pdf_data, filename) downloads the PDF of pdf_url jobs
+        """
+        job = self.store[job_id]
+        job.update(status=JOB_RUNNING, started_at=time.time())
+        self.store[job_id] = job
+
+        pdf_md5 = job["pdf_md5"]
+        try:
+            if pdf_data is None:
+                try:
+                    pdf_data, filename = fetch(job["pdf_url"], None)
+                except Exception as e:
+                    raise RuntimeError(f"下载PDF失败: {str(e)}") from e
+                pdf_md5 = hashlib.md5(pdf_data).hexdigest()
+            result = parse(pdf_data, filename, engine, options)
+        except Exception as e:
+            result = {"success": False, "error": str(e), "markdown": f"# PDF解析失败\n\n{str(e)}"}
+
+        self.store[f"result:{job_id}"] = result
+        # 重新读取，提交期间可能追加了回调地址
+        job = self.store[job_id]
+        job.update(
+            pdf_md5=pdf_md5,
+            status=JOB_SUCCEEDED if result.get("success", True) else JOB_FAILED,
+            finished_at=time.time(),
+            error=result.get("error"),
+        )
+        self.store[job_id] = job
+        for callback_url in job["callback_urls"]:
+            self._deliver_callback(job, callback_url, result)
+        return result
+
+    def status(self, job_id: str) -> Optional[dict]:
+        return self.store.get(job_id)
+
+    def result(self, job_id: str) -> Optional[dict]:
+        """Parse result once the job has finished, else None"""
+        return self.store.get(f"result:{job_id}")
+
+    def wait(self, job_id: str, timeout: float, poll_interval: float = 1.0) -> Optional[dict]:
+        """Block until the job finishes (used by the synchronous endpoints)"""
+        deadline = time.time() + timeout
+        while True:
+            job = self.status(job_id)
+            if job and job["status"] in JOB_FINISHED:
+                return self.result(job_id)
+            if time.time() >= deadline:
+                return None
+            time.sleep(poll_interval)
+
+    def _deliver_callback(self, job: dict, callback_url: str, result: Optional[dict] = None) -> None:
+        if result is None:
+            result = self.result(job["job_id"])
+        payload = {"job_id": job["job_id"], "status": job["status"], "pdf_md5": job["pdf_md5"], "result": result}
+        try:
+            response = requests.post(callback_url, json=payload, timeout=CALLBACK_TIMEOUT_SECONDS)
+            response.raise_for_status()
+            print(f"回调成功: {callback_url=} {job['job_id']=}")
+        except Exception as e:
+            print(f"回调失败: {callback_url=} {job['job_id']=}: {e}")
+
+
+def create_jobs_app(jobs: ParseJobs) -> FastAPI:
+    """
+    POST /jobs                 submit (multipart file or pdf_url), returns the job at once
+    GET  /jobs/{job_id}        job status
+    GET  /jobs/{job_id}/result parse result; 202 while the job is still pending
+    """
+    api = FastAPI(title="PDF parse jobs")
+
+    @api.post("/jobs", status_code=202)
+    def submit_job(
+        file: Optional[UploadFile] = File(None),
+        pdf_url: Optional[str] = Form(None),
+        engine: str = Form("marker"),
+        shard_pages: int = Form(0),
+        fallback_engine: str = Form("marker"),
+        callback_url: Optional[str] = Form(None),
+    ):
+        options = {"shard_pages": shard_pages, "fallback_engine": fallback_engine}
+        if file is not None:
+            origin_content = file.file.read()
+            if not origin_content:
+                return JSONResponse({"success": False, "error": "文件内容为空"}, status_code=400)
+            return jobs.submit(origin_content, file.filename, engine, options, callback_url)
+        if pdf_url:
+            # 下载放在后台任务里，提交接口立即返回
+            return jobs.submit_url(pdf_url, engine, options, callback_url)
+        return JSONResponse({"success": False, "error": "需要file或pdf_url参数"}, status_code=400)
+
+    @api.get("/jobs/{job_id}")
+    def get_job(job_id: str):
+        job = jobs.status(job_id)
+        if job is None:
+            return JSONResponse({"success": False, "error": "任务不存在"}, status_code=404)
+        return job
+
+    @api.get("/jobs/{job_id}/result")
+    def get_job_result(job_id: str):
+        job = jobs.status(job_id)
+        if job is None:
+            return JSONResponse({"success": False, "error": "任务不存在"}, status_code=404)
+        if job["status"] not in JOB_FINISHED:
+            return JSONResponse({"job_id": job_id, "status": job["status"]}, status_code=202)
+        return jobs.result(job_id)
+
+    return api
@@ -1,9 +1,19 @@
+import io
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 import modal
 import requests
 import time
 import json
+from contextlib import contextmanager
 from fastapi import UploadFile, File, Form
 from typing import Optional
+from urllib.parse import urlparse
+
+from parse_jobs import ParseJobs, create_jobs_app
+from text_layer import detect_text_layer, extract_text_layer_markdown, page_runs, page_text_layer_flags
 
 # Simple Modal app
 app = modal.App("pdf-parser")
@@ -35,6 +45,7 @@ image = (
     .run_commands([
         "python -c 'from marker.converters.pdf import PdfConverter; from marker.models import create_model_dict; print(\"start download model...\"); converter = PdfConverter(artifact_dict=create_model_dict()); print(\"all done!\")'",
     ])
+    .add_local_python_source("text_layer", "parse_jobs")
 )
 
 # 在文件顶部添加模板常量
@@ -45,192 +56,645 @@ MARKDOWN_FOOTER_TEMPLATE = """
 *Processing info: {filename} | {pdf_size:,} bytes | {processing_time:.1f}s | {service_name} | {image_count} images*
 """
 
-# Docling parsing function
-@app.function(
-   image=image,
-   gpu="T4",
-   timeout=600,
-   memory=8192,
-   scaledown_window=40
-)
-def parse_pdf_with_docling(pdf_url: Optional[str] = None, origin_content: Optional[bytes] = None) -> dict:
-   try:
-       from docling.document_converter import DocumentConverter, PdfFormatOption
-       from docling.datamodel.base_models import InputFormat
-       from docling.datamodel.pipeline_options import PdfPipelineOptions
-       import torch
-       import tempfile
-       import os
-       
-       if pdf_url:
-           print(f"Docling解析PDF (URL): {pdf_url}")
-           # 从URL下载PDF
-           response = requests.get(pdf_url, timeout=60)
-           response.raise_for_status()
-           pdf_data = response.content
-           filename = pdf_url.split('/')[-1]
-       elif origin_content:
-           print(f"Docling解析PDF (直接上传): {len(origin_content)} bytes")
-           pdf_data = origin_content
-           filename = "uploaded.pdf"
-       else:
-           raise ValueError("需要提供pdf_url或origin_content")
-       
-       pdf_size = len(pdf_data)
-       
-       # 保存到临时文件
-       with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp_file:
-           tmp_file.write(pdf_data)
-           pdf_path = tmp_file.name
-       
-       try:
-           pipeline_options = PdfPipelineOptions()
-           pipeline_options.do_ocr = True
-           pipeline_options.do_table_structure = True
-           
-           converter = DocumentConverter(
-               format_options={
-                   InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)
-               }
-           )
-           
-           start_time = time.time()
-           result = converter.convert(pdf_path)
-           processing_time = time.time() - start_time
-           
-           markdown_content = result.document.export_to_markdown()
-           page_count = len(result.document.pages) if hasattr(result.document, 'pages') else 1
-           
-           final_markdown = markdown_content + MARKDOWN_FOOTER_TEMPLATE.format(
-               filename=filename,
-               pdf_size=pdf_size,
-               processing_time=processing_time,
-               service_name="Docling GPU",
-               image_count=0  # Docling没有单独的图片计数
-           )
-           
-           return {
-               "success": True,
-               "markdown": final_markdown,
-               "metadata": {
-                   "service": "docling-gpu",
-                   "file_size": pdf_size,
-                   "processing_time": processing_time
-               }
-           }
-           
-       finally:
-           if os.path.exists(pdf_path):
-               os.unlink(pdf_path)
-               
-   except Exception as e:
-       return {
-           "success": False,
-           "error": str(e),
-           "markdown": f"# Docling解析失败\n\n{str(e)}"
-       }
-
-# Marker parsing function with configuration - support URL and direct file upload
-@app.function(
-   image=image,
-   gpu="T4",
-   timeout=600,
-   memory=8192,
-   scaledown_window=40
-)
-def parse_pdf_with_marker(pdf_url: Optional[str] = None, origin_content: Optional[bytes] = None) -> dict:
-   try:
-       # 使用新版marker API
-       from marker.converters.pdf import PdfConverter
-       from marker.models import create_model_dict
-       from marker.output import text_from_rendered
-       import tempfile
-       import os
-       
-       if pdf_url:
-           print(f"Marker解析PDF (URL): {pdf_url}")
-           # 从URL下载PDF
-           response = requests.get(pdf_url, timeout=60)
-           response.raise_for_status()
-           pdf_data = response.content
-           filename = pdf_url.split('/')[-1]
-       elif origin_content:
-           print(f"Marker解析PDF (直接上传): {len(origin_content)} bytes")
-           pdf_data = origin_content
-           filename = "uploaded.pdf"
-       else:
-           raise ValueError("需要提供pdf_url或origin_content")
-       
-       pdf_size = len(pdf_data)
-       
-       # 保存到临时文件
-       with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp_file:
-           tmp_file.write(pdf_data)
-           pdf_path = tmp_file.name
-       
-       try:
-            print("创建Marker转换器...")
-            converter = PdfConverter(
-                artifact_dict=create_model_dict(),
-            )
-            
+# 批量前端：最多合并多少个请求、最多等待多久 (毫秒)
+PARSE_BATCH_MAX_SIZE = int(os.environ.get("PARSE_BATCH_MAX_SIZE", "8"))
+PARSE_BATCH_WAIT_MS = int(os.environ.get("PARSE_BATCH_WAIT_MS", "1000"))
+
+# 大文件分片: 每片页数，以及上传文件超过多少页时自动分片
+MARKER_SHARD_PAGES = int(os.environ.get("MARKER_SHARD_PAGES", "40"))
+MARKER_SHARD_MIN_PAGES = int(os.environ.get("MARKER_SHARD_MIN_PAGES", "120"))
+
+# 优先使用tmpfs (内存文件系统)，需要文件路径的引擎不落盘
+PDF_TMP_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+def fetch_pdf_data(pdf_url: Optional[str] = None, origin_content: Optional[bytes] = None) -> tuple:
+    """Return (pdf_data, filename) from a URL or uploaded bytes"""
+    if pdf_url:
+        print(f"解析PDF (URL): {pdf_url}")
+        response = requests.get(pdf_url, timeout=60)
+        response.raise_for_status()
+        # presigned URLs carry the signature in the query string
+        return response.content, os.path.basename(urlparse(pdf_url).path)
+    if origin_content:
+        print(f"解析PDF (直接上传): {len(origin_content)} bytes")
+        return origin_content, "uploaded.pdf"
+    raise ValueError("需要提供pdf_url或origin_content")
+
+
+def _fetch_or_error(pdf_url, origin_content):
+    try:
+        return fetch_pdf_data(pdf_url, origin_content), None
+    except Exception as e:
+        return None, e
+
+
+@contextmanager
+def pdf_bytes_as_path(pdf_data: bytes):
+    """Expose in-memory PDF bytes as a file path on tmpfs, removed on exit"""
+    with tempfile.NamedTemporaryFile(suffix=".pdf", dir=PDF_TMP_DIR) as tmp_file:
+        tmp_file.write(pdf_data)
+        tmp_file.flush()
+        yield tmp_file.name
+
+
+# marker paginate_output 的页分隔符: "{page_id}" + 48个"-"
+MARKER_PAGE_SEPARATOR_PATTERN = re.compile(r"\n*\{(\d+)\}-{48}\n*")
+# marker 图片名包含页码: _page_3_Picture_1.jpeg
+MARKER_IMAGE_PAGE_PATTERN = re.compile(r"_page_(\d+)_")
+
+
+def split_paginated_markdown(text: str) -> dict:
+    """Split marker paginated markdown into {page_id: page markdown}"""
+    parts = MARKER_PAGE_SEPARATOR_PATTERN.split(text)
+    # parts = [text before first separator, page_id, page text, page_id, page text, ...]
+    return {int(parts[i]): parts[i + 1].strip() for i in range(1, len(parts) - 1, 2)}
+
+
+def marker_result(text: str, image_count: int, filename: str, pdf_size: int, processing_time: float) -> dict:
+    final_markdown = text + MARKDOWN_FOOTER_TEMPLATE.format(
+        filename=filename,
+        pdf_size=pdf_size,
+        processing_time=processing_time,
+        service_name="Marker GPU",
+        image_count=image_count
+    )
+    return {
+        "success": True,
+        "message": "Success Parse with Marker GPU",
+        "markdown": final_markdown,
+        "metadata": {
+            "service": "marker-gpu",
+            "file_size": pdf_size,
+            "processing_time": processing_time,
+            "image_count": image_count
+        }
+    }
+
+
+def marker_error(e: Exception) -> dict:
+    return {
+        "success": False,
+        "error": str(e),
+        "markdown": f"# Marker解析失败\n\n{str(e)}"
+    }
+
+
+def count_pdf_pages(pdf_data: bytes) -> int:
+    import pypdfium2 as pdfium
+
+    document = pdfium.PdfDocument(pdf_data)
+    try:
+        return len(document)
+    finally:
+        document.close()
+
+
+def split_pdf_pages(pdf_data: bytes, shard_pages: int) -> list:
+    """Split a PDF into consecutive shards of at most shard_pages pages, returned as PDF bytes"""
+    import pypdfium2 as pdfium
+
+    source = pdfium.PdfDocument(pdf_data)
+    shards = []
+    try:
+        for start_page in range(0, len(source), shard_pages):
+            shard = pdfium.PdfDocument.new()
+            shard.import_pages(source, pages=list(range(start_page, min(start_page + shard_pages, len(source)))))
+            shard_buffer = io.BytesIO()
+            shard.save(shard_buffer)
+            shard.close()
+            shards.append(shard_buffer.getvalue())
+    finally:
+        source.close()
+    return shards
+
+
+MARKDOWN_HEADING_PATTERN = re.compile(r"^(#{1,6})(\s)")
+
+
+def _shift_markdown_headings(text: str, shift: int = 0) -> tuple:
+    """Shift ATX heading levels by shift (capped at 6), skipping fenced code; returns (text, original levels)"""
+    lines = []
+    levels = []
+    in_fence = False
+    for line in text.split("\n"):
+        if line.lstrip().startswith("```"):
+            in_fence = not in_fence
+        match = None if in_fence else MARKDOWN_HEADING_PATTERN.match(line)
+        if match:
+            level = len(match.group(1))
+            levels.append(level)
+            if shift:
+                line = "#" * min(level + shift, 6) + line[level:]
+        lines.append(line)
+    return "\n".join(lines), levels
+
+
+def stitch_shard_markdown(shard_texts: list) -> str:
+    """
+    Join shard markdown in order. Marker assigns heading levels per document, so a
+    shard without the title promotes its chapter headings to the title level; such
+    shards are shifted down so their top level matches the first shard's body level.
+    """
+    _, first_levels = _shift_markdown_headings(shard_texts[0]) if shard_texts else ("", [])
+    if not first_levels:
+        return "\n\n".join(text.strip() for text in shard_texts)
+
+    top_level = min(first_levels)
+    # 第一片里只出现一次的最高级标题视为文档标题，正文从下一级开始
+    body_level = top_level + 1 if first_levels.count(top_level) == 1 and len(set(first_levels)) > 1 else top_level
+
+    stitched = [shard_texts[0].strip()]
+    for text in shard_texts[1:]:
+        _, levels = _shift_markdown_headings(text)
+        shift = body_level - min(levels) if levels and min(levels) < body_level else 0
+        shifted_text, _ = _shift_markdown_headings(text, shift)
+        stitched.append(shifted_text.strip())
+    return "\n\n".join(stitched)
+
+
+def parse_with_text_layer(pdf_data: bytes, filename: str, text_layer: dict) -> dict:
+    """CPU fast path: markdown straight from the PDF text layer, no models"""
+    start_time = time.time()
+    with pdf_bytes_as_path(pdf_data) as pdf_path:
+        markdown, _ = extract_text_layer_markdown(pdf_path)
+    processing_time = time.time() - start_time
+
+    final_markdown = markdown + MARKDOWN_FOOTER_TEMPLATE.format(
+        filename=filename,
+        pdf_size=len(pdf_data),
+        processing_time=processing_time,
+        service_name="Text layer CPU",
+        image_count=0
+    )
+    return {
+        "success": True,
+        "message": "Success Parse with text layer",
+        "markdown": final_markdown,
+        "metadata": {
+            "service": "text-layer-cpu",
+            "file_size": len(pdf_data),
+            "processing_time": processing_time,
+            "text_layer": text_layer
+        }
+    }
+
+
+def docling_page_timings(result, first_page: int, ocr: bool, run_seconds: float) -> list:
+    """
+    [{"page", "ocr", "seconds"}] for the pages of one docling conversion. Uses
+    docling's page-scoped profiling (summed over pipeline stages) when present,
+    otherwise splits the run time evenly.
+    """
+    from docling.utils.profiling import ProfilingScope
+
+    page_count = len(result.pages) or 1
+    page_seconds = [0.0] * page_count
+    profiled = False
+    for item in (getattr(result, "timings", None) or {}).values():
+        if item.scope == ProfilingScope.PAGE and len(item.times) == page_count:
+            for index, seconds in enumerate(item.times):
+                page_seconds[index] += seconds
+            profiled = True
+    if not profiled:
+        page_seconds = [run_seconds / page_count] * page_count
+    return [
+        {"page": first_page + index, "ocr": ocr, "seconds": seconds}
+        for index, seconds in enumerate(page_seconds)
+    ]
+
+
+class PdfEngines:
+    """
+    Marker and Docling converters, loaded once and reused for every request.
+    Plain Python so it runs outside Modal too (see benchmark_parser.py).
+    """
+
+    def __init__(self, engines=("marker", "docling")):
+        self.marker_converter = None
+        self.marker_batch_converter = None
+        self.docling_converter = None
+        self.docling_text_converter = None
+        self.load_seconds = {}
+        for engine in engines:
             start_time = time.time()
-            print(f"开始转换PDF...{filename=}")
-            rendered = converter(pdf_path)
-            
-            print("提取文本和图像...")
-            text, metadata, images = text_from_rendered(rendered)
-            
-            processing_time = time.time() - start_time
-            print(f"parser success: {processing_time=} {metadata=}")
-            
-            # 在最后生成markdown的地方
-            final_markdown = text + MARKDOWN_FOOTER_TEMPLATE.format(
-                filename=filename,
-                pdf_size=pdf_size,
-                processing_time=processing_time,
-                service_name="Marker GPU",
-                image_count=len(images) if images else 0
+            if engine == "marker":
+                self._load_marker()
+            elif engine == "docling":
+                self._load_docling()
+            else:
+                raise ValueError(f"未知引擎: {engine}")
+            self.load_seconds[engine] = time.time() - start_time
+            print(f"{engine} 模型加载完成: {self.load_seconds[engine]:.1f}s")
+
+    def _load_marker(self):
+        from marker.converters.pdf import PdfConverter
+        from marker.models import create_model_dict
+
+        print("创建Marker转换器...")
+        artifact_dict = create_model_dict()
+        self.marker_converter = PdfConverter(artifact_dict=artifact_dict)
+        # 批量转换共享同一份模型，只是输出带页码分隔符，便于按文件拆分
+        self.marker_batch_converter = PdfConverter(artifact_dict=artifact_dict, config={"paginate_output": True})
+
+    def _load_docling(self):
+        from docling.document_converter import DocumentConverter, PdfFormatOption
+        from docling.datamodel.base_models import InputFormat
+        from docling.datamodel.pipeline_options import PdfPipelineOptions
+
+        from docling.datamodel.settings import settings
+
+        # 记录每页各阶段耗时 (result.timings)
+        settings.debug.profile_pipeline_timings = True
+
+        print("创建Docling转换器...")
+        # 扫描页: OCR + 表格结构
+        pipeline_options = PdfPipelineOptions()
+        pipeline_options.do_ocr = True
+        pipeline_options.do_table_structure = True
+        self.docling_converter = DocumentConverter(
+            format_options={
+                InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)
+            }
+        )
+        # 有文本层的页: 只做版面分析，跳过OCR和表格模型
+        text_pipeline_options = PdfPipelineOptions()
+        text_pipeline_options.do_ocr = False
+        text_pipeline_options.do_table_structure = False
+        self.docling_text_converter = DocumentConverter(
+            format_options={
+                InputFormat.PDF: PdfFormatOption(pipeline_options=text_pipeline_options)
+            }
+        )
+        # 预先加载布局/表格/OCR模型，而不是在第一个请求时加载
+        self.docling_converter.initialize_pipeline(InputFormat.PDF)
+        self.docling_text_converter.initialize_pipeline(InputFormat.PDF)
+
+    def convert_with_marker(self, pdf_data: bytes) -> tuple:
+        """Raw marker conversion: (markdown text without footer, image count)"""
+        from marker.output import text_from_rendered
+
+        if self.marker_converter is None:
+            raise RuntimeError("Marker引擎未加载")
+
+        with pdf_bytes_as_path(pdf_data) as pdf_path:
+            rendered = self.marker_converter(pdf_path)
+
+        print("提取文本和图像...")
+        text, metadata, images = text_from_rendered(rendered)
+        print(f"parser success: {metadata=}")
+        return text, len(images) if images else 0
+
+    def parse_with_marker(self, pdf_data: bytes, filename: str) -> dict:
+        start_time = time.time()
+        print(f"开始转换PDF...{filename=}")
+        text, image_count = self.convert_with_marker(pdf_data)
+        processing_time = time.time() - start_time
+        print(f"{processing_time=}")
+        return marker_result(text, image_count, filename, len(pdf_data), processing_time)
+
+    def parse_batch_with_marker(self, items: list) -> list:
+        """
+        Parse several (pdf_data, filename) items in one marker run: the PDFs are
+        merged into one document so layout/OCR/recognition batches span all their
+        pages, then the paginated markdown is split back per input.
+        Returns one result dict per item, in order.
+        """
+        import pypdfium2 as pdfium
+        from marker.output import text_from_rendered
+
+        if self.marker_batch_converter is None:
+            raise RuntimeError("Marker引擎未加载")
+        results = [None] * len(items)
+        page_ranges = {}
+        merged = pdfium.PdfDocument.new()
+        for index, (pdf_data, filename) in enumerate(items):
+            try:
+                source = pdfium.PdfDocument(pdf_data)
+            except Exception as e:
+                results[index] = marker_error(e)
+                continue
+            start_page = len(merged)
+            merged.import_pages(source)
+            source.close()
+            page_ranges[index] = (start_page, len(merged))
+
+        batch_pages = len(merged)
+        if not page_ranges:
+            merged.close()
+            return results
+        merged_buffer = io.BytesIO()
+        merged.save(merged_buffer)
+        merged.close()
+
+        start_time = time.time()
+        print(f"批量转换PDF: {len(page_ranges)} 个文件, {batch_pages} 页")
+        try:
+            with pdf_bytes_as_path(merged_buffer.getvalue()) as pdf_path:
+                rendered = self.marker_batch_converter(pdf_path)
+            text, _, images = text_from_rendered(rendered)
+        except Exception as e:
+            # 合并文档失败时逐个重试，避免一个坏文件拖垮整批
+            print(f"批量转换失败，逐个解析: {e}")
+            for index in page_ranges:
+                try:
+                    results[index] = self.parse_with_marker(*items[index])
+                except Exception as item_error:
+                    results[index] = marker_error(item_error)
+            return results
+        processing_time = time.time() - start_time
+        throughput = batch_pages / processing_time if processing_time else 0.0
+
+        pages_text = split_paginated_markdown(text)
+        image_pages = [int(match.group(1)) for match in map(MARKER_IMAGE_PAGE_PATTERN.search, images or {}) if match]
+        for index, (start_page, end_page) in page_ranges.items():
+            pdf_data, filename = items[index]
+            doc_text = "\n\n".join(pages_text[page] for page in range(start_page, end_page) if page in pages_text)
+            image_count = sum(1 for page in image_pages if start_page <= page < end_page)
+            result = marker_result(doc_text, image_count, filename, len(pdf_data), processing_time)
+            result["metadata"].update(
+                pages=end_page - start_page,
+                batch_size=len(page_ranges),
+                batch_pages=batch_pages,
+                throughput_pages_per_s=throughput,
             )
-           
-            response = {
-               "success": True,
-               "message": "Success Parse with Marker GPU",
-               "markdown": final_markdown,
-            #    "page": 1,
-               "metadata": {
-                   "service": "marker-gpu",
-                   "file_size": pdf_size,
-                   "processing_time": processing_time,
-                   "image_count": len(images) if images else 0
-               }
+            results[index] = result
+        print(f"批量转换完成: {processing_time:.1f}s, {throughput:.2f} pages/s")
+        return results
+
+    def parse_with_docling(self, pdf_data: bytes, filename: str) -> dict:
+        """
+        Pages are classified by text layer first: consecutive scanned pages go
+        through the OCR + table converter, born-digital pages through the
+        layout-only converter, and the markdown of the runs is joined in order.
+        """
+        from docling.datamodel.base_models import DocumentStream
+
+        if self.docling_converter is None:
+            raise RuntimeError("Docling引擎未加载")
+        pdf_size = len(pdf_data)
+
+        start_time = time.time()
+        try:
+            runs = page_runs(page_text_layer_flags(pdf_data))
+        except Exception as e:
+            print(f"无法检测文本层，全部页面OCR: {e}")
+            runs = []
+
+        markdown_parts = []
+        page_timings = []
+        for first_page, last_page, has_text in runs or [(None, None, False)]:
+            converter = self.docling_text_converter if has_text else self.docling_converter
+            # 只有一段时不传page_range，整份文档一次转换
+            page_range = {"page_range": (first_page, last_page)} if len(runs) > 1 else {}
+            run_start_time = time.time()
+            # Docling直接读取内存流，不需要临时文件
+            result = converter.convert(DocumentStream(name=filename, stream=io.BytesIO(pdf_data)), **page_range)
+            run_seconds = time.time() - run_start_time
+            markdown_parts.append(result.document.export_to_markdown())
+            page_timings.extend(docling_page_timings(result, first_page or 1, not has_text, run_seconds))
+        processing_time = time.time() - start_time
+
+        markdown_content = "\n\n".join(markdown_parts)
+
+        final_markdown = markdown_content + MARKDOWN_FOOTER_TEMPLATE.format(
+            filename=filename,
+            pdf_size=pdf_size,
+            processing_time=processing_time,
+            service_name="Docling GPU",
+            image_count=0  # Docling没有单独的图片计数
+        )
+
+        return {
+            "success": True,
+            "markdown": final_markdown,
+            "metadata": {
+                "service": "docling-gpu",
+                "file_size": pdf_size,
+                "processing_time": processing_time,
+                "ocr_pages": sum(1 for page in page_timings if page["ocr"]),
+                "page_runs": len(runs),
+                "pages": page_timings
             }
+        }
 
-            # response = {
-            #     "success": True,
-            #     "message": "Success Parse with Marker GPU",
-            #     "data": {
-            #         "markdown": final_markdown,
-            #         "page": 1,
-            #         "duration": processing_time
-            #     }
-            # }
-
-            return response
-           
-       finally:
-           if os.path.exists(pdf_path):
-               os.unlink(pdf_path)
-               
-   except Exception as e:
-       return {
-           "success": False,
-           "error": str(e),
-           "markdown": f"# Marker解析失败\n\n{str(e)}"
-       }
 
-# 原有的JSON API - 支持URL方式
+# 常驻服务：每个容器只加载一次模型，后续请求直接复用
+@app.cls(
+    image=image,
+    gpu="T4",
+    timeout=600,
+    memory=8192,
+    scaledown_window=40
+)
+class PdfParserService:
+
+    @modal.enter()
+    def load_engines(self):
+        self.engines = PdfEngines()
+
+    @modal.method()
+    def parse_pdf_with_docling(self, pdf_url: Optional[str] = None, origin_content: Optional[bytes] = None) -> dict:
+        try:
+            pdf_data, filename = fetch_pdf_data(pdf_url, origin_content)
+            return self.engines.parse_with_docling(pdf_data, filename)
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "markdown": f"# Docling解析失败\n\n{str(e)}"
+            }
+
+    @modal.method()
+    def parse_pdf_with_marker(self, pdf_url: Optional[str] = None, origin_content: Optional[bytes] = None) -> dict:
+        try:
+            pdf_data, filename = fetch_pdf_data(pdf_url, origin_content)
+            return self.engines.parse_with_marker(pdf_data, filename)
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "markdown": f"# Marker解析失败\n\n{str(e)}"
+            }
+
+
+# 分片容器只加载marker，不为用不到的docling付加载时间和显存
+@app.cls(
+    image=image,
+    gpu="T4",
+    timeout=600,
+    memory=8192,
+    scaledown_window=40
+)
+class MarkerShardParser:
+
+    @modal.enter()
+    def load_engines(self):
+        self.engines = PdfEngines(engines=("marker",))
+
+    @modal.method()
+    def parse_pdf_shard_with_marker(self, shard_data: bytes) -> dict:
+        """One page-range shard of a large PDF; errors propagate to the sharding caller"""
+        start_time = time.time()
+        text, image_count = self.engines.convert_with_marker(shard_data)
+        return {"markdown": text, "image_count": image_count, "processing_time": time.time() - start_time}
+
+
+# 大文件分片：按页拆分，分片在多个容器上并行解析，再按顺序拼接
+@app.function(image=image, timeout=1800)
+def parse_pdf_sharded_with_marker(
+    pdf_url: Optional[str] = None,
+    origin_content: Optional[bytes] = None,
+    shard_pages: int = MARKER_SHARD_PAGES
+) -> dict:
+    try:
+        pdf_data, filename = fetch_pdf_data(pdf_url, origin_content)
+        start_time = time.time()
+        shards = split_pdf_pages(pdf_data, shard_pages)
+        print(f"分片解析: {filename=} {len(shards)} 片, 每片最多 {shard_pages} 页")
+
+        shard_results = list(MarkerShardParser().parse_pdf_shard_with_marker.map(shards))
+        processing_time = time.time() - start_time
+
+        text = stitch_shard_markdown([shard_result["markdown"] for shard_result in shard_results])
+        image_count = sum(shard_result["image_count"] for shard_result in shard_results)
+        result = marker_result(text, image_count, filename, len(pdf_data), processing_time)
+        result["metadata"].update(
+            shards=len(shards),
+            shard_pages=shard_pages,
+            shard_processing_times=[shard_result["processing_time"] for shard_result in shard_results],
+        )
+        return result
+    except Exception as e:
+        return marker_error(e)
+
+# Marker批量前端：在短时间窗口内收集请求，合并成一次GPU运行，再把结果拆回各个调用方
+@app.cls(
+    image=image,
+    gpu="T4",
+    timeout=1800,
+    memory=16384,
+    scaledown_window=40
+)
+class MarkerBatchParser:
+
+    @modal.enter()
+    def load_engines(self):
+        self.engines = PdfEngines(engines=("marker",))
+
+    @modal.batched(max_batch_size=PARSE_BATCH_MAX_SIZE, wait_ms=PARSE_BATCH_WAIT_MS)
+    def parse_pdf_with_marker(self, pdf_url: list, origin_content: list) -> list:
+        results = [None] * len(pdf_url)
+        items = []
+        item_indexes = []
+        with ThreadPoolExecutor(max_workers=len(pdf_url)) as executor:
+            fetches = list(executor.map(
+                lambda args: _fetch_or_error(*args), zip(pdf_url, origin_content)
+            ))
+        for index, (item, error) in enumerate(fetches):
+            if error is not None:
+                results[index] = marker_error(error)
+            else:
+                items.append(item)
+                item_indexes.append(index)
+
+        if items:
+            try:
+                batch_results = self.engines.parse_batch_with_marker(items)
+            except Exception as e:
+                batch_results = [marker_error(e)] * len(items)
+            for index, result in zip(item_indexes, batch_results):
+                results[index] = result
+        return results
+
+
+# GPU引擎，text引擎文本层不足时回退到其中之一
+GPU_ENGINES = ("marker", "docling")
+
+
+def route_parse_request(
+    engine: str,
+    pdf_url: Optional[str] = None,
+    origin_content: Optional[bytes] = None,
+    shard_pages: int = 0,
+    fallback_engine: str = "marker"
+) -> dict:
+    """
+    Pick the engine for one request:
+    - text: CPU text layer when detect_text_layer says it is usable, else fallback_engine
+    - marker: sharded for large uploads / explicit shard_pages, otherwise the batch front
+    - docling: PdfParserService
+    """
+    text_layer = None
+    if engine == "text":
+        pdf_data, filename = fetch_pdf_data(pdf_url, origin_content)
+        try:
+            text_layer = detect_text_layer(pdf_data)
+            print(f"文本层检测: {text_layer}")
+            if text_layer["usable"]:
+                return parse_with_text_layer(pdf_data, filename, text_layer)
+        except Exception as e:
+            print(f"文本层解析失败，回退到 {fallback_engine}: {e}")
+        engine = fallback_engine if fallback_engine in GPU_ENGINES else "marker"
+
+    # 超过 MARKER_SHARD_MIN_PAGES 页的上传文件自动分片
+    if engine == "marker" and not shard_pages and origin_content:
+        try:
+            if count_pdf_pages(origin_content) > MARKER_SHARD_MIN_PAGES:
+                shard_pages = MARKER_SHARD_PAGES
+        except Exception as e:
+            print(f"无法读取页数，不分片: {e}")
+
+    if engine == "marker" and shard_pages > 0:
+        result = parse_pdf_sharded_with_marker.remote(pdf_url=pdf_url, origin_content=origin_content, shard_pages=shard_pages)
+    elif engine == "marker":
+        result = MarkerBatchParser().parse_pdf_with_marker.remote(pdf_url, origin_content)
+    else:
+        result = PdfParserService().parse_pdf_with_docling.remote(pdf_url=pdf_url, origin_content=origin_content)
+
+    if text_layer is not None:
+        result.setdefault("metadata", {}).update(text_layer=text_layer, fallback_from="text")
+    return result
+
+
+# 异步任务: 任务记录和结果保存在modal.Dict中 (7天不访问自动过期)
+parse_job_store = modal.Dict.from_name("pdf-parser-jobs", create_if_missing=True)
+# 同步接口最多等待多久，超时返回job_id，调用方可继续轮询
+SYNC_PARSE_TIMEOUT_SECONDS = 1700
+
+
+def get_parse_jobs() -> ParseJobs:
+    return ParseJobs(parse_job_store, launch=lambda *args: run_parse_job.spawn(*args))
+
+
+def parse_job_pdf(pdf_data: bytes, filename: str, engine: str, options: dict) -> dict:
+    return route_parse_request(engine, origin_content=pdf_data, **options)
+
+
+@app.function(image=image, timeout=1800)
+def run_parse_job(job_id: str, pdf_data: Optional[bytes], filename: str, engine: str, options: dict):
+    get_parse_jobs().run(job_id, pdf_data, filename, engine, options, parse=parse_job_pdf, fetch=fetch_pdf_data)
+
+
+# 异步任务API: POST /jobs 提交, GET /jobs/{job_id} 状态, GET /jobs/{job_id}/result 结果
 @app.function(image=image)
+@modal.asgi_app()
+def parse_jobs_api():
+    return create_jobs_app(get_parse_jobs())
+
+
+def submit_and_wait(pdf_data: bytes, filename: str, engine: str, shard_pages: int, fallback_engine: str) -> dict:
+    """Synchronous endpoints are a thin wrapper: submit a job, then wait for its result"""
+    jobs = get_parse_jobs()
+    job = jobs.submit(pdf_data, filename, engine, {"shard_pages": shard_pages, "fallback_engine": fallback_engine})
+    result = jobs.wait(job["job_id"], timeout=SYNC_PARSE_TIMEOUT_SECONDS)
+    if result is None:
+        return {"success": False, "error": "解析超时，请用job_id查询结果", "job_id": job["job_id"]}
+    return result
+
+
+# 原有的JSON API - 支持URL方式
+@app.function(image=image, timeout=1800)
 @modal.fastapi_endpoint(method="POST")
 def parse_pdf_api(item: dict):
    """
@@ -240,20 +704,26 @@ def parse_pdf_api(item: dict):
    if not pdf_url:
        return {"success": False, "error": "需要pdf_url参数"}
    
-   # 路由选择
+   # 路由选择: marker / docling / text (CPU文本层，不足时回退到fallback_engine)
    engine = item.get("engine", "marker")  
+   # 大文件可指定分片页数，分片并行解析
+   shard_pages = int(item.get("shard_pages") or 0)
+   fallback_engine = item.get("fallback_engine", "marker")
    
-   if engine == "marker":
-       return parse_pdf_with_marker.remote(pdf_url=pdf_url)
-   else:
-       return parse_pdf_with_docling.remote(pdf_url=pdf_url)
+   try:
+       pdf_data, filename = fetch_pdf_data(pdf_url=pdf_url)
+       return submit_and_wait(pdf_data, filename, engine, shard_pages, fallback_engine)
+   except Exception as e:
+       return {"success": False, "error": str(e), "markdown": f"# PDF解析失败\n\n{str(e)}"}
 
 # 新增：文件上传API - 支持直接传文件
-@app.function(image=image)
+@app.function(image=image, timeout=1800)
 @modal.fastapi_endpoint(method="POST")
 def parse_pdf_upload(
     file: UploadFile = File(...),
-    engine: str = Form("marker")
+    engine: str = Form("marker"),
+    shard_pages: int = Form(0),
+    fallback_engine: str = Form("marker")
 ):
     """
     PDF解析API - 文件上传格式，支持直接传PDF文件
@@ -271,11 +741,8 @@ def parse_pdf_upload(
         
         print(f"收到文件上传: {file.filename}, 大小: {len(origin_content)} bytes, 引擎: {engine}")
         
-        # 路由到不同引擎
-        if engine == "marker":
-            return parse_pdf_with_marker.remote(origin_content=origin_content)
-        else:
-            return parse_pdf_with_docling.remote(origin_content=origin_content)
+        # 同PDF同参数的请求复用同一个任务
+        return submit_and_wait(origin_content, file.filename, engine, shard_pages, fallback_engine)
             
     except Exception as e:
         return {
@@ -291,8 +758,8 @@ def health():
    return {
        "status": "healthy",
        "service": "dual-engine-pdf-parser",
-       "engines": ["docling", "marker"],
-       "api_modes": ["url", "file_upload"],
+       "engines": ["docling", "marker", "text"],
+       "api_modes": ["url", "file_upload", "async_jobs"],
        "version": "2.2.0",
        "timestamp": time.time()
    }
@@ -303,11 +770,11 @@ def test():
    test_url = "https://objectstorageapi.bja.sealos.run/w4tywxqg-deepmodeling-docs/deepmd/major/DeePMD-kit.pdf"
    
    print("Testing Docling with URL...")
-   result1 = parse_pdf_with_docling.remote(pdf_url=test_url)
+   result1 = PdfParserService().parse_pdf_with_docling.remote(pdf_url=test_url)
    print(f"Docling URL: {result1['success']}")
    
    print("Testing Marker with URL...")
-   result2 = parse_pdf_with_marker.remote(pdf_url=test_url)
+   result2 = PdfParserService().parse_pdf_with_marker.remote(pdf_url=test_url)
    print(f"Marker URL: {result2['success']}")
    
    # 测试文件上传方式
@@ -315,7 +782,7 @@ def test():
        print("Testing file upload (if PDF exists)...")
        with open("test.pdf", "rb") as f:
            origin_content = f.read()
-       result3 = parse_pdf_with_marker.remote(origin_content=origin_content)
+       result3 = PdfParserService().parse_pdf_with_marker.remote(origin_content=origin_content)
        print(f"Marker Upload: {result3['success']}")
    except FileNotFoundError:
        print("No test.pdf found, skipping file upload test")
\ No newline at end of file
@@ -0,0 +1,51 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pdf_parser import _shift_markdown_headings, split_paginated_markdown, stitch_shard_markdown
+import pytest
+
+SEPARATOR = "-" * 48
+
+
+@pytest.mark.parametrize("text, pages", [
+    (f"{{0}}{SEPARATOR}\n\nPage one\n\n{{1}}{SEPARATOR}\n\nPage two\n", {0: "Page one", 1: "Page two"}),
+    # text before the first separator is not a page
+    (f"preamble\n\n{{3}}{SEPARATOR}\n\nOnly page", {3: "Only page"}),
+    (f"{{0}}{SEPARATOR}\n\n{{1}}{SEPARATOR}\n\nSecond", {0: "", 1: "Second"}),
+    ("no separators at all", {}),
+    # 47 dashes is not a separator
+    ("{0}" + "-" * 47 + "\n\ntext", {}),
+])
+def test_split_paginated_markdown(text, pages):
+    assert split_paginated_markdown(text) == pages
+
+
+@pytest.mark.parametrize("text, shift, shifted, levels", [
+    ("# A\n\n## B\n\ntext", 1, "## A\n\n### B\n\ntext", [1, 2]),
+    ("# A\n\n## B", 0, "# A\n\n## B", [1, 2]),
+    # capped at level 6
+    ("##### Deep\n###### Deeper", 2, "###### Deep\n###### Deeper", [5, 6]),
+    # headings inside fenced code are comments, not headings
+    ("```bash\n# install\n```\n# Usage", 1, "```bash\n# install\n```\n## Usage", [1]),
+    # no space after the hashes: not an ATX heading
+    ("#hashtag\n####### seven", 1, "#hashtag\n####### seven", []),
+])
+def test_shift_markdown_headings(text, shift, shifted, levels):
+    assert _shift_markdown_headings(text, shift) == (shifted, levels)
+
+
+@pytest.mark.parametrize("shard_texts, stitched", [
+    # later shards promote chapters to the title level, they are moved under the title
+    (["# Title\n\n## Intro\n\ntext ", "# Methods\n\n## Setup\n\nmore"],
+     "# Title\n\n## Intro\n\ntext\n\n## Methods\n\n### Setup\n\nmore"),
+    # already at the body level: unchanged
+    (["# Title\n\n## Intro", "## Methods"], "# Title\n\n## Intro\n\n## Methods"),
+    # several top-level headings in the first shard: no document title, body at level 1
+    (["# A\n\n# B", "# C"], "# A\n\n# B\n\n# C"),
+    # first shard without headings: plain join
+    ([" first ", "# Chapter\n\nsecond"], "first\n\n# Chapter\n\nsecond"),
+    (["# Only shard\n\n## Part"], "# Only shard\n\n## Part"),
+    ([], ""),
+])
+def test_stitch_shard_markdown(shard_texts, stitched):
+    assert stitch_shard_markdown(shard_texts) == stitched
@@ -0,0 +1,176 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import hashlib
+import parse_jobs
+from parse_jobs import ParseJobs, create_jobs_app, JOB_QUEUED, JOB_SUCCEEDED, JOB_FAILED
+from fastapi.testclient import TestClient
+import pytest
+
+PDF_DATA = b"%PDF-1.4 stand-in"
+
+
+def stand_in_parse(pdf_data, filename, engine, options):
+    """Local stand-in for route_parse_request"""
+    return {"success": True, "markdown": f"# {filename}", "metadata": {"service": engine, "file_size": len(pdf_data)}}
+
+
+def failing_parse(pdf_data, filename, engine, options):
+    raise RuntimeError("GPU exploded")
+
+
+def fetch_stand_in(pdf_url, origin_content):
+    return PDF_DATA, pdf_url.split('/')[-1]
+
+
+class DeferredLauncher:
+    """Records launches; run_all() plays the background worker"""
+
+    def __init__(self, parse=stand_in_parse, fetch=fetch_stand_in):
+        self.launched = []
+        self.parse = parse
+        self.fetch = fetch
+        self.jobs = None
+
+    def __call__(self, *args):
+        self.launched.append(args)
+
+    def run_all(self):
+        for args in self.launched:
+            self.jobs.run(*args, parse=self.parse, fetch=self.fetch)
+        self.launched = []
+
+
+@pytest.fixture
+def launcher():
+    launcher = DeferredLauncher()
+    launcher.jobs = ParseJobs({}, launch=launcher)
+    return launcher
+
+
+class TestParseJobs:
+    """Test cases for the async parse job API"""
+
+    def test_submit_poll_result(self, launcher):
+        """Submit returns at once; result is 202 until the worker finishes"""
+        client = TestClient(create_jobs_app(launcher.jobs))
+
+        response = client.post("/jobs", files={"file": ("paper.pdf", PDF_DATA, "application/pdf")}, data={"engine": "marker"})
+        assert response.status_code == 202
+        job = response.json()
+        assert job["status"] == JOB_QUEUED
+        assert job["deduplicated"] is False
+
+        assert client.get(f"/jobs/{job['job_id']}/result").status_code == 202
+
+        launcher.run_all()
+        assert client.get(f"/jobs/{job['job_id']}").json()["status"] == JOB_SUCCEEDED
+        result = client.get(f"/jobs/{job['job_id']}/result")
+        assert result.status_code == 200
+        assert result.json()["markdown"] == "# paper.pdf"
+
+        assert client.get("/jobs/unknown").status_code == 404
+
+    def test_submit_by_url(self, launcher):
+        """pdf_url submissions return before any download; the worker fetches the PDF"""
+        fetched = []
+
+        def fetch(pdf_url, origin_content):
+            fetched.append(pdf_url)
+            return PDF_DATA, "a.pdf"
+
+        launcher.fetch = fetch
+        client = TestClient(create_jobs_app(launcher.jobs))
+
+        job = client.post("/jobs", data={"pdf_url": "https://example.com/a.pdf?X-Amz-Signature=s"}).json()
+        assert job["status"] == JOB_QUEUED
+        assert (job["filename"], job["pdf_md5"]) == ("a.pdf", None)
+        assert client.post("/jobs", data={"pdf_url": "https://example.com/a.pdf?X-Amz-Signature=s"}).json()["deduplicated"] is True
+        assert fetched == []
+
+        launcher.run_all()
+        assert fetched == ["https://example.com/a.pdf?X-Amz-Signature=s"]
+        assert launcher.jobs.status(job["job_id"])["pdf_md5"] == hashlib.md5(PDF_DATA).hexdigest()
+        assert launcher.jobs.result(job["job_id"])["markdown"] == "# a.pdf"
+        assert client.post("/jobs", data={}).status_code == 400
+
+    def test_submit_by_url_download_fails(self, launcher):
+        """A failed download fails the job instead of the submit request"""
+        def fetch(pdf_url, origin_content):
+            raise ConnectionError("404 Not Found")
+
+        launcher.fetch = fetch
+        job = launcher.jobs.submit_url("https://example.com/missing.pdf", "marker")
+        launcher.run_all()
+
+        assert launcher.jobs.status(job["job_id"])["status"] == JOB_FAILED
+        assert launcher.jobs.result(job["job_id"])["error"] == "下载PDF失败: 404 Not Found"
+
+    def test_idempotent_by_pdf_hash(self, launcher):
+        """Same PDF + engine + options reuses the job; other engines get their own"""
+        jobs = launcher.jobs
+        first = jobs.submit(PDF_DATA, "a.pdf", "marker")
+        second = jobs.submit(PDF_DATA, "copy.pdf", "marker")
+        other_engine = jobs.submit(PDF_DATA, "a.pdf", "docling")
+
+        assert second["job_id"] == first["job_id"]
+        assert second["deduplicated"] is True
+        assert other_engine["job_id"] != first["job_id"]
+        assert len(launcher.launched) == 2
+
+        launcher.run_all()
+        # finished jobs are not parsed again
+        jobs.submit(PDF_DATA, "a.pdf", "marker")
+        assert launcher.launched == []
+
+    def test_failed_job_is_relaunched(self, launcher):
+        """Failed jobs record the error and run again on resubmit"""
+        launcher.parse = failing_parse
+        jobs = launcher.jobs
+        job = jobs.submit(PDF_DATA, "a.pdf", "marker")
+        launcher.run_all()
+
+        assert jobs.status(job["job_id"])["status"] == JOB_FAILED
+        assert jobs.result(job["job_id"])["error"] == "GPU exploded"
+
+        launcher.parse = stand_in_parse
+        assert jobs.submit(PDF_DATA, "a.pdf", "marker")["deduplicated"] is False
+        launcher.run_all()
+        assert jobs.result(job["job_id"])["success"] is True
+
+    def test_callbacks(self, launcher, monkeypatch):
+        """Callback URLs get the result when the job finishes, or at once if it already has"""
+        calls = []
+
+        class Response:
+            def raise_for_status(self):
+                pass
+
+        def fake_post(url, json, timeout):
+            calls.append((url, json))
+            return Response()
+
+        monkeypatch.setattr(parse_jobs.requests, "post", fake_post)
+        jobs = launcher.jobs
+        job = jobs.submit(PDF_DATA, "a.pdf", "marker", callback_url="https://hook/1")
+        jobs.submit(PDF_DATA, "a.pdf", "marker", callback_url="https://hook/2")
+        assert calls == []
+
+        launcher.run_all()
+        assert [url for url, _ in calls] == ["https://hook/1", "https://hook/2"]
+        assert calls[0][1]["job_id"] == job["job_id"]
+        assert calls[0][1]["result"]["markdown"] == "# a.pdf"
+
+        jobs.submit(PDF_DATA, "a.pdf", "marker", callback_url="https://hook/3")
+        assert calls[-1][0] == "https://hook/3"
+        assert calls[-1][1]["status"] == JOB_SUCCEEDED
+
+    def test_wait(self):
+        """wait() returns the result of a finished job, None on timeout"""
+        jobs = ParseJobs({}, launch=lambda *args: jobs.run(*args, parse=stand_in_parse))
+        job = jobs.submit(PDF_DATA, "a.pdf", "marker")
+        assert jobs.wait(job["job_id"], timeout=1)["markdown"] == "# a.pdf"
+
+        pending = ParseJobs({}, launch=lambda *args: None)
+        job = pending.submit(PDF_DATA, "a.pdf", "marker")
+        assert pending.wait(job["job_id"], timeout=0.05, poll_interval=0.01) is None
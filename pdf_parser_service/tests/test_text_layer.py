@@ -0,0 +1,47 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from text_layer import blocks_to_markdown, page_runs, text_quality
+import pytest
+
+BODY = "Body text of the paper, long enough to set the body font size for the page. " * 3
+
+
+@pytest.mark.parametrize("text, quality", [
+    ("", (0, 0.0)),
+    ("  \n\t", (0, 0.0)),
+    ("ab c", (3, 1.0)),
+    # replacement characters and control characters are unreadable
+    ("a\ufffd", (2, 0.5)),
+    ("ab\x00d", (4, 0.75)),
+    ("能量 模型", (4, 1.0)),
+])
+def test_text_quality(text, quality):
+    assert text_quality(text) == quality
+
+
+@pytest.mark.parametrize("flags, runs", [
+    ([], []),
+    ([False], [(1, 1, False)]),
+    ([True, True, True], [(1, 3, True)]),
+    ([True, True, False, True], [(1, 2, True), (3, 3, False), (4, 4, True)]),
+])
+def test_page_runs(flags, runs):
+    assert page_runs(flags) == runs
+
+
+@pytest.mark.parametrize("blocks, markdown", [
+    ([], ""),
+    # larger fonts become headings, largest first; page numbers are dropped
+    ([(0, "Paper Title", 20), (0, BODY, 10), (0, "1 Introduction", 14), (0, BODY, 10), (0, "12", 10)],
+     f"# Paper Title\n\n{BODY}\n\n## 1 Introduction\n\n{BODY}"),
+    # same size as the body: paragraph
+    ([(0, "Short line", 10), (0, BODY, 10)], f"Short line\n\n{BODY}"),
+    # large but too long for a heading
+    ([(0, "x" * 201, 20), (0, BODY * 2, 10)], "x" * 201 + f"\n\n{BODY * 2}"),
+    # heading levels are capped at HEADING_MAX_LEVELS
+    ([(0, "H1", 24), (0, "H2", 20), (0, "H3", 16), (0, "H4", 13), (0, BODY, 10)],
+     f"# H1\n\n## H2\n\n### H3\n\n### H4\n\n{BODY}"),
+])
+def test_blocks_to_markdown(blocks, markdown):
+    assert blocks_to_markdown(blocks) == markdown
@@ -0,0 +1,153 @@
+"""
+CPU fast path for born-digital PDFs
+
+Reads the embedded text layer instead of running layout/OCR models:
+- detect_text_layer() checks quickly (pypdfium2) whether enough pages carry clean text;
+  page_text_layer_flags() gives the same check per page (used for selective OCR)
+- extract_text_layer_markdown() rebuilds paragraphs and headings from pdftext spans,
+  using font size relative to the body text to pick heading levels
+Both libraries already ship with marker-pdf.
+"""
+import os
+import re
+import time
+import unicodedata
+from collections import Counter
+
+# 一页至少多少个非空白字符才算有文本层
+TEXT_LAYER_MIN_CHARS_PER_PAGE = int(os.environ.get("TEXT_LAYER_MIN_CHARS_PER_PAGE", "200"))
+# 有文本层的页占比达到多少才走快速路径
+TEXT_LAYER_MIN_COVERAGE = float(os.environ.get("TEXT_LAYER_MIN_COVERAGE", "0.9"))
+# 可读字符占比，低于此值视为乱码 (缺字体映射的PDF常见)
+TEXT_LAYER_MIN_CLEAN_RATIO = 0.9
+
+# 字号比正文大多少算标题，以及最多几级标题
+HEADING_SIZE_RATIO = 1.15
+HEADING_MAX_CHARS = 200
+HEADING_MAX_LEVELS = 3
+
+PAGE_NUMBER_PATTERN = re.compile(r"^\s*(page\s*)?\d{1,4}\s*$", re.IGNORECASE)
+
+
+def text_quality(text: str) -> tuple:
+    """(non-whitespace char count, share of those that are readable)"""
+    chars = [char for char in text if not char.isspace()]
+    if not chars:
+        return 0, 0.0
+    bad = sum(
+        1 for char in chars
+        if char == "\ufffd" or unicodedata.category(char) in ("Co", "Cc", "Cn")
+    )
+    return len(chars), 1 - bad / len(chars)
+
+
+def page_text_layer_flags(pdf_data: bytes) -> list:
+    """One bool per page: True when the page carries enough clean text to skip OCR"""
+    import pypdfium2 as pdfium
+
+    document = pdfium.PdfDocument(pdf_data)
+    flags = []
+    try:
+        for page_index in range(len(document)):
+            page = document[page_index]
+            textpage = page.get_textpage()
+            char_count, clean_ratio = text_quality(textpage.get_text_range())
+            textpage.close()
+            page.close()
+            flags.append(char_count >= TEXT_LAYER_MIN_CHARS_PER_PAGE and clean_ratio >= TEXT_LAYER_MIN_CLEAN_RATIO)
+    finally:
+        document.close()
+    return flags
+
+
+def page_runs(flags: list) -> list:
+    """Group consecutive pages with the same flag: [(first_page, last_page, flag)], 1-based inclusive"""
+    runs = []
+    for page_number, flag in enumerate(flags, start=1):
+        if runs and runs[-1][2] == flag:
+            runs[-1] = (runs[-1][0], page_number, flag)
+        else:
+            runs.append((page_number, page_number, flag))
+    return runs
+
+
+def detect_text_layer(pdf_data: bytes) -> dict:
+    """Text layer coverage of the document; usable=True when the CPU path should be taken"""
+    start_time = time.time()
+    flags = page_text_layer_flags(pdf_data)
+    page_count = len(flags)
+    text_pages = sum(flags)
+
+    coverage = text_pages / page_count if page_count else 0.0
+    return {
+        "pages": page_count,
+        "text_pages": text_pages,
+        "coverage": coverage,
+        "usable": page_count > 0 and coverage >= TEXT_LAYER_MIN_COVERAGE,
+        "detect_time": time.time() - start_time,
+    }
+
+
+def _join_lines(lines: list) -> str:
+    """Join wrapped lines into one paragraph, undoing end-of-line hyphenation"""
+    text = ""
+    for line in lines:
+        if text.endswith("-") and line[:1].islower():
+            text = text[:-1] + line
+        elif text:
+            text += " " + line
+        else:
+            text = line
+    return text
+
+
+def _read_blocks(pages: list) -> list:
+    """[(page_index, block text, dominant font size)] from pdftext dictionary output"""
+    blocks = []
+    for page_index, page in enumerate(pages):
+        for block in page["blocks"]:
+            lines = []
+            size_chars = Counter()
+            for line in block["lines"]:
+                line_text = "".join(span["text"] for span in line["spans"]).strip()
+                if line_text:
+                    lines.append(line_text)
+                for span in line["spans"]:
+                    size_chars[round(span["font"]["size"] or 0, 1)] += len(span["text"].strip())
+            if lines:
+                blocks.append((page_index, _join_lines(lines), size_chars.most_common(1)[0][0]))
+    return blocks
+
+
+def blocks_to_markdown(blocks: list) -> str:
+    """Paragraphs and headings from (page_index, text, font size) blocks"""
+    size_chars = Counter()
+    for _, text, size in blocks:
+        size_chars[size] += len(text)
+    if not size_chars:
+        return ""
+    body_size = size_chars.most_common(1)[0][0]
+
+    def is_heading(text, size):
+        return size >= body_size * HEADING_SIZE_RATIO and len(text) <= HEADING_MAX_CHARS
+
+    heading_sizes = sorted({size for _, text, size in blocks if is_heading(text, size)}, reverse=True)
+    heading_levels = {size: min(index + 1, HEADING_MAX_LEVELS) for index, size in enumerate(heading_sizes)}
+
+    paragraphs = []
+    for _, text, size in blocks:
+        if PAGE_NUMBER_PATTERN.match(text):
+            continue
+        if is_heading(text, size):
+            paragraphs.append("#" * heading_levels[size] + " " + text)
+        else:
+            paragraphs.append(text)
+    return "\n\n".join(paragraphs)
+
+
+def extract_text_layer_markdown(pdf_path: str) -> tuple:
+    """(markdown, page count) from the PDF text layer"""
+    from pdftext.extraction import dictionary_output
+
+    pages = dictionary_output(pdf_path, sort=True)
+    return blocks_to_markdown(_read_blocks(pages)), len(pages)
@@ -0,0 +1,147 @@
+"""
+Shared pooled HTTP client for the workflow's outbound calls
+
+One requests.Session per worker process, so calls to the same host (Modal parser,
+Modal metadata agent, papers API, FastGPT, R2) reuse keep-alive connections
+instead of opening a new TCP+TLS connection per request.
+- at most HTTP_POOL_MAXSIZE connections per host, extra callers wait for a free one
+- every call names its endpoint, which picks the (connect, read) timeout
+- post_multipart() streams file parts from disk, files are never read into memory
+"""
+import os
+import threading
+import uuid
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+HTTP_POOL_CONNECTIONS = int(os.environ.get("HTTP_POOL_CONNECTIONS", "16"))  # hosts kept in the pool
+HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "16"))  # connections per host
+MULTIPART_CHUNK_SIZE = 1024 * 1024
+
+# (connect, read) timeouts in seconds per endpoint
+ENDPOINT_TIMEOUTS = {
+    "r2": (10, 60),
+    "parser_submit": (10, 120),
+    "parser_poll": (10, 60),
+    "metadata_agent": (10, 600),
+    "papers_api": (10, 120),
+    "fastgpt": (10, 300),
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Process-wide session, created on first use"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE, pool_block=True)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def request(method: str, url: str, endpoint: str, **kwargs) -> requests.Response:
+    kwargs.setdefault("timeout", ENDPOINT_TIMEOUTS[endpoint])
+    return get_session().request(method, url, **kwargs)
+
+
+def get(url: str, endpoint: str, **kwargs) -> requests.Response:
+    return request("GET", url, endpoint, **kwargs)
+
+
+def head(url: str, endpoint: str, **kwargs) -> requests.Response:
+    return request("HEAD", url, endpoint, **kwargs)
+
+
+def post(url: str, endpoint: str, **kwargs) -> requests.Response:
+    return request("POST", url, endpoint, **kwargs)
+
+
+def patch(url: str, endpoint: str, **kwargs) -> requests.Response:
+    return request("PATCH", url, endpoint, **kwargs)
+
+
+def _field_values(value) -> list:
+    """Same expansion as requests' data= for multipart: lists repeat the field, None is dropped"""
+    values = value if isinstance(value, (list, tuple)) else [value]
+    return [str(v).encode("utf-8") if not isinstance(v, bytes) else v for v in values if v is not None]
+
+
+def _quote(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', "%22").replace("\r", "%0D").replace("\n", "%0A")
+
+
+class StreamingMultipartBody:
+    """
+    multipart/form-data body read part by part
+    fields: {name: value}, files: {name: (filename, file_path, content_type or None)}
+    Content-Length is known up front from the file sizes; each file is open only while it is sent
+    """
+
+    def __init__(self, fields: dict, files: dict):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self._parts = []
+        for name, value in fields.items():
+            for field_value in _field_values(value):
+                header = f'--{self.boundary}\r\nContent-Disposition: form-data; name="{_quote(name)}"\r\n\r\n'
+                self._parts.append(header.encode("utf-8") + field_value + b"\r\n")
+        for name, (filename, file_path, content_type) in files.items():
+            header = f'--{self.boundary}\r\nContent-Disposition: form-data; name="{_quote(name)}"; filename="{_quote(filename)}"\r\n'
+            if content_type:
+                header += f"Content-Type: {content_type}\r\n"
+            header += "\r\n"
+            self._parts.extend([header.encode("utf-8"), file_path, b"\r\n"])
+        self._parts.append(f"--{self.boundary}--\r\n".encode("utf-8"))
+
+        self.len = sum(os.path.getsize(part) if isinstance(part, str) else len(part) for part in self._parts)
+        self._chunks = self._iter_chunks()
+        self._buffer = b""
+        self._offset = 0
+
+    def _iter_chunks(self):
+        for part in self._parts:
+            if isinstance(part, str):
+                with open(part, "rb") as f:
+                    for chunk in iter(lambda: f.read(MULTIPART_CHUNK_SIZE), b""):
+                        yield chunk
+            else:
+                yield part
+
+    def __len__(self) -> int:
+        return self.len
+
+    def read(self, size: int = -1) -> bytes:
+        data = []
+        remaining = size
+        while remaining != 0:
+            if self._offset >= len(self._buffer):
+                self._buffer, self._offset = next(self._chunks, b""), 0
+                if not self._buffer:
+                    break
+            end = len(self._buffer) if remaining < 0 else min(len(self._buffer), self._offset + remaining)
+            data.append(self._buffer[self._offset:end])
+            if remaining > 0:
+                remaining -= end - self._offset
+            self._offset = end
+        return b"".join(data)
+
+    def close(self) -> None:
+        """Close the file being sent, if the upload stopped half way"""
+        self._chunks.close()
+
+
+def post_multipart(url: str, endpoint: str, fields: dict, files: dict, headers: Optional[dict] = None) -> requests.Response:
+    """POST a streamed multipart body, see StreamingMultipartBody for fields/files"""
+    body = StreamingMultipartBody(fields, files)
+    try:
+        return post(url, endpoint, data=body, headers={**(headers or {}), "Content-Type": body.content_type})
+    finally:
+        body.close()
@@ -8,6 +8,7 @@ from dotenv import load_dotenv
 # from prefect_getting_started import prefect_getting_started
 from hello_world import hello_world
 from workflow_handle_pdf import workflow_handle_pdf_to_db_and_fastgpt
+from workflow_batch_pdf import workflow_batch_handle_pdfs_to_db_and_fastgpt
 
 def main():
 
@@ -25,8 +26,13 @@ def main():
         name="zeabur-deploy-workflow-handle-pdf-to-db-and-fastgpt",
         concurrency_limit=5
         )
+    # one run ingests a whole drop; stage concurrency is set inside the flow (BATCH_*_CONCURRENCY)
+    workflow_batch_handle_pdfs_deploy = workflow_batch_handle_pdfs_to_db_and_fastgpt.to_deployment(
+        name="zeabur-deploy-workflow-batch-handle-pdfs-to-db-and-fastgpt",
+        concurrency_limit=2
+        )
     hello_world_deploy = hello_world.to_deployment(name="zeabur-deploy-hello-world")
-    serve(workflow_handle_pdf_to_db_and_fastgpt_deploy, hello_world_deploy)
+    serve(workflow_handle_pdf_to_db_and_fastgpt_deploy, workflow_batch_handle_pdfs_deploy, hello_world_deploy)
 
 
 if __name__ == "__main__":
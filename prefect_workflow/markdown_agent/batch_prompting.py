@@ -0,0 +1,124 @@
+"""
+Several documents per LLM call for metadata extraction
+
+Short documents (.md / .rst / .ipynb backfills) are trimmed, packed into one
+prompt and answered with one structured output listing a PaperMetadataSchema
+per document. Batch size adapts to document length: documents are packed
+until BATCH_PROMPT_MAX_TOKENS or BATCH_MAX_DOCUMENTS is reached. Every
+element is validated; only the documents whose element is missing or invalid
+are re-issued, in new batches, and the last round sends them one by one.
+
+The LLM is an injected async call_llm(prompt) -> raw text, so the whole
+procedure runs against a local mock (see benchmark_batch_prompting.py).
+"""
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+from .heuristic_metadata import estimate_tokens, trim_markdown_for_llm
+from .llm_output import coerce_metadata, parse_llm_json
+from .md_paper_metadata_agent import PaperMetadataSchema
+
+BATCH_PROMPT_MAX_TOKENS = 12000
+BATCH_MAX_DOCUMENTS = 20
+# per document, so one long document cannot take the whole batch
+BATCH_DOCUMENT_MAX_TOKENS = 2000
+BATCH_MAX_ROUNDS = 3
+BATCH_MAX_CONCURRENCY = 4
+
+DOCUMENT_HEADER = "=== DOCUMENT {index} ==="
+
+
+def plan_batches(documents: dict, max_batch_tokens: int = BATCH_PROMPT_MAX_TOKENS, max_batch_size: int = BATCH_MAX_DOCUMENTS) -> list:
+    """Greedy packing of {index: trimmed text} into lists of indexes under the token and size limits"""
+    batches = []
+    batch, batch_tokens = [], 0
+    for index, text in documents.items():
+        tokens = estimate_tokens(text)
+        if batch and (batch_tokens + tokens > max_batch_tokens or len(batch) >= max_batch_size):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(index)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def build_batch_prompt(documents: dict, batch: list) -> str:
+    return "\n\n".join(f"{DOCUMENT_HEADER.format(index=index)}\n{documents[index]}" for index in batch)
+
+
+def parse_batch_output(raw_output: str, batch: list) -> dict:
+    """
+    {index: metadata dict with every schema field} for the elements of the batch that are present
+    and coerce to the schema; null is the instructed answer for anything not found, so null
+    required fields (e.g. no authors in a .rst page) are accepted, only uncoercible values are not
+    """
+    try:
+        # a truncated answer still yields the elements before the cut
+        papers = parse_llm_json(raw_output)
+    except ValueError:
+        return {}
+    if isinstance(papers, dict):
+        papers = papers.get("papers", [])
+
+    valid = {}
+    for paper in papers if isinstance(papers, list) else []:
+        if not isinstance(paper, dict) or paper.get("index") not in batch or paper["index"] in valid:
+            continue
+        metadata, invalid_fields = coerce_metadata(paper)
+        if invalid_fields:
+            continue
+        valid[paper["index"]] = {name: metadata.get(name) for name in PaperMetadataSchema.model_fields}
+    return valid
+
+
+async def extract_metadata_batched(
+    markdown_contents: list,
+    call_llm: Callable[[str], Awaitable[str]],
+    max_batch_tokens: int = BATCH_PROMPT_MAX_TOKENS,
+    max_batch_size: int = BATCH_MAX_DOCUMENTS,
+    max_rounds: int = BATCH_MAX_ROUNDS,
+    max_concurrency: int = BATCH_MAX_CONCURRENCY,
+) -> tuple:
+    """
+    (results, stats): results[i] is the metadata dict of markdown_contents[i], or None
+    if it never came back valid; stats counts calls, re-issued documents and tokens sent
+    """
+    documents = {
+        index: trim_markdown_for_llm(markdown, max_tokens=BATCH_DOCUMENT_MAX_TOKENS)
+        for index, markdown in enumerate(markdown_contents)
+    }
+    results: list = [None] * len(markdown_contents)
+    stats = {"documents": len(documents), "calls": 0, "reissued": 0, "failed": 0, "tokens_sent": 0}
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_batch(batch: list) -> dict:
+        prompt = build_batch_prompt(documents, batch)
+        stats["calls"] += 1
+        stats["tokens_sent"] += estimate_tokens(prompt)
+        async with semaphore:
+            try:
+                raw_output = await call_llm(prompt)
+            except Exception as e:
+                print(f"batch call failed, {len(batch)} documents to re-issue: {e=}")
+                return {}
+        return parse_batch_output(raw_output, batch)
+
+    pending = dict(documents)
+    for round_number in range(max_rounds):
+        if not pending:
+            break
+        # the last round sends the stubborn documents one by one
+        batch_size = 1 if round_number == max_rounds - 1 else max_batch_size
+        batches = plan_batches(pending, max_batch_tokens, batch_size)
+        for batch_results in await asyncio.gather(*(run_batch(batch) for batch in batches)):
+            for index, metadata in batch_results.items():
+                results[index] = metadata
+                pending.pop(index, None)
+        if pending and round_number < max_rounds - 1:
+            stats["reissued"] += len(pending)
+            print(f"round {round_number + 1}: {len(pending)} documents invalid or missing, re-issuing")
+
+    stats["failed"] = len(pending)
+    return results, stats
@@ -0,0 +1,74 @@
+"""
+Packed vs one-call-per-document metadata extraction against a local mock LLM
+
+run from prefect_workflow/: python -m markdown_agent.benchmark_batch_prompting --documents 500
+
+The mock answers after CALL_LATENCY_SECONDS + tokens * TOKEN_LATENCY_SECONDS and
+drops or corrupts a fraction of the elements, so the re-issue path is exercised too.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+
+from .batch_prompting import DOCUMENT_HEADER, extract_metadata_batched
+from .heuristic_metadata import estimate_tokens
+
+CALL_LATENCY_SECONDS = 0.5
+TOKEN_LATENCY_SECONDS = 0.00002
+
+DOCUMENT_HEADER_PATTERN = re.compile("^" + re.escape(DOCUMENT_HEADER).replace(r"\{index\}", r"(\d+)") + "$", re.MULTILINE)
+
+
+def make_documents(count: int, seed: int = 0) -> list:
+    """Short markdown documents of varying length, like a docs / notebook backfill"""
+    rng = random.Random(seed)
+    documents = []
+    for i in range(count):
+        body = " ".join(rng.choice(["energy", "model", "potential", "training", "atoms", "density"]) for _ in range(rng.randint(50, 1500)))
+        documents.append(f"# Document {i}\n\nAuthors: Author {i}\n\nPublished 2024\n\n## Abstract\n\n{body}\n")
+    return documents
+
+
+class MockLLM:
+    """Async call_llm returning one element per "=== DOCUMENT i ===" block; drop_rate of them missing or invalid"""
+
+    def __init__(self, drop_rate: float = 0.05, seed: int = 0):
+        self.drop_rate = drop_rate
+        self.rng = random.Random(seed)
+
+    async def __call__(self, prompt: str) -> str:
+        await asyncio.sleep(CALL_LATENCY_SECONDS + estimate_tokens(prompt) * TOKEN_LATENCY_SECONDS)
+        papers = []
+        for index in DOCUMENT_HEADER_PATTERN.findall(prompt):
+            roll = self.rng.random()
+            if roll < self.drop_rate / 2:
+                continue
+            paper = {"index": int(index), "title": f"Document {index}", "authors": f"Author {index}", "year": 2024}
+            if roll < self.drop_rate:
+                paper["year"] = "soon"
+            papers.append(paper)
+        return json.dumps({"papers": papers})
+
+
+async def run_benchmark(documents: list, drop_rate: float, max_concurrency: int) -> dict:
+    results = {}
+    for mode, max_batch_size in (("per_document", 1), ("packed", None)):
+        kwargs = {"max_batch_size": max_batch_size} if max_batch_size else {}
+        start = time.perf_counter()
+        metadata, stats = await extract_metadata_batched(documents, MockLLM(drop_rate), max_concurrency=max_concurrency, **kwargs)
+        stats["seconds"] = round(time.perf_counter() - start, 2)
+        results[mode] = stats
+        print(f"{mode}: {stats}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--drop-rate", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(make_documents(args.documents), args.drop_rate, args.concurrency))
@@ -2,4 +2,13 @@ curl -X POST "https://yfb222333--paper-metadata-agent-analyze-paper-raw-llm-outp
   -H "Content-Type: application/json" \
   -d '{
     "markdown_content": "# AI Research Paper\nAuthors: Alice, Bob\nYear: 2024\nThis is a test paper about artificial intelligence."
-  }'
\ No newline at end of file
+  }'
+
+curl -X POST "https://yfb222333--paper-metadata-agent-analyze-papers-batch.modal.run" \
+  -H "Content-Type: application/json" \
+  -d '{
+    "documents": [
+      {"markdown_content": "# AI Research Paper\nAuthors: Alice, Bob\nYear: 2024"},
+      {"markdown_content": "# Another Paper\nAuthors: Carol\nYear: 2023", "fields": ["authors", "year"]}
+    ]
+  }'
@@ -0,0 +1,269 @@
+"""
+Deterministic paper metadata extraction from markdown
+
+Fills the PaperMetadataSchema fields from YAML front matter, headings and
+regexes over the title page, each with a confidence in [0, 1]. The workflow
+asks the LLM only for fields below HEURISTIC_CONFIDENCE_THRESHOLD, and sends
+it trim_markdown_for_llm() instead of the whole document: front matter, title
+page, abstract and identifier lines first, up to a token budget.
+"""
+import os
+import re
+from typing import Optional
+
+HEURISTIC_VERSION = "1"
+HEURISTIC_CONFIDENCE_THRESHOLD = 0.75
+
+# 标题页: 摘要之前的部分，最多这么多字符
+TITLE_PAGE_MAX_CHARS = 4000
+ABSTRACT_MAX_CHARS = 3000
+REFERENCES_MAX_CHARS = 2000
+# LLM input budget, in estimated tokens
+METADATA_INPUT_TOKEN_BUDGET = int(os.environ.get("METADATA_INPUT_TOKEN_BUDGET", "3000"))
+CHARS_PER_TOKEN = 4
+REGION_SEPARATOR = "\n\n[...]\n\n"
+
+METADATA_FIELDS = ("title", "authors", "year", "abstract", "doi", "journal", "keywords", "url", "arxiv_id")
+
+FRONT_MATTER_PATTERN = re.compile(r"\A---\s*\n(.*?)\n---\s*\n", re.DOTALL)
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$", re.MULTILINE)
+DOI_PATTERN = re.compile(r"\b(10\.\d{4,9}/[^\s\"'<>\]\[(){}]+)", re.IGNORECASE)
+ARXIV_PATTERN = re.compile(
+    r"(?:arxiv\s*:\s*|arxiv\.org/(?:abs|pdf)/)((?:\d{4}\.\d{4,5}|[a-z\-]+(?:\.[A-Z]{2})?/\d{7}))(v\d+)?",
+    re.IGNORECASE,
+)
+YEAR_PATTERN = re.compile(r"\b(19[5-9]\d|20\d\d)\b")
+DATED_YEAR_PATTERN = re.compile(
+    r"(?:©|\(c\)|copyright|published(?: online)?|accepted|received|submitted)[^\n]{0,40}?\b(19[5-9]\d|20\d\d)\b",
+    re.IGNORECASE,
+)
+ABSTRACT_LINE_PATTERN = re.compile(r"^\W{0,4}abstract\W{0,4}\s*[:.\-—]?\s*(.+)$", re.IGNORECASE | re.MULTILINE)
+KEYWORDS_PATTERN = re.compile(r"^\W{0,4}(?:key\s*words|index terms)\W{0,4}\s*[:.\-—]+\s*(.+)$", re.IGNORECASE | re.MULTILINE)
+REFERENCES_HEADING_PATTERN = re.compile(r"^#{1,6}\s*(?:\d+\.?\s*)?(?:references|bibliography|literature cited)\b", re.IGNORECASE | re.MULTILINE)
+
+# 这些标题不是论文题目
+NON_TITLE_HEADINGS = re.compile(
+    r"^(abstract|introduction|contents|table of contents|references|acknowledg\w*|keywords|preprint|article|research article)\b",
+    re.IGNORECASE,
+)
+NAME_PATTERN = re.compile(r"^[A-Z][\w'\-\.]*(?:\s+[A-Z][\w'\-\.]*){1,3}$")
+AFFILIATION_MARKS = re.compile(r"<sup>.*?</sup>|\$\^\{?[^$]*\}?\$")
+
+
+def field(value, confidence: float) -> dict:
+    return {"value": value, "confidence": confidence if value not in (None, "") else 0.0}
+
+
+def _clean(text: str) -> str:
+    """Strip markdown emphasis, links and extra whitespace"""
+    text = re.sub(r"!\[[^\]]*\]\([^)]*\)", "", text)
+    text = re.sub(r"\[([^\]]*)\]\([^)]*\)", r"\1", text)
+    text = re.sub(r"[*_`]+", "", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def parse_front_matter(markdown: str) -> dict:
+    """Flat `key: value` pairs of a YAML front matter block (no YAML dependency)"""
+    match = FRONT_MATTER_PATTERN.match(markdown)
+    if not match:
+        return {}
+    values = {}
+    key = None
+    for line in match.group(1).splitlines():
+        item = re.match(r"^\s+-\s+(.+)$", line)
+        if item and key:
+            values.setdefault(key, [])
+            if isinstance(values[key], list):
+                values[key].append(item.group(1).strip().strip("\"'"))
+            continue
+        pair = re.match(r"^([A-Za-z_][\w\-]*)\s*:\s*(.*)$", line)
+        if pair:
+            key = pair.group(1).lower()
+            value = pair.group(2).strip().strip("\"'")
+            if value:
+                values[key] = value
+    return values
+
+
+def split_regions(markdown: str) -> dict:
+    """Title page, abstract and references regions of the document body"""
+    body = FRONT_MATTER_PATTERN.sub("", markdown, count=1)
+    references = REFERENCES_HEADING_PATTERN.search(body)
+    main = body[:references.start()] if references else body
+    references_text = body[references.start():] if references else ""
+
+    abstract = ""
+    abstract_start = len(main)
+    for heading in HEADING_PATTERN.finditer(main):
+        if re.match(r"^\W*abstract\W*$", _clean(heading.group(2)), re.IGNORECASE):
+            next_heading = HEADING_PATTERN.search(main, heading.end())
+            abstract_end = next_heading.start() if next_heading else len(main)
+            abstract = main[heading.end():abstract_end].strip()
+            abstract_start = heading.start()
+            break
+    else:
+        line = ABSTRACT_LINE_PATTERN.search(main[:TITLE_PAGE_MAX_CHARS * 2])
+        if line:
+            paragraph_end = main.find("\n\n", line.start())
+            abstract = line.group(1) + main[line.end():paragraph_end if paragraph_end != -1 else len(main)]
+            abstract_start = line.start()
+
+    return {
+        "title_page": main[:min(abstract_start, TITLE_PAGE_MAX_CHARS)],
+        "abstract": abstract.strip(),
+        "main": main,
+        "references": references_text,
+    }
+
+
+def _find_title(title_page: str) -> dict:
+    headings = [(len(match.group(1)), _clean(match.group(2))) for match in HEADING_PATTERN.finditer(title_page)]
+    headings = [(level, text) for level, text in headings if 10 <= len(text) <= 300 and not NON_TITLE_HEADINGS.match(text)]
+    if not headings:
+        return field(None, 0.0)
+    top_level = min(level for level, _ in headings)
+    title = next(text for level, text in headings if level == top_level)
+    return field(title, 0.85 if top_level == 1 else 0.7)
+
+
+def _find_authors(title_page: str, title: Optional[str]) -> dict:
+    """
+    Name-like lines right after the title; a clean name block directly under an H1
+    title is the usual paper layout and trusted, anything looser stays low confidence
+    """
+    raw_lines = title_page.splitlines()
+    lines = [_clean(re.sub(r"^#+\s*", "", line)) for line in raw_lines]
+    under_h1 = False
+    if title and title in lines:
+        title_index = lines.index(title)
+        under_h1 = raw_lines[title_index].lstrip().startswith("# ")
+        lines = lines[title_index + 1:]
+    names = []
+    block_start = None
+    for position, line in enumerate(line for line in lines[:8] if line):
+        if "@" in line:
+            continue
+        line = AFFILIATION_MARKS.sub("", line)
+        candidates = [re.sub(r"[\d\*†‡§¶]+$", "", part).strip() for part in re.split(r",|\band\b|;|&", line)]
+        candidates = [candidate for candidate in candidates if candidate]
+        if candidates and all(NAME_PATTERN.match(candidate) for candidate in candidates):
+            if not names:
+                block_start = position
+            names.extend(candidates)
+        elif names:
+            break
+    if not names:
+        return field(None, 0.0)
+    return field(", ".join(names), 0.8 if under_h1 and block_start == 0 else 0.6)
+
+
+def _find_year(title_page: str, arxiv_id: Optional[str]) -> dict:
+    # received / accepted / published: the latest one is the publication year
+    dated = DATED_YEAR_PATTERN.findall(title_page)
+    if dated:
+        return field(int(max(dated)), 0.8)
+    if arxiv_id and re.match(r"^\d{4}\.", arxiv_id):
+        return field(2000 + int(arxiv_id[:2]), 0.8)
+    years = YEAR_PATTERN.findall(title_page)
+    if years:
+        return field(int(max(set(years), key=years.count)), 0.4)
+    return field(None, 0.0)
+
+
+def extract_metadata_heuristics(markdown: str) -> dict:
+    """{field: {"value": ..., "confidence": 0..1}} for every PaperMetadataSchema field"""
+    regions = split_regions(markdown)
+    front_matter = parse_front_matter(markdown)
+    title_page = regions["title_page"]
+    # identifiers of the paper itself, not of the cited works
+    head = regions["main"][:TITLE_PAGE_MAX_CHARS * 2]
+
+    doi = DOI_PATTERN.search(head)
+    doi = field(doi.group(1).rstrip(".,;:").lower() if doi else None, 0.9)
+    arxiv = ARXIV_PATTERN.search(head)
+    arxiv_id = field(arxiv.group(1) if arxiv else None, 0.9)
+    title = _find_title(title_page)
+    keywords = KEYWORDS_PATTERN.search(head)
+    abstract = regions["abstract"]
+    keywords_in_abstract = KEYWORDS_PATTERN.search(abstract)
+    if keywords_in_abstract:
+        abstract = abstract[:keywords_in_abstract.start()]
+
+    metadata = {
+        "title": title,
+        "authors": _find_authors(title_page, title["value"]),
+        "year": _find_year(title_page, arxiv_id["value"]),
+        "abstract": field(_clean(abstract)[:ABSTRACT_MAX_CHARS] or None, 0.85),
+        "doi": doi,
+        "journal": field(None, 0.0),
+        "keywords": field(_clean(keywords.group(1)).rstrip(".") if keywords else None, 0.85),
+        "url": field(
+            f"https://arxiv.org/abs/{arxiv_id['value']}" if arxiv_id["value"] else (f"https://doi.org/{doi['value']}" if doi["value"] else None),
+            0.8,
+        ),
+        "arxiv_id": arxiv_id,
+    }
+
+    # front matter is explicit, it wins over everything found in the text
+    front_matter_keys = {
+        "title": ("title",), "authors": ("authors", "author"), "year": ("year", "date"),
+        "abstract": ("abstract", "description"), "doi": ("doi",), "journal": ("journal", "venue", "booktitle"),
+        "keywords": ("keywords", "tags"), "url": ("url",), "arxiv_id": ("arxiv_id", "arxiv", "eprint"),
+    }
+    for name, keys in front_matter_keys.items():
+        value = next((front_matter[key] for key in keys if key in front_matter), None)
+        if isinstance(value, list):
+            value = ", ".join(value)
+        if name == "year" and value:
+            year = YEAR_PATTERN.search(value)
+            value = int(year.group(1)) if year else None
+        if value:
+            metadata[name] = field(value, 0.95)
+    return metadata
+
+
+def low_confidence_fields(heuristic_metadata: dict, fields=METADATA_FIELDS, threshold: float = HEURISTIC_CONFIDENCE_THRESHOLD) -> list:
+    return [name for name in fields if heuristic_metadata[name]["confidence"] < threshold]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (no tokenizer needed), good enough for budgeting"""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def metadata_regions(markdown: str) -> list:
+    """Regions of the document that carry bibliographic data, most metadata-dense first"""
+    regions = split_regions(markdown)
+    front_matter = FRONT_MATTER_PATTERN.match(markdown)
+    abstract_heading = "## Abstract\n\n" if regions["abstract"] else ""
+    # DOI / arXiv / keywords / dates lines outside the title page and abstract
+    identifier_lines = [
+        line for line in regions["main"].splitlines()
+        if (DOI_PATTERN.search(line) or ARXIV_PATTERN.search(line) or KEYWORDS_PATTERN.match(line) or DATED_YEAR_PATTERN.search(line))
+        and line not in regions["title_page"] and line not in regions["abstract"]
+    ]
+    # the heading outline says what a non-paper document is about
+    outline = [match.group(0) for match in HEADING_PATTERN.finditer(regions["main"])]
+    return [
+        front_matter.group(0) if front_matter else "",
+        regions["title_page"],
+        abstract_heading + regions["abstract"][:ABSTRACT_MAX_CHARS],
+        "\n".join(identifier_lines),
+        "\n".join(outline),
+        regions["references"][:REFERENCES_MAX_CHARS],
+    ]
+
+
+def trim_markdown_for_llm(markdown: str, max_tokens: int = METADATA_INPUT_TOKEN_BUDGET) -> str:
+    """The metadata-dense regions of the document, in priority order, up to max_tokens"""
+    if estimate_tokens(markdown) <= max_tokens:
+        return markdown
+    budget_chars = max_tokens * CHARS_PER_TOKEN
+    selected = []
+    for region in metadata_regions(markdown):
+        region = region.strip()
+        remaining = budget_chars - sum(len(section) + len(REGION_SEPARATOR) for section in selected)
+        if not region or remaining <= 0 or any(region in section for section in selected):
+            continue
+        selected.append(region[:remaining])
+    return REGION_SEPARATOR.join(selected)
@@ -0,0 +1,176 @@
+"""
+Tolerant parsing of LLM JSON output
+
+Common defects are repaired locally instead of paying for a new LLM call:
+- markdown fences and prose before / after the JSON
+- trailing commas, single-quoted strings, Python None / True / False
+- truncated output: the unfinished last value is dropped and open objects are closed
+Metadata is then checked field by field against PaperMetadataSchema, with light
+coercion (year given as a string, authors given as a list, "N/A" for null), and
+the fields that are still missing are reported so only those are asked again.
+"""
+import json
+import re
+from typing import Optional
+
+from pydantic import TypeAdapter, ValidationError
+
+from .md_paper_metadata_agent import PaperMetadataSchema
+
+YEAR_PATTERN = re.compile(r"\b(1[5-9]\d{2}|20\d{2})\b")
+NULL_STRINGS = {"", "null", "none", "n/a", "na", "unknown", "not available", "not found"}
+PYTHON_LITERALS = {"None": "null", "True": "true", "False": "false"}
+
+
+def _strip_trailing_comma(out: list) -> None:
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def repair_json_text(text: str) -> str:
+    """
+    Best-effort valid JSON from the first object/array in text
+    Raises ValueError if there is no object or array at all
+    """
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        raise ValueError(f"no JSON object in LLM output: {text[:200]!r}")
+
+    out = []
+    closers = []
+    # out positions the output can be cut back to if it ends truncated
+    cut_points = []
+    quote = None
+    escaped = False
+    i = min(starts)
+    while i < len(text):
+        ch = text[i]
+        if quote:
+            if escaped:
+                escaped = False
+                out.append(ch)
+            elif ch == "\\" and text[i + 1:i + 2] == "'":
+                # \' is not a JSON escape, the apostrophe needs none
+                out.append("'")
+                i += 1
+            elif ch == "\\":
+                escaped = True
+                out.append(ch)
+            elif ch == quote:
+                quote = None
+                out.append('"')
+            elif ch == '"':
+                out.append('\\"')
+            elif ch == "\n":
+                out.append("\\n")
+            else:
+                out.append(ch)
+        elif ch in "\"'":
+            quote = ch
+            out.append('"')
+        elif ch in "{[":
+            closers.append("}" if ch == "{" else "]")
+            out.append(ch)
+            cut_points.append(len(out))
+        elif ch in "}]":
+            _strip_trailing_comma(out)
+            closers.pop()
+            out.append(ch)
+            if not closers:
+                # anything after the outermost value is prose or a fence
+                break
+        elif ch == ",":
+            cut_points.append(len(out))
+            out.append(ch)
+        elif ch.isalpha():
+            # \w like isalpha(), so non-ASCII letters are matched too
+            word = re.match(r"\w+", text[i:]).group(0)
+            out.append(PYTHON_LITERALS.get(word, word))
+            i += len(word)
+            continue
+        else:
+            out.append(ch)
+        i += 1
+
+    if closers:
+        # truncated: keep the last value only if it is certainly complete
+        tail = "".join(out[cut_points[-1]:]).strip() if cut_points else ""
+        complete = not quote and tail.endswith(('"', "}", "]")) and (closers[-1] == "]" or ":" in tail)
+        if not complete and cut_points:
+            del out[cut_points[-1]:]
+        _strip_trailing_comma(out)
+        out.extend(reversed(closers))
+    return "".join(out)
+
+
+def parse_llm_json(text: str):
+    """json.loads with local repair of the usual LLM output defects"""
+    try:
+        return json.loads(text.strip())
+    except json.JSONDecodeError:
+        pass
+    repaired = repair_json_text(text)
+    try:
+        result = json.loads(repaired)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"unrepairable LLM output: {e}: {text[:200]!r}") from e
+    print(f"repaired LLM JSON output: {len(text)} -> {len(repaired)} chars")
+    return result
+
+
+def _coerce_value(name: str, value, annotation):
+    if isinstance(value, str) and value.strip().lower() in NULL_STRINGS:
+        return None
+    if isinstance(value, list) and annotation in (str, Optional[str]):
+        # string fields given as lists, e.g. authors
+        return ", ".join(str(v).strip() for v in value if v) or None
+    if name == "year" and isinstance(value, str):
+        match = YEAR_PATTERN.search(value)
+        return int(match.group(1)) if match else value
+    if name == "year" and isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def coerce_metadata(obj: dict, schema=PaperMetadataSchema) -> tuple:
+    """
+    (metadata, invalid_fields): the schema fields present in obj, coerced and validated
+    one by one; fields whose value cannot be coerced are set to None and reported
+    """
+    metadata, invalid_fields = {}, []
+    for name, field in schema.model_fields.items():
+        if name not in obj:
+            continue
+        value = obj[name]
+        try:
+            value = _coerce_value(name, value, field.annotation)
+            metadata[name] = None if value is None else TypeAdapter(field.annotation).validate_python(value)
+        except ValidationError:
+            metadata[name] = None
+            invalid_fields.append(name)
+    return metadata, invalid_fields
+
+
+def parse_paper_metadata_output(raw_output: str, fields: Optional[list] = None, schema=PaperMetadataSchema) -> tuple:
+    """
+    (metadata, missing_fields) from raw LLM output
+    missing_fields: the requested fields (default all) that are required by the schema but absent
+    or null, or whose value could not be coerced; an absent or null optional field means "not found"
+    and is not asked again
+    Raises ValueError if no JSON object can be recovered
+    """
+    obj = parse_llm_json(raw_output)
+    if isinstance(obj, list) and len(obj) == 1:
+        obj = obj[0]
+    if not isinstance(obj, dict):
+        raise ValueError(f"LLM output is not a JSON object: {raw_output[:200]!r}")
+
+    metadata, invalid_fields = coerce_metadata(obj, schema)
+    required = [name for name, field in schema.model_fields.items() if field.is_required()]
+    missing_fields = [
+        name for name in (fields or schema.model_fields)
+        if name in invalid_fields or (name in required and metadata.get(name) is None)
+    ]
+    return metadata, missing_fields
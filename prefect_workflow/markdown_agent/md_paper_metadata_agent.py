@@ -67,6 +67,33 @@ If the document is not a paper, please summarize the content, generate the most
 Output only valid JSON.
 """
 
+class IndexedPaperMetadataSchema(PaperMetadataSchema):
+    index: int = Field(description="Number of the document this metadata belongs to")
+
+
+class PaperMetadataBatchSchema(BaseModel):
+    papers: list[IndexedPaperMetadataSchema] = Field(description="Metadata of every document, one entry per document")
+
+
+md_paper_metadata_batch_agent_instruction = \
+"""\
+You are an academic paper metadata agent. You will be given several documents, each starting
+with a line "=== DOCUMENT <index> ===". Extract the bibliographic information of every document
+separately, never mix information between documents.
+For information not found in a document, use null.
+If a document is not a paper, summarize it and generate the most suitable title, year and abstract.
+
+Return one entry per document, with its index:
+{
+  "papers": [
+    {"index": 0, "title": "...", "authors": "...", "year": 2024, "abstract": "...", "doi": null,
+     "journal": null, "keywords": "...", "url": null, "arxiv_id": null}
+  ]
+}
+
+Output only valid JSON.
+"""
+
 md_paper_metadata_agent = LlmAgent(
     name="md_paper_metadata_agent",
     model=MODEL,
@@ -78,6 +105,16 @@ md_paper_metadata_agent = LlmAgent(
     # tools=[read_markdown_file]
 )
 
+md_paper_metadata_batch_agent = LlmAgent(
+    name="md_paper_metadata_batch_agent",
+    model=MODEL,
+    description="Extract structured metadata from several documents in one call",
+    instruction=md_paper_metadata_batch_agent_instruction,
+    output_schema=PaperMetadataBatchSchema,
+    disallow_transfer_to_parent=True,
+    disallow_transfer_to_peers=True,
+)
+
 
 #%% 
 # Modal deployment code
@@ -88,84 +125,182 @@ import json
 app = modal.App("paper-metadata-agent")
 
 # Define the image with required dependencies
+# deploy from prefect_workflow/: modal deploy -m markdown_agent.md_paper_metadata_agent
 image = modal.Image.debian_slim(python_version="3.11").pip_install([
     "google-generativeai",
     "google-ai-generativelanguage", 
     "google-adk",
     "pydantic",
-])
+]).add_local_python_source("markdown_agent")
 
 
 
-@app.function(
-    image=image,
-    secrets=[modal.Secret.from_name("google-api-key")],
-    timeout=300,
-)
-@modal.fastapi_endpoint(method="POST")
-async def analyze_paper_raw_llm_output(request_data: dict):
+class MetadataAgentRunner:
     """
-    HTTP endpoint to get raw LLM output (no parsing)
-    Expected input: {"markdown_content": "..."}
+    Agent, session service and Runner built once and shared by all requests;
+    each request runs in its own short-lived session
     """
-    from google.adk.runners import Runner
-    from google.adk.sessions import InMemorySessionService
-    from google.genai import types
-    
-    # Get input data
-    markdown_content = request_data.get("markdown_content", "")
-    
-    if not markdown_content:
-        return {"success": False, "error": "No markdown content provided"}
-    
-    try:
-        # Initialize agent
-        APP_NAME = "md_paper_metadata_agent_app"
-        USER_ID = "modal_service_user"
-        SESSION_ID = "modal_session"
-        
-        session_service = InMemorySessionService()
-        session = await session_service.create_session(
-            app_name=APP_NAME, 
-            user_id=USER_ID, 
-            session_id=SESSION_ID
+    APP_NAME = "md_paper_metadata_agent_app"
+    USER_ID = "modal_service_user"
+
+    def __init__(self, agent=None, batch_agent=None):
+        from google.adk.runners import Runner
+        from google.adk.sessions import InMemorySessionService
+
+        self.session_service = InMemorySessionService()
+        self.runner = Runner(
+            agent=agent or md_paper_metadata_agent,
+            app_name=self.APP_NAME,
+            session_service=self.session_service
         )
-        runner = Runner(
-            agent=md_paper_metadata_agent, 
-            app_name=APP_NAME, 
-            session_service=session_service
+        self.batch_runner = Runner(
+            agent=batch_agent or md_paper_metadata_batch_agent,
+            app_name=self.APP_NAME,
+            session_service=self.session_service
         )
-        
-        # Run agent
 
+    async def _run(self, runner, text: str) -> tuple:
+        """(final response text, prompt token count or None) of one run in a fresh session"""
+        import uuid
+        from google.genai import types
 
-        # content = types.Content(
-        #     role='user',
-        #     parts=[types.Part(text=f"analyze {temp_file_path}")]
-        # )
+        session_id = uuid.uuid4().hex
+        await self.session_service.create_session(app_name=self.APP_NAME, user_id=self.USER_ID, session_id=session_id)
+        try:
+            content = types.Content(
+                role='user',
+                parts=[types.Part(text=text)]
+            )
+            async for event in runner.run_async(user_id=self.USER_ID, session_id=session_id, new_message=content):
+                if event.is_final_response() and event.content and event.content.parts:
+                    # prompt tokens as counted by the model, includes the instruction
+                    prompt_tokens = event.usage_metadata.prompt_token_count if event.usage_metadata else None
+                    return event.content.parts[0].text, prompt_tokens
+            return '', None
+        finally:
+            # sessions are one-shot, do not let them pile up in memory
+            await self.session_service.delete_session(app_name=self.APP_NAME, user_id=self.USER_ID, session_id=session_id)
+
+    async def analyze(self, markdown_content: str, fields: Optional[list] = None, max_input_tokens: Optional[int] = None) -> dict:
+        """Raw LLM output for one document, see analyze_paper_raw_llm_output"""
+        from markdown_agent.heuristic_metadata import METADATA_INPUT_TOKEN_BUDGET, estimate_tokens, trim_markdown_for_llm
+
+        if not markdown_content:
+            return {"success": False, "error": "No markdown content provided"}
+
+        # only the metadata-dense regions are sent, body text does not help and costs latency
+        max_input_tokens = int(max_input_tokens or METADATA_INPUT_TOKEN_BUDGET)
+        original_tokens = estimate_tokens(markdown_content)
+        markdown_content = trim_markdown_for_llm(markdown_content, max_tokens=max_input_tokens)
+        # fields the caller could not extract locally
+        if fields:
+            markdown_content = f"Focus on these fields: {', '.join(fields)}\n\n{markdown_content}"
+        input_tokens = {
+            "original": original_tokens,
+            "sent": estimate_tokens(markdown_content),
+            "budget": max_input_tokens,
+        }
+        print(f"metadata agent input tokens (estimated): {input_tokens=}")
+
+        raw_output, prompt_tokens = await self._run(self.runner, markdown_content)
+        if prompt_tokens is not None:
+            input_tokens["prompt_tokens"] = prompt_tokens
 
-        content = types.Content(
-            role='user',
-            parts=[types.Part(text=markdown_content )]
-        )
-        
-        events = runner.run_async(
-            user_id=USER_ID,
-            session_id=SESSION_ID,
-            new_message=content
-        )
-        
-        # Get response
-        raw_output = ''
-        async for event in events:
-            if event.is_final_response() and event.content and event.content.parts:
-                raw_output = event.content.parts[0].text
-                break
-        
         return {
             "success": True,
-            "raw_output": raw_output
+            "raw_output": raw_output,
+            "input_tokens": input_tokens
         }
-        
-    finally:
-        pass
\ No newline at end of file
+
+    async def analyze_batch(self, documents: list, max_concurrency: int = 8) -> list:
+        """analyze() for each {"markdown_content", "fields", "max_input_tokens"}, results in input order"""
+        import asyncio
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def analyze_one(document: dict) -> dict:
+            async with semaphore:
+                try:
+                    return await self.analyze(
+                        document.get("markdown_content", ""),
+                        fields=document.get("fields"),
+                        max_input_tokens=document.get("max_input_tokens")
+                    )
+                except Exception as e:
+                    return {"success": False, "error": str(e)}
+
+        return await asyncio.gather(*(analyze_one(document) for document in documents))
+
+    async def analyze_packed(self, documents: list) -> tuple:
+        """
+        Several documents per LLM call (see batch_prompting); results shaped like analyze()'s,
+        raw_output being the validated metadata as JSON. Returns (results, stats)
+        """
+        from markdown_agent.batch_prompting import extract_metadata_batched
+
+        async def call_llm(prompt: str) -> str:
+            raw_output, _ = await self._run(self.batch_runner, prompt)
+            return raw_output
+
+        batch_metadata, stats = await extract_metadata_batched(
+            [document.get("markdown_content", "") for document in documents],
+            call_llm
+        )
+        results = [
+            {"success": True, "raw_output": json.dumps(metadata)} if metadata is not None
+            else {"success": False, "error": "no valid metadata after re-issuing"}
+            for metadata in batch_metadata
+        ]
+        print(f"packed metadata batch: {stats=}")
+        return results, stats
+
+
+# 每个容器同时处理的请求数，LLM调用基本都在等网络
+METADATA_AGENT_MAX_CONCURRENT_INPUTS = int(os.environ.get("METADATA_AGENT_MAX_CONCURRENT_INPUTS", "32"))
+METADATA_AGENT_BATCH_CONCURRENCY = 8
+# 批量接口每次最多的文档数，工作流的METADATA_PACKED_REQUEST_SIZE不能超过它
+METADATA_AGENT_BATCH_MAX_DOCUMENTS = 200
+
+
+@app.cls(
+    image=image,
+    secrets=[modal.Secret.from_name("google-api-key")],
+    timeout=300,
+)
+@modal.concurrent(max_inputs=METADATA_AGENT_MAX_CONCURRENT_INPUTS)
+class PaperMetadataAgentService:
+
+    @modal.enter()
+    def load_runner(self):
+        self.agent_runner = MetadataAgentRunner()
+
+    # label keeps the URL of the former module-level endpoint
+    @modal.fastapi_endpoint(method="POST", label="paper-metadata-agent-analyze-paper-raw-llm-output")
+    async def analyze_paper_raw_llm_output(self, request_data: dict):
+        """
+        HTTP endpoint to get raw LLM output (no parsing)
+        Expected input: {"markdown_content": "...", "fields": [...] (optional), "max_input_tokens": int (optional)}
+        """
+        return await self.agent_runner.analyze(
+            request_data.get("markdown_content", ""),
+            fields=request_data.get("fields"),
+            max_input_tokens=request_data.get("max_input_tokens")
+        )
+
+    @modal.fastapi_endpoint(method="POST", label="paper-metadata-agent-analyze-papers-batch")
+    async def analyze_papers_batch(self, request_data: dict):
+        """
+        Raw LLM output for many documents in one request
+        Expected input: {"documents": [{"markdown_content": "...", "fields": [...]}, ...], "mode": "parallel" | "packed"}
+        parallel: one LLM call per document; packed: several trimmed documents per LLM call (short documents)
+        Returns {"success": true, "results": [...]} in input order, each result as from analyze_paper_raw_llm_output
+        """
+        documents = request_data.get("documents") or []
+        mode = request_data.get("mode", "parallel")
+        if len(documents) > METADATA_AGENT_BATCH_MAX_DOCUMENTS:
+            return {"success": False, "error": f"at most {METADATA_AGENT_BATCH_MAX_DOCUMENTS} documents per batch"}
+        if mode == "packed":
+            results, stats = await self.agent_runner.analyze_packed(documents)
+            return {"success": True, "results": results, "stats": stats}
+        results = await self.agent_runner.analyze_batch(documents, max_concurrency=METADATA_AGENT_BATCH_CONCURRENCY)
+        return {"success": True, "results": results}
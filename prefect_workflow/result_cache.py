@@ -0,0 +1,147 @@
+"""
+Content-addressed result cache on local disk
+
+Stores JSON results (PDF parse output, LLM metadata, ...) under a key derived
+from the input content hash and whatever else changes the result (engine,
+engine version, model, prompt). Size-bounded with LRU eviction and optional TTL.
+StageCheckpoints builds flow-stage checkpoints on the same store.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Optional
+
+RESULT_CACHE_DIR = os.environ.get(
+    "RESULT_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "ai4s-papers-workflow")
+)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def calculate_file_md5(file_path: str) -> str:
+    """MD5 of a file, read in chunks"""
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def make_cache_key(*parts: str) -> str:
+    """Combine key parts (content hash, engine, version, ...) into one file-safe key"""
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+class DiskResultCache:
+    """
+    JSON results stored one file per key in cache_dir/namespace
+    - get() refreshes the entry mtime, so mtime order is LRU order
+    - set() evicts least recently used entries once max_bytes is exceeded
+    - entries older than ttl_seconds (if set) are treated as missing
+    """
+
+    def __init__(self, namespace: str, max_bytes: int, ttl_seconds: Optional[float] = None, cache_dir: str = RESULT_CACHE_DIR):
+        self.cache_dir = os.path.join(cache_dir, namespace)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[dict]:
+        """Cached value or None"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if self.ttl_seconds is not None and time.time() - entry['created_at'] > self.ttl_seconds:
+            self.delete(key)
+            return None
+
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        return entry['value']
+
+    def set(self, key: str, value: dict) -> None:
+        """Store value atomically, then evict down to max_bytes"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({"created_at": time.time(), "value": value}, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self.evict()
+
+    def delete(self, key: str) -> None:
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self) -> int:
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith('.json'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+            removed += 1
+        return removed
+
+
+class StageCheckpoints:
+    """
+    Durable per-stage results of one input, keyed by its content hash
+    A rerun asks first_incomplete_stage() and reuses get() for the stages before it
+    stage_key_parts: {stage: (...)} whatever else a stage's result depends on (engine, version, URL);
+    they key that stage and every later one, so a change invalidates everything downstream
+    """
+
+    def __init__(self, cache: DiskResultCache, content_hash: str, stages: tuple, stage_key_parts: Optional[dict] = None):
+        self.cache = cache
+        self.content_hash = content_hash
+        self.stages = stages
+        self.stage_key_parts = stage_key_parts or {}
+
+    def _key(self, stage: str) -> str:
+        parts = []
+        for previous_stage in self.stages[:self.stages.index(stage) + 1]:
+            parts.extend(self.stage_key_parts.get(previous_stage, ()))
+        return make_cache_key(self.content_hash, "checkpoint", stage, *parts)
+
+    def get(self, stage: str) -> Optional[dict]:
+        return self.cache.get(self._key(stage))
+
+    def set(self, stage: str, value: dict) -> None:
+        self.cache.set(self._key(stage), value)
+        print(f"checkpoint saved: {self.content_hash=} {stage=}")
+
+    def first_incomplete_stage(self) -> Optional[str]:
+        """First stage without a checkpoint, None when every stage is done"""
+        for stage in self.stages:
+            if self.get(stage) is None:
+                return stage
+        return None
@@ -0,0 +1,165 @@
+"""
+Streaming download of origin files from R2
+
+- the body is written to disk in chunks and hashed on the way, memory stays bounded
+- the MD5 is checked against the object ETag (single-part uploads only)
+- an interrupted transfer resumes with a Range request instead of starting over,
+  as long as the server answers with the range that was asked for
+- objects over DOWNLOAD_MAX_BYTES are refused
+- download workdirs live under DOWNLOAD_DIR and the oldest ones are removed
+  once they use more than DOWNLOAD_DISK_BUDGET_BYTES
+"""
+import base64
+import binascii
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import time
+from typing import Optional
+
+import requests
+
+import http_client
+
+DOWNLOAD_DIR = os.environ.get("DOWNLOAD_DIR", os.path.join(tempfile.gettempdir(), "ai4s-papers-downloads"))
+DOWNLOAD_MAX_BYTES = int(os.environ.get("DOWNLOAD_MAX_BYTES", str(512 * 1024**2)))
+DOWNLOAD_DISK_BUDGET_BYTES = int(os.environ.get("DOWNLOAD_DISK_BUDGET_BYTES", str(10 * 1024**3)))
+# workdirs touched more recently than this may belong to a running flow and are never evicted
+DOWNLOAD_WORKDIR_MIN_AGE_SECONDS = float(os.environ.get("DOWNLOAD_WORKDIR_MIN_AGE_SECONDS", "3600"))
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_MAX_RESUMES = 3
+
+# network errors after which the transfer is resumed
+RESUMABLE_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+
+class DownloadError(RuntimeError):
+    pass
+
+
+def parse_md5_from_etag(etag: Optional[str]) -> Optional[str]:
+    """
+    Normalize an R2/S3 ETag or event md5 checksum to a hex MD5
+    Multipart ETags ("<hash>-<parts>") are not the file MD5 and return None
+    """
+    if not etag:
+        return None
+    etag = etag.strip().strip('"')
+    if re.fullmatch(r'[0-9a-fA-F]{32}', etag):
+        return etag.lower()
+    # base64 encoded 16-byte digest
+    try:
+        digest = base64.b64decode(etag, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    return digest.hex() if len(digest) == 16 else None
+
+
+def _check_size(size: int, max_bytes: int, url: str) -> None:
+    if size > max_bytes:
+        raise DownloadError(f"object larger than {max_bytes} bytes: {url} ({size} bytes)")
+
+
+def _content_range_start(response) -> Optional[int]:
+    """First byte of a 206 answer from "Content-Range: bytes <start>-<end>/<total>", None if absent"""
+    match = re.match(r'bytes (\d+)-', response.headers.get('Content-Range', ''))
+    return int(match.group(1)) if match else None
+
+
+def stream_download(url: str, file_path: str, max_bytes: int = DOWNLOAD_MAX_BYTES, max_resumes: int = DOWNLOAD_MAX_RESUMES) -> dict:
+    """
+    Stream url into file_path, hashing as it is written
+    Returns {"md5", "size", "etag_md5", "resumes"}; raises DownloadError on a
+    bad status, an oversized object or an MD5 that does not match the ETag
+    """
+    md5 = hashlib.md5()
+    size = 0
+    etag_md5 = None
+    resumes = 0
+
+    with open(file_path, 'wb') as f:
+        while True:
+            headers = {'Range': f'bytes={size}-'} if size else {}
+            try:
+                with http_client.get(url, "r2", headers=headers, stream=True) as response:
+                    if response.status_code not in (200, 206):
+                        raise DownloadError(f"download failed: {url} HTTP {response.status_code}")
+                    range_start = _content_range_start(response) if response.status_code == 206 else 0
+                    if size and range_start != size:
+                        # server ignored the Range header or sent another range, start over
+                        print(f"range not honoured ({range_start=}, expected {size}), restarting download: {url=}")
+                        f.seek(0)
+                        f.truncate()
+                        md5 = hashlib.md5()
+                        size = 0
+                        if range_start != 0:
+                            # this body does not begin at byte 0 either, ask again without a Range
+                            continue
+                    if not size:
+                        etag_md5 = parse_md5_from_etag(response.headers.get('ETag'))
+                    content_length = response.headers.get('Content-Length')
+                    if content_length:
+                        _check_size(size + int(content_length), max_bytes, url)
+
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+                        md5.update(chunk)
+                        size += len(chunk)
+                        _check_size(size, max_bytes, url)
+                break
+            except RESUMABLE_ERRORS as e:
+                if resumes >= max_resumes:
+                    raise DownloadError(f"download interrupted {resumes + 1} times: {url}: {e}") from e
+                resumes += 1
+                print(f"download interrupted at {size} bytes, resuming ({resumes}/{max_resumes}): {e=}")
+
+    file_md5 = md5.hexdigest()
+    if etag_md5 and file_md5 != etag_md5:
+        raise DownloadError(f"md5 mismatch for {url}: downloaded {file_md5}, ETag {etag_md5}")
+    return {"md5": file_md5, "size": size, "etag_md5": etag_md5, "resumes": resumes}
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def enforce_disk_budget(budget_bytes: int = DOWNLOAD_DISK_BUDGET_BYTES, download_dir: str = DOWNLOAD_DIR, min_age_seconds: float = DOWNLOAD_WORKDIR_MIN_AGE_SECONDS) -> int:
+    """Remove the least recently touched workdirs until the total fits the budget, returns how many were removed"""
+    if not os.path.isdir(download_dir):
+        return 0
+    workdirs = []
+    for entry in os.scandir(download_dir):
+        if entry.is_dir(follow_symlinks=False):
+            workdirs.append((entry.stat().st_mtime, _dir_size(entry.path), entry.path))
+    workdirs.sort()
+
+    total_bytes = sum(size for _, size, _ in workdirs)
+    removed = 0
+    now = time.time()
+    for mtime, size, path in workdirs:
+        if total_bytes <= budget_bytes:
+            break
+        if now - mtime < min_age_seconds:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total_bytes -= size
+        removed += 1
+    if removed:
+        print(f"enforce_disk_budget: removed {removed} workdirs, {total_bytes} bytes left in {download_dir}")
+    return removed
+
+
+def make_download_workdir(prefix: str = 's3_object_download_', download_dir: str = DOWNLOAD_DIR) -> str:
+    """New workdir under download_dir, after making room within the disk budget"""
+    os.makedirs(download_dir, exist_ok=True)
+    enforce_disk_budget(download_dir=download_dir)
+    return tempfile.mkdtemp(prefix=prefix, dir=download_dir)
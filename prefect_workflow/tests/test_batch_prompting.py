@@ -0,0 +1,91 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import asyncio
+import json
+from markdown_agent.batch_prompting import extract_metadata_batched, parse_batch_output, plan_batches
+from markdown_agent.benchmark_batch_prompting import DOCUMENT_HEADER_PATTERN, make_documents
+import pytest
+
+
+def test_plan_batches_adapts_to_length():
+    """Short documents share a batch, long ones get fewer companions"""
+    documents = {0: "a" * 400, 1: "a" * 400, 2: "a" * 400, 3: "a" * 3800, 4: "a" * 400}
+
+    assert plan_batches(documents, max_batch_tokens=1000, max_batch_size=10) == [[0, 1, 2], [3], [4]]
+    assert plan_batches(documents, max_batch_tokens=10000, max_batch_size=2) == [[0, 1], [2, 3], [4]]
+
+
+def test_parse_batch_output_validates_each_element():
+    """Uncoercible, foreign and duplicate elements are dropped, valid ones kept"""
+    raw_output = "```json\n" + json.dumps({"papers": [
+        {"index": 0, "title": "A", "authors": "X", "year": 2024},
+        {"index": 1, "title": "B", "authors": "Y", "year": "soon"},
+        {"index": 7, "title": "C", "authors": "Z", "year": 2020},
+        {"index": 0, "title": "A again", "authors": "X", "year": 2024},
+    ]}) + "\n```"
+
+    valid = parse_batch_output(raw_output, [0, 1])
+
+    assert list(valid) == [0]
+    assert valid[0]["title"] == "A"
+    assert parse_batch_output("not json", [0]) == {}
+
+
+def test_parse_batch_output_accepts_null_required_fields():
+    """A non-paper document without authors is answered with null, which is final, not re-issued"""
+    raw_output = json.dumps({"papers": [{"index": 0, "title": "Install guide", "authors": None, "year": "N/A"}]})
+
+    valid = parse_batch_output(raw_output, [0])
+
+    assert valid[0]["title"] == "Install guide"
+    assert (valid[0]["authors"], valid[0]["year"], valid[0]["doi"]) == (None, None, None)
+
+    async def call_llm(prompt: str) -> str:
+        return json.dumps({"papers": [
+            {"index": int(index), "title": f"Page {index}", "authors": None, "year": None}
+            for index in DOCUMENT_HEADER_PATTERN.findall(prompt)
+        ]})
+
+    results, stats = asyncio.run(extract_metadata_batched(make_documents(2), call_llm))
+    assert [result["title"] for result in results] == ["Page 0", "Page 1"]
+    assert (stats["calls"], stats["reissued"], stats["failed"]) == (1, 0, 0)
+
+
+def test_extract_metadata_batched_reissues_only_failed():
+    """Documents missing from a batch answer are re-issued; the others are not sent again"""
+    prompts = []
+
+    async def call_llm(prompt: str) -> str:
+        prompts.append(prompt)
+        indexes = [int(index) for index in DOCUMENT_HEADER_PATTERN.findall(prompt)]
+        # document 2 is dropped the first time it is seen
+        first_time = sum("=== DOCUMENT 2 ===" in p for p in prompts) == 1
+        papers = [
+            {"index": index, "title": f"Document {index}", "authors": "A", "year": 2024}
+            for index in indexes if not (index == 2 and first_time)
+        ]
+        return json.dumps({"papers": papers})
+
+    results, stats = asyncio.run(extract_metadata_batched(make_documents(5), call_llm, max_batch_size=5))
+
+    assert [result["title"] for result in results] == [f"Document {i}" for i in range(5)]
+    assert (stats["calls"], stats["reissued"], stats["failed"]) == (2, 1, 0)
+    assert DOCUMENT_HEADER_PATTERN.findall(prompts[1]) == ["2"]
+
+
+def test_extract_metadata_batched_gives_up_after_max_rounds():
+    """A document that never validates ends as None, failed calls do not raise"""
+    async def call_llm(prompt: str) -> str:
+        if "Document 1" in prompt and len(DOCUMENT_HEADER_PATTERN.findall(prompt)) == 1:
+            raise RuntimeError("LLM unavailable")
+        return json.dumps({"papers": [
+            {"index": int(index), "title": "T", "authors": "A", "year": 2024}
+            for index in DOCUMENT_HEADER_PATTERN.findall(prompt) if index != "1"
+        ]})
+
+    results, stats = asyncio.run(extract_metadata_batched(make_documents(3), call_llm, max_rounds=2))
+
+    assert results[1] is None
+    assert results[0] and results[2]
+    assert stats["failed"] == 1
@@ -0,0 +1,121 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from markdown_agent.heuristic_metadata import estimate_tokens, extract_metadata_heuristics, low_confidence_fields, trim_markdown_for_llm
+import pytest
+
+PAPER_MARKDOWN = """# DeePMD-kit: A deep learning package for many-body potential energy representation
+
+Han Wang<sup>1</sup>, Linfeng Zhang<sup>2</sup>, Jiequn Han<sup>2</sup> and Weinan E<sup>2,3</sup>
+
+1 Institute of Applied Physics and Computational Mathematics, Beijing
+han_wang@iapcm.ac.cn
+
+Received 12 December 2017; accepted 2 March 2018
+
+arXiv:1712.03641v2 · https://doi.org/10.1016/j.cpc.2018.03.016.
+
+## Abstract
+
+Recent developments in many-body potential energy representation via deep learning
+have brought new hopes to addressing the accuracy-versus-efficiency dilemma.
+
+**Keywords:** many-body potential energy, deep learning, molecular dynamics
+
+## 1 Introduction
+
+""" + "Molecular dynamics text. " * 2000 + """
+
+## References
+
+1. Behler J, Parrinello M. Phys Rev Lett 2007. doi:10.1103/PhysRevLett.98.146401
+"""
+
+
+def test_extracts_title_page_fields():
+    metadata = extract_metadata_heuristics(PAPER_MARKDOWN)
+    values = {name: item["value"] for name, item in metadata.items()}
+
+    assert values["title"] == "DeePMD-kit: A deep learning package for many-body potential energy representation"
+    assert values["authors"] == "Han Wang, Linfeng Zhang, Jiequn Han, Weinan E"
+    assert values["year"] == 2018
+    assert values["doi"] == "10.1016/j.cpc.2018.03.016"
+    assert values["arxiv_id"] == "1712.03641"
+    assert values["abstract"].startswith("Recent developments")
+    assert values["abstract"].endswith("dilemma.")
+    assert values["keywords"] == "many-body potential energy, deep learning, molecular dynamics"
+    # a clean name block directly under the H1 title is trusted
+    assert low_confidence_fields(metadata, fields=("title", "authors", "year", "abstract", "doi")) == []
+    # names further down the page are only a guess
+    loose = extract_metadata_heuristics(LOOSE_AUTHORS_MARKDOWN)
+    assert loose["authors"]["value"] == "Han Wang, Linfeng Zhang, Jiequn Han, Weinan E"
+    assert low_confidence_fields(loose, fields=("title", "authors", "year")) == ["authors"]
+
+
+def test_front_matter_wins():
+    markdown = "---\ntitle: Notes on DP-GEN\nauthors:\n  - Alice\n  - Bob\ndate: 2023-05-01\n---\n\n# Something else entirely\n\nbody"
+    metadata = extract_metadata_heuristics(markdown)
+    assert metadata["title"] == {"value": "Notes on DP-GEN", "confidence": 0.95}
+    assert metadata["authors"]["value"] == "Alice, Bob"
+    assert metadata["year"]["value"] == 2023
+    # cited DOIs are not the paper's own
+    assert extract_metadata_heuristics("# A title that is long enough\n\n## References\n\ndoi:10.1/xyz")["doi"]["value"] is None
+
+# names separated from the title by another line, so authors stay uncertain
+LOOSE_AUTHORS_MARKDOWN = PAPER_MARKDOWN.replace("\n\nHan Wang", "\n\nPreprint submitted to Elsevier\n\nHan Wang", 1)
+
+
+def test_trim_markdown_for_llm():
+    trimmed = trim_markdown_for_llm(PAPER_MARKDOWN)
+    assert len(trimmed) < len(PAPER_MARKDOWN) / 4
+    assert trimmed.startswith("# DeePMD-kit")
+    assert "Behler J, Parrinello M" in trimmed
+    assert trim_markdown_for_llm("# Short\n\ntext") == "# Short\n\ntext"
+
+
+@pytest.mark.parametrize("max_tokens", [50, 200, 1000])
+def test_trim_respects_token_budget(max_tokens):
+    """Regions are taken in priority order: title page before abstract before references"""
+    trimmed = trim_markdown_for_llm(PAPER_MARKDOWN, max_tokens=max_tokens)
+    assert estimate_tokens(trimmed) <= max_tokens
+    assert trimmed.startswith("# DeePMD-kit")
+    assert ("Recent developments" in trimmed) == (max_tokens >= 200)
+    assert ("Behler J" in trimmed) == (max_tokens >= 1000)
+
+
+def test_llm_only_for_uncertain_fields(monkeypatch):
+    import workflow_handle_pdf
+
+    calls = []
+
+    def request_paper_metadata_from_agent(markdown_content, modal_markdown_metadata_agent_url, fields):
+        calls.append((len(markdown_content), fields))
+        return {"title": "LLM title", "authors": "H. Wang, L. Zhang, J. Han, W. E", "year": 2017}
+
+    monkeypatch.setattr(workflow_handle_pdf, "request_paper_metadata_from_agent", request_paper_metadata_from_agent)
+    metadata = workflow_handle_pdf.generate_paper_metadata(LOOSE_AUTHORS_MARKDOWN)
+
+    assert len(calls) == 1
+    assert calls[0][0] < len(PAPER_MARKDOWN) / 4
+    assert "authors" in calls[0][1] and "title" not in calls[0][1]
+    # confident heuristic values are kept, the LLM fills the rest
+    assert metadata["title"].startswith("DeePMD-kit")
+    assert metadata["year"] == 2018
+    assert metadata["authors"] == "H. Wang, L. Zhang, J. Han, W. E"
+
+    monkeypatch.setattr(workflow_handle_pdf, "METADATA_LLM_FIELDS", ("title", "year", "doi"))
+    workflow_handle_pdf.generate_paper_metadata(LOOSE_AUTHORS_MARKDOWN)
+    assert len(calls) == 1
+
+
+def test_typical_title_page_skips_llm(monkeypatch):
+    """H1 title, name block, dates and abstract: no LLM call with the default METADATA_LLM_FIELDS"""
+    import workflow_handle_pdf
+
+    calls = []
+    monkeypatch.setattr(workflow_handle_pdf, "request_paper_metadata_from_agent", lambda *args, **kwargs: calls.append(kwargs))
+    metadata = workflow_handle_pdf.generate_paper_metadata(PAPER_MARKDOWN)
+
+    assert calls == []
+    assert metadata["authors"] == "Han Wang, Linfeng Zhang, Jiequn Han, Weinan E"
+    assert metadata["year"] == 2018
@@ -0,0 +1,69 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import threading
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import http_client
+from http_client import StreamingMultipartBody
+import pytest
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    """Keep-alive server that echoes the client port and the multipart form it got"""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        message = BytesParser().parsebytes(f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body)
+        parts = [
+            f"{part.get_param('name', header='content-disposition')}={part.get_filename() or ''}:{part.get_payload(decode=True).decode()}"
+            for part in message.get_payload()
+        ]
+        reply = f"{self.client_address[1]}\n" + "\n".join(parts)
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), EchoHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+
+
+def test_multipart_streams_files_and_reuses_connection(server, tmp_path):
+    paper = tmp_path / "paper.md"
+    paper.write_text("# Title\n" + "x" * 3_000_000)
+    fields = {"title": "T", "authors": ["A", "B"], "doi": None}
+    files = {"markdown_file": ("paper.md", str(paper), "text/markdown")}
+
+    first = http_client.post_multipart(server, "papers_api", fields=fields, files=files).text.split("\n")
+    second = http_client.post_multipart(server, "papers_api", fields=fields, files=files).text.split("\n")
+
+    # same client port -> the pooled keep-alive connection was reused
+    assert first[0] == second[0]
+    assert first[1:4] == ["title=:T", "authors=:A", "authors=:B"]
+    assert first[4].startswith("markdown_file=paper.md:# Title")
+    assert len(first[5]) == 3_000_000
+
+
+def test_multipart_body_length_and_small_reads(tmp_path):
+    data = tmp_path / "a.pdf"
+    data.write_bytes(b"%PDF" * 1000)
+    body = StreamingMultipartBody({"engine": "marker"}, {"file": ('a "b".pdf', str(data), "application/pdf")})
+
+    chunks = []
+    while chunk := body.read(777):
+        chunks.append(chunk)
+    encoded = b"".join(chunks)
+
+    assert len(encoded) == len(body)
+    assert b'filename="a %22b%22.pdf"' in encoded
+    assert encoded.endswith(f"--{body.boundary}--\r\n".encode())
@@ -0,0 +1,74 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from unittest.mock import MagicMock
+from markdown_agent.llm_output import parse_llm_json, parse_paper_metadata_output
+import pytest
+
+
+@pytest.mark.parametrize("raw_output", [
+    '{"title": "T", "authors": "A", "year": 2024}',
+    '```json\n{"title": "T", "authors": "A", "year": 2024}\n```',
+    'Here is the metadata:\n```\n{"title": "T", "authors": "A", "year": 2024,}\n```\nLet me know if you need more.',
+    "{'title': 'T', 'authors': 'A', 'year': 2024, 'doi': None}",
+    '{"title": "T", "authors": "A", "year": 2024, "abstract": "We stud',
+])
+def test_parse_llm_json_repairs_common_defects(raw_output):
+    """Fences, prose, trailing commas, single quotes and a truncated last value are repaired locally"""
+    result = parse_llm_json(raw_output)
+
+    assert {name: result[name] for name in ("title", "authors", "year")} == {"title": "T", "authors": "A", "year": 2024}
+    assert "abstract" not in result
+
+
+def test_parse_llm_json_escaped_apostrophe():
+    """\\' inside single-quoted strings becomes a plain apostrophe"""
+    result = parse_llm_json("{'title': 'O\\'Brien study', 'year': 2020}")
+
+    assert result == {"title": "O'Brien study", "year": 2020}
+
+
+@pytest.mark.parametrize("raw_output", [
+    "I could not find any metadata in this document.",
+    '{"title": "x", é}',
+])
+def test_parse_llm_json_unrecoverable(raw_output):
+    """Only ValueError escapes, whatever the bareword"""
+    with pytest.raises(ValueError):
+        parse_llm_json(raw_output)
+
+
+def test_parse_paper_metadata_output_coerces_types():
+    """year as a string, authors as a list and "N/A" placeholders are coerced to the schema"""
+    raw_output = '{"title": "T", "authors": ["A", "B"], "year": "Published in 2021", "doi": "N/A", "journal": null}'
+
+    metadata, missing_fields = parse_paper_metadata_output(raw_output)
+
+    assert metadata == {"title": "T", "authors": "A, B", "year": 2021, "doi": None, "journal": None}
+    assert missing_fields == []
+
+
+def test_parse_paper_metadata_output_reports_missing_fields():
+    """Required fields cut off or unreadable are missing, absent optional fields are not"""
+    metadata, missing_fields = parse_paper_metadata_output('{"title": "T", "year": "unknown", "abstract": "X", "authors": "A', ["title", "authors", "year", "abstract"])
+
+    assert metadata == {"title": "T", "year": None, "abstract": "X"}
+    assert missing_fields == ["authors", "year"]
+
+
+def test_request_paper_metadata_reprompts_missing_fields_only(monkeypatch):
+    """A truncated answer costs one more request for the missing fields, not a task retry"""
+    import workflow_handle_pdf
+
+    outputs = iter([
+        '```json\n{"title": "T", "abstract": "Long abstract", "year": 20',
+        '{"title": "ignored", "authors": "A", "year": "2024"}',
+    ])
+    mock_post = MagicMock(side_effect=lambda *args, **kwargs: MagicMock(json=lambda: {"success": True, "raw_output": next(outputs)}))
+    monkeypatch.setattr(workflow_handle_pdf.http_client, "post", mock_post)
+
+    metadata = workflow_handle_pdf.request_paper_metadata_from_agent("# T", fields=["title", "authors", "year", "abstract"])
+
+    assert metadata == {"title": "T", "abstract": "Long abstract", "authors": "A", "year": 2024}
+    assert mock_post.call_count == 2
+    assert mock_post.call_args.kwargs["json"]["fields"] == ["authors", "year"]
@@ -0,0 +1,76 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import asyncio
+from typing import AsyncGenerator
+from google.adk.agents import BaseAgent
+from google.adk.events import Event
+from google.genai import types
+from markdown_agent.md_paper_metadata_agent import MetadataAgentRunner
+import pytest
+
+
+class EchoTitleAgent(BaseAgent):
+    """Local stand-in for the LLM agent: answers with the first line it was sent"""
+
+    async def _run_async_impl(self, ctx) -> AsyncGenerator[Event, None]:
+        text = ctx.user_content.parts[0].text
+        if "boom" in text:
+            raise RuntimeError("LLM unavailable")
+        await asyncio.sleep(0.05)
+        yield Event(
+            author=self.name,
+            invocation_id=ctx.invocation_id,
+            content=types.Content(role="model", parts=[types.Part(text=f'{{"title": "{text.splitlines()[0]}"}}')]),
+        )
+
+
+def test_runner_reused_across_concurrent_requests():
+    """One runner serves concurrent requests, each in its own session that is removed afterwards"""
+    agent_runner = MetadataAgentRunner(agent=EchoTitleAgent(name="echo"))
+
+    async def run():
+        return await asyncio.gather(*(agent_runner.analyze(f"# Paper {i}\n\nbody") for i in range(5)))
+
+    results = asyncio.run(run())
+    assert [result["raw_output"] for result in results] == [f'{{"title": "# Paper {i}"}}' for i in range(5)]
+    assert all(result["input_tokens"]["sent"] <= result["input_tokens"]["budget"] for result in results)
+    sessions = asyncio.run(agent_runner.session_service.list_sessions(app_name=MetadataAgentRunner.APP_NAME, user_id=MetadataAgentRunner.USER_ID))
+    assert sessions.sessions == []
+
+
+def test_analyze_batch_keeps_order_and_isolates_failures():
+    agent_runner = MetadataAgentRunner(agent=EchoTitleAgent(name="echo"))
+    documents = [
+        {"markdown_content": "# First"},
+        {"markdown_content": "boom"},
+        {"markdown_content": ""},
+        {"markdown_content": "# Last", "fields": ["authors"]},
+    ]
+
+    results = asyncio.run(agent_runner.analyze_batch(documents, max_concurrency=2))
+
+    assert results[0]["raw_output"] == '{"title": "# First"}'
+    assert results[1] == {"success": False, "error": "LLM unavailable"}
+    assert results[2]["success"] is False
+    assert results[3]["raw_output"] == '{"title": "Focus on these fields: authors"}'
+
+
+def test_batch_client_returns_per_document_errors(monkeypatch):
+    import workflow_handle_pdf
+    from unittest.mock import MagicMock
+
+    response = MagicMock()
+    response.json.return_value = {"success": True, "results": [
+        {"success": True, "raw_output": '```json\n{"title": "A"}\n```'},
+        {"success": False, "error": "LLM unavailable"},
+        {"success": True, "raw_output": "not json"},
+    ]}
+    mock_post = MagicMock(return_value=response)
+    monkeypatch.setattr(workflow_handle_pdf.http_client, "post", mock_post)
+
+    results = workflow_handle_pdf.request_paper_metadata_batch_from_agent([{"markdown_content": "# A"}] * 3)
+
+    assert mock_post.call_count == 1
+    assert results[0] == {"title": "A"}
+    assert isinstance(results[1], Exception) and isinstance(results[2], Exception)
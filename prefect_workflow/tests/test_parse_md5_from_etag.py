@@ -0,0 +1,24 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from workflow_handle_pdf import parse_md5_from_etag
+import pytest
+
+
+class TestParseMd5FromEtag:
+    """Test cases for parse_md5_from_etag function"""
+
+    def test_hex_etag(self):
+        """Quoted and bare hex ETags are normalized to lowercase md5"""
+        assert parse_md5_from_etag('"9E107D9D372BB6826BD81D3542A419D6"') == "9e107d9d372bb6826bd81d3542a419d6"
+        assert parse_md5_from_etag("9e107d9d372bb6826bd81d3542a419d6") == "9e107d9d372bb6826bd81d3542a419d6"
+
+    def test_base64_md5(self):
+        """Base64 encoded digests (event checksums) are converted to hex"""
+        assert parse_md5_from_etag("nhB9nTcrtoJr2B01QqQZ1g==") == "9e107d9d372bb6826bd81d3542a419d6"
+
+    def test_not_an_md5(self):
+        """Multipart ETags and empty values are not file md5s"""
+        assert parse_md5_from_etag('"9e107d9d372bb6826bd81d3542a419d6-3"') is None
+        assert parse_md5_from_etag("") is None
+        assert parse_md5_from_etag(None) is None
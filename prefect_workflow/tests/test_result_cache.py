@@ -0,0 +1,117 @@
+import sys
+import os
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from result_cache import DiskResultCache, make_cache_key
+import pytest
+
+
+class TestDiskResultCache:
+    """Test cases for DiskResultCache"""
+
+    def test_set_get(self, tmp_path):
+        """Stored values come back, unknown keys miss"""
+        cache = DiskResultCache("test", max_bytes=10**6, cache_dir=str(tmp_path))
+        key = make_cache_key("md5", "marker", "2.2.0")
+        cache.set(key, {"markdown": "# Title", "metadata": {"service": "marker-gpu"}})
+
+        assert cache.get(key) == {"markdown": "# Title", "metadata": {"service": "marker-gpu"}}
+        assert cache.get(make_cache_key("md5", "docling", "2.2.0")) is None
+
+    def test_lru_eviction(self, tmp_path):
+        """Least recently used entries are evicted once max_bytes is exceeded"""
+        cache = DiskResultCache("test", max_bytes=2500, cache_dir=str(tmp_path))
+        value = {"markdown": "x" * 1000}
+        cache.set("a", value)
+        cache.set("b", value)
+        # make "a" more recently used than "b"
+        os.utime(cache._path("b"), (time.time() - 100, time.time() - 100))
+        cache.get("a")
+        cache.set("c", value)
+
+        assert cache.get("a") == value
+        assert cache.get("b") is None
+        assert cache.get("c") == value
+
+    def test_ttl(self, tmp_path):
+        """Entries older than ttl_seconds are treated as missing"""
+        cache = DiskResultCache("test", max_bytes=10**6, ttl_seconds=0.01, cache_dir=str(tmp_path))
+        cache.set("a", {"v": 1})
+        time.sleep(0.05)
+        assert cache.get("a") is None
+
+
+def test_parse_pdf_file_to_markdown_uses_cache(tmp_path, monkeypatch):
+    """Second parse of the same PDF is served from the cache without calling Modal"""
+    import workflow_handle_pdf
+    from unittest.mock import MagicMock
+
+    cache = DiskResultCache("pdf_parse", max_bytes=10**6, cache_dir=str(tmp_path / "cache"))
+    monkeypatch.setattr(workflow_handle_pdf, "get_parse_cache", lambda: cache)
+    submit_response = MagicMock()
+    submit_response.json.return_value = {"job_id": "job-1", "status": "queued"}
+    mock_post = MagicMock(return_value=submit_response)
+    monkeypatch.setattr(workflow_handle_pdf.http_client, "post", mock_post)
+    result_response = MagicMock(status_code=200)
+    result_response.json.return_value = {"success": True, "markdown": "# Parsed", "metadata": {"service": "marker-gpu"}}
+    monkeypatch.setattr(workflow_handle_pdf.http_client, "get", MagicMock(return_value=result_response))
+
+    pdf_path = tmp_path / "paper.pdf"
+    pdf_path.write_bytes(b"%PDF-1.4 cached")
+
+    first = workflow_handle_pdf.parse_pdf_file_to_markdown(str(pdf_path), str(tmp_path))
+    second = workflow_handle_pdf.parse_pdf_file_to_markdown(str(pdf_path), str(tmp_path))
+
+    assert mock_post.call_count == 1
+    assert second["parser_metadata"]["cache"] == "hit"
+    with open(second["markdown_file_path"]) as f:
+        assert f.read() == "# Parsed"
+    assert first["markdown_file_path"] == second["markdown_file_path"]
+
+
+def test_request_pdf_parse_job_polls_until_finished(tmp_path, monkeypatch):
+    """Job result is polled while the job API answers 202"""
+    import workflow_handle_pdf
+    from unittest.mock import MagicMock
+
+    submit_response = MagicMock()
+    submit_response.json.return_value = {"job_id": "job-1", "status": "queued"}
+    monkeypatch.setattr(workflow_handle_pdf.http_client, "post", MagicMock(return_value=submit_response))
+    pending = MagicMock(status_code=202)
+    done = MagicMock(status_code=200)
+    done.json.return_value = {"success": True, "markdown": "# Parsed", "metadata": {}}
+    mock_get = MagicMock(side_effect=[pending, pending, done])
+    monkeypatch.setattr(workflow_handle_pdf.http_client, "get", mock_get)
+    monkeypatch.setattr(workflow_handle_pdf, "PDF_PARSE_JOB_POLL_SECONDS", 0)
+
+    pdf_path = tmp_path / "paper.pdf"
+    pdf_path.write_bytes(b"%PDF-1.4 job")
+
+    result = workflow_handle_pdf.request_pdf_parse_job(str(pdf_path), "marker")
+
+    assert result["markdown"] == "# Parsed"
+    assert mock_get.call_count == 3
+    assert mock_get.call_args[0][0].endswith("/jobs/job-1/result")
+
+
+def test_generate_paper_metadata_cached(tmp_path, monkeypatch):
+    """Identical markdown hits the cache, a prompt change invalidates it"""
+    import workflow_handle_pdf
+    from unittest.mock import MagicMock
+
+    cache = DiskResultCache("paper_metadata", max_bytes=10**6, ttl_seconds=3600, cache_dir=str(tmp_path))
+    monkeypatch.setattr(workflow_handle_pdf, "get_metadata_cache", lambda: cache)
+    api_response = MagicMock()
+    api_response.json.return_value = {"success": True, "raw_output": '{"title": "T", "authors": "A", "year": 2024}'}
+    mock_post = MagicMock(return_value=api_response)
+    monkeypatch.setattr(workflow_handle_pdf.http_client, "post", mock_post)
+
+    first = workflow_handle_pdf.generate_paper_metadata_cached("# T\nA 2024")
+    second = workflow_handle_pdf.generate_paper_metadata_cached("# T\nA 2024")
+    assert first == second
+    assert {name: first[name] for name in ("title", "authors", "year")} == {"title": "T", "authors": "A", "year": 2024}
+    assert mock_post.call_count == 1
+
+    monkeypatch.setattr(workflow_handle_pdf, "md_paper_metadata_agent_instruction", "new prompt")
+    workflow_handle_pdf.generate_paper_metadata_cached("# T\nA 2024")
+    assert mock_post.call_count == 2
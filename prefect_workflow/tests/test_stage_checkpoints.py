@@ -0,0 +1,160 @@
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from result_cache import DiskResultCache, StageCheckpoints
+import pytest
+
+
+class SubmittedNow:
+    """Stand-in for a task whose .submit() runs at once"""
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def __call__(self, *args, **kwargs):
+        return self.fn(*args, **kwargs)
+
+    def submit(self, *args, **kwargs):
+        result = self.fn(*args, **kwargs)
+        return type("Future", (), {"result": lambda future: result})()
+
+
+def test_first_incomplete_stage(tmp_path):
+    """Stages are completed in order; None once all are checkpointed"""
+    cache = DiskResultCache("checkpoints", max_bytes=10**6, cache_dir=str(tmp_path))
+    checkpoints = StageCheckpoints(cache, "md5-a", ("parse", "metadata", "save"))
+
+    assert checkpoints.first_incomplete_stage() == "parse"
+    checkpoints.set("parse", {"markdown": "# A"})
+    checkpoints.set("metadata", {"title": "A"})
+    assert checkpoints.first_incomplete_stage() == "save"
+    # other content hashes do not see these checkpoints
+    assert StageCheckpoints(cache, "md5-b", ("parse",)).get("parse") is None
+
+    checkpoints.set("save", {"id": 1})
+    assert checkpoints.first_incomplete_stage() is None
+
+
+def test_flow_resumes_after_upload_failure(tmp_path, monkeypatch):
+    """A rerun after a failed upload reuses markdown, metadata and save result"""
+    import workflow_handle_pdf
+
+    calls = []
+    monkeypatch.setattr(workflow_handle_pdf, "CHECKPOINT_CACHE_DIR", str(tmp_path / "checkpoints"))
+    monkeypatch.setattr(workflow_handle_pdf, "get_origin_filemd5_from_s3", lambda url: "0" * 32)
+    monkeypatch.setattr(workflow_handle_pdf, "lookup_existing_papers_by_md5", lambda md5s: {})
+    monkeypatch.setattr(workflow_handle_pdf, "get_primary_domain_from_pdf_url", lambda url: "test")
+    monkeypatch.setattr(workflow_handle_pdf, "get_parser_pdf_url", lambda url: (None, "upload"))
+    monkeypatch.setattr(workflow_handle_pdf, "make_download_workdir", lambda: tempfile.mkdtemp(dir=tmp_path))
+
+    def download(url, temp_workdir):
+        calls.append("download")
+        origin_file_path = os.path.join(temp_workdir, "paper.pdf")
+        with open(origin_file_path, "wb") as f:
+            f.write(b"%PDF-1.4")
+        return {"temp_workdir": temp_workdir, "origin_file_path": origin_file_path}
+
+    def parse(origin_file_path, temp_workdir, engine):
+        calls.append("parse")
+        markdown_file_path = os.path.join(temp_workdir, "paper.pdf.md")
+        with open(markdown_file_path, "w") as f:
+            f.write("# Parsed")
+        return {"origin_file_path": origin_file_path, "markdown_file_path": markdown_file_path, "parser_metadata": {}}
+
+    def metadata(markdown_file_path):
+        calls.append("metadata")
+        return {"title": "Parsed"}
+
+    def save(**kwargs):
+        calls.append("save")
+        return {"id": 42}
+
+    upload_failures = [RuntimeError("FastGPT down")]
+
+    def upload(file_path, paper_id):
+        calls.append("upload")
+        if upload_failures:
+            raise upload_failures.pop()
+        with open(file_path) as f:
+            return {"paper_id": paper_id, "markdown": f.read()}
+
+    monkeypatch.setattr(workflow_handle_pdf, "download_origin_file_from_s3", SubmittedNow(download))
+    monkeypatch.setattr(workflow_handle_pdf, "parse_origin_file_to_markdown", parse)
+    monkeypatch.setattr(workflow_handle_pdf, "agent_generate_paper_metadata", metadata)
+    monkeypatch.setattr(workflow_handle_pdf, "save_origin_file_md_to_db", save)
+    monkeypatch.setattr(workflow_handle_pdf, "upload_to_fastgpt_dataset", upload)
+    flow = workflow_handle_pdf.workflow_handle_pdf_to_db_and_fastgpt.fn
+
+    with pytest.raises(RuntimeError):
+        flow(s3_object_url="https://r2.example.com/test/paper.pdf")
+    assert calls == ["download", "parse", "metadata", "save", "upload"]
+
+    calls.clear()
+    result = flow(s3_object_url="https://r2.example.com/test/paper.pdf")
+    assert calls == ["upload"]
+    assert result["upload_result"] == {"paper_id": 42, "markdown": "# Parsed"}
+    assert result["parse_input"] == "checkpoint"
+    assert result["downloaded"] is False
+
+    calls.clear()
+    assert flow(s3_object_url="https://r2.example.com/test/paper.pdf") == result
+    assert calls == []
+
+    # the same bytes under another URL are saved and uploaded again, parse and metadata are reused
+    calls.clear()
+    other = flow(s3_object_url="https://r2.example.com/other/paper.pdf")
+    assert calls == ["download", "save", "upload"]
+    assert other["s3_object_url"] == "https://r2.example.com/other/paper.pdf"
+
+    # another engine (or PDF_PARSER_ENGINE_VERSION) parses again
+    calls.clear()
+    flow(s3_object_url="https://r2.example.com/test/paper.pdf", pdf_parser_engine="docling")
+    assert calls == ["download", "parse", "metadata", "save", "upload"]
+    calls.clear()
+    monkeypatch.setattr(workflow_handle_pdf, "PDF_PARSER_ENGINE_VERSION", "next")
+    flow(s3_object_url="https://r2.example.com/test/paper.pdf")
+    assert calls[:2] == ["download", "parse"]
+
+
+def test_flow_hands_parser_the_url(tmp_path, monkeypatch):
+    """Publicly fetchable PDFs are parsed by URL; the worker downloads only for the DB save"""
+    import workflow_handle_pdf
+
+    calls = []
+    monkeypatch.setattr(workflow_handle_pdf, "CHECKPOINT_CACHE_DIR", str(tmp_path / "checkpoints"))
+    monkeypatch.setattr(workflow_handle_pdf, "get_origin_filemd5_from_s3", lambda url: "1" * 32)
+    monkeypatch.setattr(workflow_handle_pdf, "lookup_existing_papers_by_md5", lambda md5s: {})
+    monkeypatch.setattr(workflow_handle_pdf, "get_primary_domain_from_pdf_url", lambda url: "test")
+    monkeypatch.setattr(workflow_handle_pdf, "get_parser_pdf_url", lambda url: (url, "pdf_url"))
+    monkeypatch.setattr(workflow_handle_pdf, "make_download_workdir", lambda: tempfile.mkdtemp(dir=tmp_path))
+    monkeypatch.setattr(workflow_handle_pdf, "agent_generate_paper_metadata", lambda markdown_file_path: {"title": "Parsed"})
+    monkeypatch.setattr(workflow_handle_pdf, "upload_to_fastgpt_dataset", lambda file_path, paper_id: {"paper_id": paper_id})
+
+    def download(url, temp_workdir):
+        calls.append("download")
+        origin_file_path = os.path.join(temp_workdir, "paper.pdf")
+        with open(origin_file_path, "wb") as f:
+            f.write(b"%PDF-1.4")
+        return {"temp_workdir": temp_workdir, "origin_file_path": origin_file_path}
+
+    def request_pdf_parse_job(origin_file_path, engine, pdf_url=None):
+        calls.append(("parse", pdf_url))
+        return {"success": True, "markdown": "# Parsed", "metadata": {}}
+
+    def save(origin_file_path, markdown_file_path, primary_domain, paper_metadata):
+        calls.append(("save", os.path.basename(origin_file_path), os.path.exists(origin_file_path)))
+        return {"id": 7}
+
+    monkeypatch.setattr(workflow_handle_pdf, "download_origin_file_from_s3", SubmittedNow(download))
+    monkeypatch.setattr(workflow_handle_pdf, "get_parse_cache", lambda: workflow_handle_pdf.DiskResultCache("parse", 10**6, cache_dir=str(tmp_path)))
+    monkeypatch.setattr(workflow_handle_pdf, "request_pdf_parse_job", request_pdf_parse_job)
+    monkeypatch.setattr(workflow_handle_pdf, "parse_origin_url_to_markdown", workflow_handle_pdf.parse_origin_url_to_markdown.fn)
+    monkeypatch.setattr(workflow_handle_pdf, "save_origin_file_md_to_db", save)
+
+    url = "https://r2.example.com/test/paper.pdf"
+    result = workflow_handle_pdf.workflow_handle_pdf_to_db_and_fastgpt.fn(s3_object_url=url)
+
+    assert calls == ["download", ("parse", url), ("save", "paper.pdf", True)]
+    assert result["parse_input"] == "pdf_url"
+    assert result["downloaded"] is True
@@ -0,0 +1,125 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from streaming_download import DownloadError, enforce_disk_budget, make_download_workdir, stream_download
+import pytest
+
+BODY = os.urandom(3 * 1024 * 1024 + 123)
+BODY_MD5 = hashlib.md5(BODY).hexdigest()
+
+
+class R2StandIn(BaseHTTPRequestHandler):
+    """Serves BODY with an ETag; drop_after cuts the first response short, range_start overrides the 206 start"""
+    etag = BODY_MD5
+    drop_after = None
+    honour_range = True
+    range_start = None
+    requests_seen = []
+
+    def do_GET(self):
+        type(self).requests_seen.append(self.headers.get('Range'))
+        start = 0
+        range_header = self.headers.get('Range')
+        if range_header and self.honour_range:
+            start = int(range_header.split('=')[1].rstrip('-'))
+            if self.range_start is not None:
+                start = self.range_start
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(BODY) - 1}/{len(BODY)}')
+        elif self.path == '/missing.pdf':
+            self.send_response(404)
+            self.end_headers()
+            return
+        else:
+            self.send_response(200)
+        body = BODY[start:]
+        self.send_header('ETag', f'"{self.etag}"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if type(self).drop_after is not None:
+            self.wfile.write(body[:type(self).drop_after])
+            type(self).drop_after = None
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    R2StandIn.etag = BODY_MD5
+    R2StandIn.drop_after = None
+    R2StandIn.honour_range = True
+    R2StandIn.range_start = None
+    R2StandIn.requests_seen = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), R2StandIn)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+
+
+def test_download_hashes_while_streaming(server, tmp_path):
+    result = stream_download(f"{server}/paper.pdf", str(tmp_path / "paper.pdf"))
+    assert result == {"md5": BODY_MD5, "size": len(BODY), "etag_md5": BODY_MD5, "resumes": 0}
+    assert (tmp_path / "paper.pdf").read_bytes() == BODY
+
+
+@pytest.mark.parametrize("honour_range", [True, False])
+def test_interrupted_download_resumes(server, tmp_path, honour_range):
+    """A dropped connection continues with a Range request, or restarts if the server ignores it"""
+    R2StandIn.drop_after = 1024 * 1024
+    R2StandIn.honour_range = honour_range
+    result = stream_download(f"{server}/paper.pdf", str(tmp_path / "paper.pdf"))
+
+    assert result["resumes"] == 1
+    assert result["md5"] == BODY_MD5
+    assert R2StandIn.requests_seen == [None, f"bytes={1024 * 1024}-"]
+    assert (tmp_path / "paper.pdf").read_bytes() == BODY
+
+
+@pytest.mark.parametrize("range_start, expected_requests", [
+    (0, [None, f"bytes={1024 * 1024}-"]),
+    (512 * 1024, [None, f"bytes={1024 * 1024}-", None]),
+])
+def test_resume_with_wrong_content_range_restarts(server, tmp_path, range_start, expected_requests):
+    """A 206 whose Content-Range does not start where the file ends is not appended"""
+    R2StandIn.drop_after = 1024 * 1024
+    R2StandIn.range_start = range_start
+    result = stream_download(f"{server}/paper.pdf", str(tmp_path / "paper.pdf"))
+
+    assert result["md5"] == BODY_MD5
+    assert R2StandIn.requests_seen == expected_requests
+    assert (tmp_path / "paper.pdf").read_bytes() == BODY
+
+
+def test_md5_mismatch_and_limits(server, tmp_path):
+    R2StandIn.etag = "0" * 32
+    with pytest.raises(DownloadError, match="md5 mismatch"):
+        stream_download(f"{server}/paper.pdf", str(tmp_path / "paper.pdf"))
+
+    R2StandIn.etag = BODY_MD5
+    with pytest.raises(DownloadError, match="larger than"):
+        stream_download(f"{server}/paper.pdf", str(tmp_path / "paper.pdf"), max_bytes=1024)
+    with pytest.raises(DownloadError, match="HTTP 404"):
+        stream_download(f"{server}/missing.pdf", str(tmp_path / "missing.pdf"))
+
+
+def test_disk_budget_evicts_oldest_idle_workdirs(tmp_path):
+    download_dir = str(tmp_path)
+    workdirs = []
+    for age in (3, 2, 1, 0):
+        workdir = make_download_workdir(download_dir=download_dir)
+        with open(os.path.join(workdir, "paper.pdf"), "wb") as f:
+            f.write(b"x" * 1000)
+        mtime = time.time() - age * 3600
+        os.utime(workdir, (mtime, mtime))
+        workdirs.append(workdir)
+
+    # the budget fits one workdir, but the one touched just now is kept as in use
+    assert enforce_disk_budget(budget_bytes=1500, download_dir=download_dir, min_age_seconds=600) == 3
+    assert [os.path.isdir(workdir) for workdir in workdirs] == [False, False, False, True]
@@ -0,0 +1,140 @@
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from workflow_batch_pdf import object_keys_to_urls, summarize_batch
+import pytest
+
+
+def test_object_keys_to_urls():
+    """Only processable extensions are kept, keys become public URLs"""
+    urls = object_keys_to_urls(["deepmd/a.pdf", "deepmd/logo.png", "/abacus/readme.md"], public_url="https://r2.example.com/")
+
+    assert urls == ["https://r2.example.com/deepmd/a.pdf", "https://r2.example.com/abacus/readme.md"]
+
+
+def test_summarize_batch():
+    """Throughput counts completed items only"""
+    items = [
+        {"status": "completed", "file_size": 2 * 1024**2},
+        {"status": "completed", "file_size": 1024**2},
+        {"status": "failed", "failed_stage": "parse"},
+        {"status": "skipped"},
+    ]
+
+    summary = summarize_batch(items, elapsed_seconds=30)
+
+    assert (summary["total"], summary["completed"], summary["failed"], summary["skipped"]) == (4, 2, 1, 1)
+    assert summary["files_per_minute"] == pytest.approx(4.0)
+    assert summary["mb_per_second"] == pytest.approx(0.1)
+
+
+class Stage:
+    """Stand-in for a workflow_handle_pdf task, the batch tasks call .fn"""
+
+    def __init__(self, fn):
+        self.fn = fn
+
+
+@pytest.fixture(scope="module")
+def prefect_harness():
+    from prefect.testing.utilities import prefect_test_harness
+
+    with prefect_test_harness():
+        yield
+
+
+@pytest.fixture
+def batch_flow(tmp_path, monkeypatch, prefect_harness):
+    """The batch flow with every stage stubbed locally; parsing fails for URLs containing "broken" """
+    import workflow_batch_pdf
+
+    workdir_root = tmp_path / "workdirs"
+    workdir_root.mkdir()
+
+    def download(url):
+        temp_workdir = tempfile.mkdtemp(dir=workdir_root)
+        origin_file_path = os.path.join(temp_workdir, os.path.basename(url))
+        with open(origin_file_path, "wb") as f:
+            f.write(b"%PDF-1.4")
+        return {"temp_workdir": temp_workdir, "origin_file_path": origin_file_path, "file_size": 8}
+
+    def parse(origin_file_path, temp_workdir, engine):
+        if "broken" in origin_file_path:
+            raise RuntimeError("parse job failed")
+        markdown_file_path = origin_file_path + ".md"
+        with open(markdown_file_path, "w") as f:
+            f.write(f"# {os.path.basename(origin_file_path)}")
+        return {"origin_file_path": origin_file_path, "markdown_file_path": markdown_file_path, "parser_metadata": {}}
+
+    saved = []
+
+    def save(origin_file_path, markdown_file_path, primary_domain, paper_metadata):
+        saved.append((os.path.basename(origin_file_path), paper_metadata))
+        return {"id": len(saved)}
+
+    monkeypatch.setattr(workflow_batch_pdf, "download_origin_file_from_s3", Stage(download))
+    monkeypatch.setattr(workflow_batch_pdf, "parse_origin_file_to_markdown", Stage(parse))
+    monkeypatch.setattr(workflow_batch_pdf, "agent_generate_paper_metadata", Stage(lambda markdown_file_path: {"title": "per item"}))
+    monkeypatch.setattr(workflow_batch_pdf, "get_primary_domain_from_pdf_url", Stage(lambda url: "test"))
+    monkeypatch.setattr(workflow_batch_pdf, "save_origin_file_md_to_db", Stage(save))
+    monkeypatch.setattr(workflow_batch_pdf, "upload_to_fastgpt_dataset", Stage(lambda file_path, paper_id: {"paper_id": paper_id}))
+    for name in ("batch_download", "batch_parse", "batch_metadata", "batch_metadata_packed", "batch_save", "batch_upload"):
+        monkeypatch.setattr(workflow_batch_pdf, name, getattr(workflow_batch_pdf, name).with_options(retries=0))
+
+    flow = workflow_batch_pdf.workflow_batch_handle_pdfs_to_db_and_fastgpt
+    return flow, saved, workdir_root
+
+
+def test_batch_flow_failure_stays_with_its_item(batch_flow):
+    """One broken file fails alone; every workdir is removed, failed or not"""
+    flow, saved, workdir_root = batch_flow
+    urls = ["https://r2.example.com/a.pdf", "https://r2.example.com/broken.pdf", "https://r2.example.com/c.pdf"]
+
+    result = flow(s3_object_urls=urls, skip_existing=False)
+
+    statuses = [(item["status"], item.get("failed_stage")) for item in result["items"]]
+    assert statuses == [("completed", None), ("failed", "parse"), ("completed", None)]
+    assert sorted(name for name, _ in saved) == ["a.pdf", "c.pdf"]
+    assert result["summary"]["completed"] == 2 and result["summary"]["failed"] == 1
+    assert os.listdir(workdir_root) == []
+
+
+def test_batch_flow_skips_existing(batch_flow, monkeypatch):
+    """Files already stored with a FastGPT collection are skipped before download"""
+    import workflow_batch_pdf
+    from prefect import task
+
+    flow, saved, _ = batch_flow
+    md5s = {"https://r2.example.com/known.pdf": "a" * 32, "https://r2.example.com/new.pdf": "b" * 32}
+    monkeypatch.setattr(workflow_batch_pdf, "get_origin_filemd5_from_s3", task(lambda url: md5s[url], name="md5-stand-in"))
+    monkeypatch.setattr(workflow_batch_pdf, "lookup_existing_papers_by_md5", lambda known: {"a" * 32: {"paper_id": 9, "fastgpt_collectionId": "c"}})
+
+    result = flow(s3_object_urls=list(md5s))
+
+    assert [item["status"] for item in result["items"]] == ["skipped", "completed"]
+    assert result["items"][0]["paper_id"] == 9
+    assert [name for name, _ in saved] == ["new.pdf"]
+
+
+def test_batch_flow_packed_metadata(batch_flow, monkeypatch):
+    """Packed mode asks for all parsed items at once; a document without metadata fails only its item"""
+    import workflow_batch_pdf
+
+    flow, saved, workdir_root = batch_flow
+    packed_calls = []
+
+    def generate_paper_metadata_packed(markdown_contents):
+        packed_calls.append(markdown_contents)
+        return [RuntimeError("no valid metadata") if "c.pdf" in markdown else {"title": markdown} for markdown in markdown_contents]
+
+    monkeypatch.setattr(workflow_batch_pdf, "generate_paper_metadata_packed", generate_paper_metadata_packed)
+    urls = ["https://r2.example.com/a.pdf", "https://r2.example.com/broken.pdf", "https://r2.example.com/c.pdf"]
+
+    result = flow(s3_object_urls=urls, skip_existing=False, metadata_mode="packed")
+
+    statuses = [(item["status"], item.get("failed_stage")) for item in result["items"]]
+    assert statuses == [("completed", None), ("failed", "parse"), ("failed", "metadata")]
+    assert packed_calls == [["# a.pdf", "# c.pdf"]]
+    assert saved == [("a.pdf", {"title": "# a.pdf"})]
+    assert os.listdir(workdir_root) == []
@@ -0,0 +1,287 @@
+#%%
+"""
+Batch flow: ingest a list of R2 URLs (or a whole R2 prefix) in one flow run
+
+Each stage of workflow_handle_pdf_to_db_and_fastgpt is mapped across the items;
+every stage has its own concurrency limit, so the GPU parser, the LLM and the
+FastGPT upload are not throttled by the slowest of them. Items that fail do not
+stop the batch; the flow returns (and publishes as an artifact) per-item status
+and aggregate throughput.
+"""
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from prefect import allow_failure, flow, task, unmapped
+from prefect.artifacts import create_markdown_artifact
+from prefect.futures import wait
+from prefect.runtime import flow_run
+from prefect.task_runners import ThreadPoolTaskRunner
+
+from workflow_handle_pdf import (
+    PDF_PARSER_ENGINE,
+    R2_ACCESS_KEY_ID,
+    R2_BUCKET_NAME,
+    R2_ENDPOINT_URL,
+    R2_PUBLIC_URL,
+    R2_SECRET_ACCESS_KEY,
+    agent_generate_paper_metadata,
+    download_origin_file_from_s3,
+    generate_paper_metadata_packed,
+    get_origin_filemd5_from_s3,
+    get_primary_domain_from_pdf_url,
+    lookup_existing_papers_by_md5,
+    parse_origin_file_to_markdown,
+    save_origin_file_md_to_db,
+    upload_to_fastgpt_dataset,
+)
+
+BATCH_FILE_EXTENSIONS = ('.pdf', '.md', '.txt', '.rst', '.ipynb')
+MD5_LOOKUP_CHUNK_SIZE = 500
+
+# per-stage concurrency within one batch flow run
+BATCH_STAGE_CONCURRENCY = {
+    "download": int(os.environ.get("BATCH_DOWNLOAD_CONCURRENCY", "8")),
+    "parse": int(os.environ.get("BATCH_PARSE_CONCURRENCY", "16")),
+    "metadata": int(os.environ.get("BATCH_METADATA_CONCURRENCY", "8")),
+    "save": int(os.environ.get("BATCH_SAVE_CONCURRENCY", "4")),
+    "upload": int(os.environ.get("BATCH_UPLOAD_CONCURRENCY", "2")),
+}
+_stage_semaphores = {stage: threading.BoundedSemaphore(limit) for stage, limit in BATCH_STAGE_CONCURRENCY.items()}
+
+
+@contextmanager
+def stage_slot(stage: str):
+    """Hold one of the stage's concurrency slots while the stage runs"""
+    with _stage_semaphores[stage]:
+        yield
+
+
+def object_keys_to_urls(keys: list[str], public_url: str = R2_PUBLIC_URL) -> list[str]:
+    """Public URLs for the R2 object keys the flow can process"""
+    return [
+        f"{public_url.rstrip('/')}/{key.lstrip('/')}"
+        for key in keys
+        if key.lower().endswith(BATCH_FILE_EXTENSIONS)
+    ]
+
+
+@task
+def list_s3_prefix_urls(s3_prefix: str) -> list[str]:
+    """All processable object URLs under an R2 prefix"""
+    import boto3
+
+    s3_client = boto3.client(
+        "s3",
+        endpoint_url=R2_ENDPOINT_URL,
+        aws_access_key_id=R2_ACCESS_KEY_ID,
+        aws_secret_access_key=R2_SECRET_ACCESS_KEY,
+    )
+    keys = []
+    for page in s3_client.get_paginator("list_objects_v2").paginate(Bucket=R2_BUCKET_NAME, Prefix=s3_prefix):
+        keys.extend(obj["Key"] for obj in page.get("Contents", []))
+    urls = object_keys_to_urls(keys)
+    print(f"list_s3_prefix_urls: {len(urls)}/{len(keys)} processable objects under {s3_prefix=}")
+    return urls
+
+
+@task(retries=2, retry_delay_seconds=10)
+def batch_download(s3_object_url: str) -> dict:
+    with stage_slot("download"):
+        return download_origin_file_from_s3.fn(s3_object_url)
+
+
+@task(retries=3, retry_delay_seconds=10)
+def batch_parse(download_result: dict, engine: str) -> dict:
+    with stage_slot("parse"):
+        return parse_origin_file_to_markdown.fn(
+            origin_file_path=download_result['origin_file_path'],
+            temp_workdir=download_result['temp_workdir'],
+            engine=engine
+        )
+
+
+@task(retries=2, retry_delay_seconds=10)
+def batch_metadata(parse_result: dict) -> dict:
+    with stage_slot("metadata"):
+        return agent_generate_paper_metadata.fn(markdown_file_path=parse_result['markdown_file_path'])
+
+
+@task(retries=2, retry_delay_seconds=10)
+def batch_metadata_packed(parse_results: list) -> dict:
+    """
+    Metadata of every parsed item at once, several documents per LLM call
+    Items whose parse failed are left out; returns {"metadata": {index: dict}, "errors": {index: str}}
+    """
+    indexes, markdown_contents = [], []
+    for index, parse_result in enumerate(parse_results):
+        if not isinstance(parse_result, dict):
+            continue
+        with open(parse_result['markdown_file_path'], 'r', encoding='utf-8') as f:
+            markdown_contents.append(f.read())
+        indexes.append(index)
+    with stage_slot("metadata"):
+        packed_metadata = generate_paper_metadata_packed(markdown_contents)
+
+    metadata, errors = {}, {}
+    for index, paper_metadata in zip(indexes, packed_metadata):
+        if isinstance(paper_metadata, Exception):
+            errors[index] = str(paper_metadata)
+        else:
+            metadata[index] = paper_metadata
+    return {"metadata": metadata, "errors": errors}
+
+
+@task
+def batch_metadata_unpack(packed: dict, index: int) -> dict:
+    """One item's metadata out of batch_metadata_packed, so item states are tracked as in per-item mode"""
+    if index not in packed['metadata']:
+        raise RuntimeError(f"no metadata for item {index}: {packed['errors'].get(index, 'parse failed')}")
+    return packed['metadata'][index]
+
+
+@task(retries=2, retry_delay_seconds=10)
+def batch_save(s3_object_url: str, parse_result: dict, paper_metadata: dict) -> dict:
+    with stage_slot("save"):
+        return save_origin_file_md_to_db.fn(
+            origin_file_path=parse_result['origin_file_path'],
+            markdown_file_path=parse_result['markdown_file_path'],
+            primary_domain=get_primary_domain_from_pdf_url.fn(s3_object_url),
+            paper_metadata=paper_metadata
+        )
+
+
+@task(retries=3, retry_delay_seconds=600)
+def batch_upload(download_result: dict, parse_result: dict, save_result: dict) -> dict:
+    with stage_slot("upload"):
+        upload_result = upload_to_fastgpt_dataset.fn(
+            file_path=parse_result['markdown_file_path'],
+            paper_id=save_result['id']
+        )
+    # item finished, free its disk space (failed items are cleaned up by the flow once the batch is done)
+    shutil.rmtree(download_result['temp_workdir'], ignore_errors=True)
+    return upload_result
+
+
+def summarize_batch(items: list[dict], elapsed_seconds: float) -> dict:
+    """Aggregate counts and throughput over per-item results"""
+    processed = [item for item in items if item['status'] == 'completed']
+    processed_bytes = sum(item.get('file_size') or 0 for item in processed)
+    return {
+        "total": len(items),
+        "completed": len(processed),
+        "failed": sum(1 for item in items if item['status'] == 'failed'),
+        "skipped": sum(1 for item in items if item['status'] == 'skipped'),
+        "elapsed_seconds": elapsed_seconds,
+        "files_per_minute": len(processed) / elapsed_seconds * 60 if elapsed_seconds else 0.0,
+        "mb_per_second": processed_bytes / 1024**2 / elapsed_seconds if elapsed_seconds else 0.0,
+    }
+
+
+def generate_batch_flow_run_name() -> str:
+    parameters = flow_run.parameters
+    if parameters.get("s3_prefix"):
+        return f"batch-process-{parameters['s3_prefix']}"
+    return f"batch-process-{len(parameters.get('s3_object_urls') or [])}-urls"
+
+
+def _failed_stage(states: dict) -> Optional[str]:
+    for stage, state in states.items():
+        if not state.is_completed():
+            return stage
+    return None
+
+
+@flow(
+    flow_run_name=generate_batch_flow_run_name,
+    persist_result=False,
+    log_prints=True,
+    task_runner=ThreadPoolTaskRunner(max_workers=sum(BATCH_STAGE_CONCURRENCY.values())),
+)
+def workflow_batch_handle_pdfs_to_db_and_fastgpt(
+    s3_object_urls: Optional[list[str]] = None,
+    s3_prefix: Optional[str] = None,
+    pdf_parser_engine: str = PDF_PARSER_ENGINE,
+    skip_existing: bool = True,
+    metadata_mode: str = "per_item",
+) -> dict:
+    """
+    metadata_mode: "per_item" one metadata request per item as it is parsed /
+    "packed" one request for the whole batch once every item is parsed, several
+    short documents per LLM call (backfills of .md/.rst/.ipynb)
+    """
+    start_time = time.time()
+    urls = list(s3_object_urls or [])
+    if s3_prefix:
+        urls.extend(list_s3_prefix_urls(s3_prefix))
+    urls = list(dict.fromkeys(urls))
+    print(f"batch: {len(urls)} objects")
+
+    # one batched md5 lookup for the whole drop instead of one per file
+    items = [{"s3_object_url": url, "status": "pending"} for url in urls]
+    if skip_existing and urls:
+        md5s = [future.result() for future in get_origin_filemd5_from_s3.map(urls)]
+        known_md5s = [md5 for md5 in md5s if md5]
+        existing = {}
+        # the lookup API caps md5s per request (PAPERS_BULK_MAX_ITEMS)
+        for start in range(0, len(known_md5s), MD5_LOOKUP_CHUNK_SIZE):
+            existing.update(lookup_existing_papers_by_md5(known_md5s[start:start + MD5_LOOKUP_CHUNK_SIZE]))
+        for item, md5 in zip(items, md5s):
+            paper = existing.get(md5) if md5 else None
+            if paper and paper.get('fastgpt_collectionId'):
+                item.update(status="skipped", origin_filemd5=md5, paper_id=paper['paper_id'])
+
+    pending = [item for item in items if item['status'] == 'pending']
+    pending_urls = [item['s3_object_url'] for item in pending]
+    downloads = batch_download.map(pending_urls)
+    parses = batch_parse.map(downloads, engine=unmapped(pdf_parser_engine))
+    if metadata_mode == "packed":
+        packed = batch_metadata_packed.submit([allow_failure(parse) for parse in parses])
+        metadatas = batch_metadata_unpack.map(unmapped(packed), range(len(pending)))
+    else:
+        metadatas = batch_metadata.map(parses)
+    saves = batch_save.map(pending_urls, parses, metadatas)
+    uploads = batch_upload.map(downloads, parses, saves)
+    wait(list(uploads))
+
+    for index, item in enumerate(pending):
+        states = {
+            "download": downloads[index].state,
+            "parse": parses[index].state,
+            "metadata": metadatas[index].state,
+            "save": saves[index].state,
+            "upload": uploads[index].state,
+        }
+        failed_stage = _failed_stage(states)
+        if failed_stage:
+            item.update(status="failed", failed_stage=failed_stage)
+            # task retries are over and nothing reruns the item, its files are not needed any more
+            if states["download"].is_completed():
+                shutil.rmtree(downloads[index].result()['temp_workdir'], ignore_errors=True)
+            continue
+        item.update(
+            status="completed",
+            file_size=downloads[index].result()['file_size'],
+            paper_id=saves[index].result()['id'],
+        )
+
+    summary = summarize_batch(items, time.time() - start_time)
+    print(f"batch summary: {summary=}")
+
+    rows = "\n".join(
+        f"| {item['s3_object_url']} | {item['status']} | {item.get('failed_stage', '')} | {item.get('paper_id', '')} |"
+        for item in items
+    )
+    create_markdown_artifact(
+        key="batch-ingest-summary",
+        markdown=(
+            f"**{summary['completed']} completed, {summary['failed']} failed, {summary['skipped']} skipped** "
+            f"in {summary['elapsed_seconds']:.0f}s ({summary['files_per_minute']:.1f} files/min, "
+            f"{summary['mb_per_second']:.2f} MB/s)\n\n"
+            f"| url | status | failed stage | paper_id |\n|---|---|---|---|\n{rows}"
+        ),
+    )
+    return {"summary": summary, "items": items}
@@ -1,9 +1,11 @@
 
 import random
-import tempfile
 import requests
 import json
 import os
+import re
+import time
+import hashlib
 from pathlib import Path
 from prefect import flow, task
 from prefect.artifacts import create_markdown_artifact
@@ -12,7 +14,12 @@ from urllib.parse import urlparse
 from typing import Optional
 import shutil
 
-from markdown_agent.md_paper_metadata_agent import md_paper_metadata_agent, PaperMetadataSchema
+from markdown_agent.md_paper_metadata_agent import md_paper_metadata_agent, PaperMetadataSchema, MODEL, md_paper_metadata_agent_instruction
+from markdown_agent.llm_output import parse_llm_json, parse_paper_metadata_output
+from markdown_agent.heuristic_metadata import HEURISTIC_VERSION, estimate_tokens, extract_metadata_heuristics, low_confidence_fields, trim_markdown_for_llm
+from result_cache import RESULT_CACHE_DIR, DiskResultCache, StageCheckpoints, calculate_file_md5, make_cache_key
+import http_client
+from streaming_download import DownloadError, make_download_workdir, parse_md5_from_etag, stream_download
 from google.adk.runners import Runner
 from google.adk.sessions import InMemorySessionService
 from google.genai import types
@@ -27,8 +34,49 @@ FASTGPT_WEBURL = os.environ.get("FASTGPT_WEBURL", "https://zqibhdki.sealosbja.si
 FASTGPT_DEVELOPER_API_KEY = os.environ.get("FASTGPT_DEVELOPER_API_KEY", "fastgpt-xxx")
 
 MODAL_MARKDOWN_METADATA_AGENT_URL = os.environ.get("MODAL_MARKDOWN_METADATA_AGENT_URL", "https://yfb222333--paper-metadata-agent-analyze-paper-raw-llm-output.modal.run")
+MODAL_MARKDOWN_METADATA_BATCH_URL = os.environ.get("MODAL_MARKDOWN_METADATA_BATCH_URL", "https://yfb222333--paper-metadata-agent-analyze-papers-batch.modal.run")
 DATASET_ID = "6873ef82deecd959acb461fb" # deepmodeling-general-db in bja sealos fastgpt
 
+# R2 (S3 API) credentials, for presigning private objects and listing prefixes
+R2_ENDPOINT_URL = os.environ.get("R2_ENDPOINT_URL", "")
+R2_ACCESS_KEY_ID = os.environ.get("R2_ACCESS_KEY_ID", "")
+R2_SECRET_ACCESS_KEY = os.environ.get("R2_SECRET_ACCESS_KEY", "")
+R2_BUCKET_NAME = os.environ.get("R2_BUCKET_NAME", "deepmodeling-docs")
+R2_PUBLIC_URL = os.environ.get("R2_PUBLIC_URL", "https://deepmodeling-docs-r2.deepmd.us")
+
+# async job API of the parser: submit returns a job id, the result is polled instead of holding a connection open
+MODAL_PDF_PARSER_JOBS_URL = os.environ.get("MODAL_PDF_PARSER_JOBS_URL", "https://yfb222333--pdf-parser-parse-jobs-api.modal.run")
+PDF_PARSE_JOB_TIMEOUT_SECONDS = float(os.environ.get("PDF_PARSE_JOB_TIMEOUT_SECONDS", "1800"))
+PDF_PARSE_JOB_POLL_SECONDS = float(os.environ.get("PDF_PARSE_JOB_POLL_SECONDS", "5"))
+# engine: text (CPU text layer, falls back to PDF_PARSER_FALLBACK_ENGINE when the layer is poor) / marker / docling
+PDF_PARSER_ENGINE = os.environ.get("PDF_PARSER_ENGINE", "text")
+PDF_PARSER_FALLBACK_ENGINE = os.environ.get("PDF_PARSER_FALLBACK_ENGINE", "marker")
+# the parser fetches PDFs from R2 itself (public URL, or presigned for private objects) instead of the worker re-uploading them
+PDF_PARSE_BY_URL = os.environ.get("PDF_PARSE_BY_URL", "true").lower() == "true"
+PDF_URL_PRESIGN_EXPIRES_SECONDS = int(os.environ.get("PDF_URL_PRESIGN_EXPIRES_SECONDS", "3600"))
+# PDF parse result cache - keyed by PDF md5 + engine + engine version
+PDF_PARSER_ENGINE_VERSION = os.environ.get("PDF_PARSER_ENGINE_VERSION", "2.2.0")  # bump to invalidate cached parses
+PARSE_CACHE_MAX_BYTES = int(os.environ.get("PARSE_CACHE_MAX_BYTES", str(2 * 1024**3)))
+
+# LLM metadata cache - keyed by markdown md5 + model + prompt hash, prompt changes invalidate entries
+METADATA_CACHE_MAX_BYTES = int(os.environ.get("METADATA_CACHE_MAX_BYTES", str(256 * 1024**2)))
+METADATA_CACHE_TTL_SECONDS = float(os.environ.get("METADATA_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+# the LLM is only called when one of these fields is not found confidently by the local heuristics
+METADATA_LLM_FIELDS = tuple(os.environ.get("METADATA_LLM_FIELDS", "title,authors,year,abstract").split(","))
+# new requests for fields still missing after local repair of the LLM output
+METADATA_REPROMPT_ATTEMPTS = int(os.environ.get("METADATA_REPROMPT_ATTEMPTS", "1"))
+# documents per request to the agent's batch endpoint in packed mode; must stay <= the
+# agent's METADATA_AGENT_BATCH_MAX_DOCUMENTS (200), larger requests are refused by the endpoint
+METADATA_PACKED_REQUEST_SIZE = int(os.environ.get("METADATA_PACKED_REQUEST_SIZE", "100"))
+
+# Stage checkpoints - keyed by origin file md5 (plus parser engine/version from the parse stage on,
+# and the object URL from the save stage on), a rerun resumes at the first incomplete stage
+# point CHECKPOINT_CACHE_DIR at a persistent volume so checkpoints survive worker restarts
+CHECKPOINT_STAGES = ("parse", "metadata", "save", "upload")
+CHECKPOINT_CACHE_DIR = os.environ.get("CHECKPOINT_CACHE_DIR", RESULT_CACHE_DIR)
+CHECKPOINT_MAX_BYTES = int(os.environ.get("CHECKPOINT_MAX_BYTES", str(2 * 1024**3)))
+CHECKPOINT_TTL_SECONDS = float(os.environ.get("CHECKPOINT_TTL_SECONDS", str(30 * 24 * 3600)))
+
 @task
 def start_process_webhook_request(webhook_request: dict) -> dict:
     pass
@@ -37,54 +85,158 @@ def start_process_webhook_request(webhook_request: dict) -> dict:
 # def 
 
 @task
-def download_origin_file_from_s3(s3_object_url: str) -> dict:
+def get_origin_filemd5_from_s3(s3_object_url: str) -> Optional[str]:
     """
-    Download PDF from URL to temporary directory
+    Get the file MD5 from the object ETag with a HEAD request (no download)
     """
-    # Create temporary directory
-    temp_workdir = tempfile.mkdtemp(prefix='s3_object_download_')
-    
-    # Extract filename from URL
-    filename = os.path.basename(s3_object_url)
-    
-    # Create full file path
+    try:
+        response = http_client.head(s3_object_url, "r2")
+    except requests.RequestException as e:
+        print(f"HEAD request failed, md5 unknown: {e=}")
+        return None
+    if not response.ok:
+        return None
+    origin_filemd5 = parse_md5_from_etag(response.headers.get('ETag'))
+    print(f"origin_filemd5 from ETag: {origin_filemd5=}")
+    return origin_filemd5
+
+@task
+def lookup_existing_papers_by_md5(
+    md5s: list[str],
+    api_base_url: str = DJANGO_API_ENDPOINT
+) -> dict:
+    """
+    Ask the papers API which MD5s are already stored on an active paper
+    Returns {md5: {"paper_id": ..., "fastgpt_collectionId": ...}}, empty if the lookup fails
+    """
+    try:
+        response = http_client.post(f"{api_base_url}/papers/lookup-md5", "papers_api", json={"md5s": md5s})
+        response.raise_for_status()
+    except requests.RequestException as e:
+        print(f"lookup_existing_papers_by_md5 failed, processing without short-circuit: {e=}")
+        return {}
+    found = response.json()['found']
+    print(f"lookup_existing_papers_by_md5: {len(found)}/{len(md5s)} already stored")
+    return found
+
+@task
+def download_origin_file_from_s3(s3_object_url: str, temp_workdir: Optional[str] = None) -> dict:
+    """
+    Stream the object from URL into temp_workdir (a new workdir if not given), MD5 checked against the ETag
+    """
+    own_workdir = temp_workdir is None
+    if own_workdir:
+        temp_workdir = make_download_workdir()
+    filename = os.path.basename(urlparse(s3_object_url).path)
     file_path = os.path.join(temp_workdir, filename)
-    
-    # Download and save file
-    response = requests.get(s3_object_url)
-    with open(file_path, 'wb') as f:
-        f.write(response.content)
-    
+
+    try:
+        stream_result = stream_download(s3_object_url, file_path)
+    except DownloadError:
+        if own_workdir:
+            shutil.rmtree(temp_workdir, ignore_errors=True)
+        raise
+    print(f"downloaded {s3_object_url=}: {stream_result=}")
+
     download_result = {
         'temp_workdir': temp_workdir,
         'origin_file_path': file_path,
+        'origin_filemd5': stream_result['md5'],
+        'file_size': stream_result['size'],
     }
     return download_result
 
+def get_parse_cache() -> DiskResultCache:
+    return DiskResultCache(namespace="pdf_parse", max_bytes=PARSE_CACHE_MAX_BYTES)
+
+def get_parser_pdf_url(s3_object_url: str) -> tuple:
+    """
+    (url, mode) the parser can fetch the PDF from by itself
+    mode: "pdf_url" public object / "presigned_url" private object signed with the R2 keys /
+    "upload" neither, the worker has to send the bytes (url is None)
+    """
+    try:
+        response = http_client.head(s3_object_url, "r2")
+        if response.ok:
+            return s3_object_url, "pdf_url"
+        print(f"object not publicly fetchable: {s3_object_url=} HTTP {response.status_code}")
+    except requests.RequestException as e:
+        print(f"HEAD request failed: {e=}")
+
+    if not (R2_ACCESS_KEY_ID and R2_SECRET_ACCESS_KEY):
+        return None, "upload"
+    import boto3
+
+    s3_client = boto3.client(
+        "s3",
+        endpoint_url=R2_ENDPOINT_URL,
+        aws_access_key_id=R2_ACCESS_KEY_ID,
+        aws_secret_access_key=R2_SECRET_ACCESS_KEY,
+    )
+    presigned_url = s3_client.generate_presigned_url(
+        "get_object",
+        Params={"Bucket": R2_BUCKET_NAME, "Key": urlparse(s3_object_url).path.lstrip('/')},
+        ExpiresIn=PDF_URL_PRESIGN_EXPIRES_SECONDS,
+    )
+    return presigned_url, "presigned_url"
+
+
+def request_pdf_parse_job(origin_file_path: Optional[str], engine: str, pdf_url: Optional[str] = None) -> dict:
+    """Submit the PDF (local file, or a URL the parser fetches itself) to the parser job API, then poll for the result"""
+    data = {'engine': engine, 'fallback_engine': PDF_PARSER_FALLBACK_ENGINE}
+    print(f"submitting PDF parse job... (engine: {engine}, by {'url' if pdf_url else 'upload'})")
+    if pdf_url:
+        submit_response = http_client.post(f"{MODAL_PDF_PARSER_JOBS_URL}/jobs", "parser_submit", data={**data, 'pdf_url': pdf_url})
+    else:
+        files = {'file': (os.path.basename(origin_file_path), origin_file_path, 'application/pdf')}
+        submit_response = http_client.post_multipart(f"{MODAL_PDF_PARSER_JOBS_URL}/jobs", "parser_submit", fields=data, files=files)
+    submit_response.raise_for_status()
+    job = submit_response.json()
+    job_id = job['job_id']
+    print(f"parse job submitted: {job_id=} status={job['status']} deduplicated={job.get('deduplicated')}")
+
+    deadline = time.time() + PDF_PARSE_JOB_TIMEOUT_SECONDS
+    while True:
+        result_response = http_client.get(f"{MODAL_PDF_PARSER_JOBS_URL}/jobs/{job_id}/result", "parser_poll")
+        result_response.raise_for_status()
+        if result_response.status_code == 200:
+            return result_response.json()
+        if time.time() >= deadline:
+            raise TimeoutError(f"PDF parse job {job_id} not finished after {PDF_PARSE_JOB_TIMEOUT_SECONDS}s")
+        time.sleep(PDF_PARSE_JOB_POLL_SECONDS)
+
+
 def parse_pdf_file_to_markdown(
         origin_file_path: str,
-        temp_workdir: str
+        temp_workdir: str,
+        engine: str = PDF_PARSER_ENGINE,
+        origin_filemd5: Optional[str] = None,
+        pdf_url: Optional[str] = None
     ) -> dict:
+    """
+    origin_file_path may not exist yet when pdf_url is given (the parser fetches the URL
+    while the worker downloads the file for the DB save); origin_filemd5 is then required
+    """
     
-    with open(origin_file_path, 'rb') as origin_file:
-        files = {'file': (origin_file_path, origin_file, 'application/pdf')}
-        data = {'engine': 'marker'}
-        
-        print(f"calling Modal API to parse PDF... (engine: marker)")
-        modal_api_url = "https://yfb222333--pdf-parser-parse-pdf-upload.modal.run"
-
-        api_response = requests.post(
-            modal_api_url,
-            files=files,
-            data=data,
-            timeout=300
-        )
-        api_response.raise_for_status()
-        
-    # parse response and return markdown content
-    result_json = api_response.json()
-    markdown_text = result_json['markdown']
-    parser_metadata = result_json['metadata']
+    # identical PDFs (retries, re-uploads) reuse the cached parse result
+    parse_cache = get_parse_cache()
+    cache_key = make_cache_key(origin_filemd5 or calculate_file_md5(origin_file_path), engine, PDF_PARSER_FALLBACK_ENGINE, PDF_PARSER_ENGINE_VERSION)
+    cached_result = parse_cache.get(cache_key)
+    
+    if cached_result:
+        print(f"parse cache hit, skipping Modal API: {cache_key=}")
+        markdown_text = cached_result['markdown']
+        parser_metadata = {**cached_result['metadata'], "cache": "hit"}
+    else:
+        result_json = request_pdf_parse_job(origin_file_path, engine, pdf_url=pdf_url)
+        # failed jobs are re-run by the job API on resubmit, so let the task retry
+        if not result_json.get('success', True):
+            raise RuntimeError(f"PDF parse failed: {result_json.get('error')}")
+
+        # parse response and return markdown content
+        markdown_text = result_json['markdown']
+        parser_metadata = result_json['metadata']
+        parse_cache.set(cache_key, {"markdown": markdown_text, "metadata": parser_metadata})
 
     markdown_filename = os.path.basename(origin_file_path) + ".md"
     markdown_path = os.path.join(temp_workdir, markdown_filename)
@@ -137,10 +289,12 @@ def rename_file_to_txt(origin_file_path: str, temp_workdir: str) -> dict:
 
     return pdf_parse_result
 
-@task
+# failed parse jobs are relaunched by the job API on resubmit
+@task(retries=2, retry_delay_seconds=30)
 def parse_origin_file_to_markdown(
         origin_file_path: str,
-        temp_workdir: str
+        temp_workdir: str,
+        engine: str = PDF_PARSER_ENGINE
     ) -> dict:
 
     file_extension = os.path.splitext(origin_file_path)[1]
@@ -148,7 +302,8 @@ def parse_origin_file_to_markdown(
     if file_extension == '.pdf':
         pdf_parse_result = parse_pdf_file_to_markdown(
             origin_file_path=origin_file_path,
-            temp_workdir=temp_workdir
+            temp_workdir=temp_workdir,
+            engine=engine
         )
     elif file_extension == '.md' or file_extension == '.txt' :
         pdf_parse_result = parse_md_file_to_markdown(
@@ -166,38 +321,52 @@ def parse_origin_file_to_markdown(
 
     print(f"pdf_parse_result: {pdf_parse_result=}")
     return pdf_parse_result
+
+
+# failed parse jobs are relaunched by the job API on resubmit
+@task(retries=2, retry_delay_seconds=30)
+def parse_origin_url_to_markdown(
+        s3_object_url: str,
+        pdf_url: str,
+        origin_filemd5: str,
+        temp_workdir: str,
+        engine: str = PDF_PARSER_ENGINE
+    ) -> dict:
+    """Parse a PDF the parser fetches from pdf_url; markdown is written next to where the download lands"""
+    filename = os.path.basename(urlparse(s3_object_url).path)
+    pdf_parse_result = parse_pdf_file_to_markdown(
+        origin_file_path=os.path.join(temp_workdir, filename),
+        temp_workdir=temp_workdir,
+        engine=engine,
+        origin_filemd5=origin_filemd5,
+        pdf_url=pdf_url
+    )
+    print(f"pdf_parse_result: {pdf_parse_result=}")
+    return pdf_parse_result
 #%%
 def parse_json_text_to_json_obj(json_text: str) -> dict:
     """public json parse logic"""
-    # clean possible markdown code block tags
-
-    if json_text.startswith('```json'):
-        json_str = json_text.replace('```json', '').replace('```', '').strip()
-    else:
-        json_str = json_text
-
-    print(f"json_str: {json_str=}")
-    # analyze json text to json object, if failed, raise exception
-    result_dict = json.loads(json_str)
-    
-    return result_dict
-
-@task(retries=2, retry_delay_seconds=10)
-def agent_generate_paper_metadata(
-    markdown_file_path: str,
-    modal_markdown_metadata_agent_url: str = MODAL_MARKDOWN_METADATA_AGENT_URL
+    # fences, surrounding prose, trailing commas, single quotes and truncation are repaired locally
+    print(f"json_text: {json_text=}")
+    # if nothing can be recovered, raise exception
+    return parse_llm_json(json_text)
+
+def request_paper_metadata_from_agent(
+    markdown_content: str,
+    modal_markdown_metadata_agent_url: str = MODAL_MARKDOWN_METADATA_AGENT_URL,
+    fields: Optional[list] = None,
+    reprompt_attempts: int = METADATA_REPROMPT_ATTEMPTS
 ) -> dict:
     """
-    Generate paper metadata using Modal service
-    Text parsing happens in Prefect for better monitoring
+    Call the Modal metadata agent and parse its raw LLM output; fields narrows what the LLM is asked for
+    The output is repaired and validated against PaperMetadataSchema locally; fields that are
+    still missing (or the whole answer, if nothing could be recovered) are asked for again,
+    up to reprompt_attempts times, instead of failing the task
     """
-    # Read markdown content
-    with open(markdown_file_path, 'r', encoding='utf-8') as f:
-        markdown_content = f.read()
-    
     # Call Modal service - get raw LLM output only
-    response = requests.post(modal_markdown_metadata_agent_url, json={
+    response = http_client.post(modal_markdown_metadata_agent_url, "metadata_agent", json={
         "markdown_content": markdown_content,
+        "fields": fields,
     })
     response.raise_for_status()
     
@@ -208,13 +377,206 @@ def agent_generate_paper_metadata(
     
     # Get raw output from Modal
     raw_output = result["raw_output"]
+    print(f"metadata agent input tokens: {result.get('input_tokens')}")
     print(f"Raw LLM output: {raw_output=}...")  # Log for debugging
     
     # Parse output in Prefect (for monitoring)
-    paper_metadata = parse_json_text_to_json_obj(raw_output)
-    print(f"paper_metadata: {paper_metadata=}")
+    try:
+        paper_metadata, missing_fields = parse_paper_metadata_output(raw_output, fields)
+    except ValueError:
+        if reprompt_attempts <= 0:
+            raise
+        paper_metadata, missing_fields = {}, list(fields or [])
+    print(f"paper_metadata: {paper_metadata=} {missing_fields=}")
+
+    if (missing_fields or not paper_metadata) and reprompt_attempts > 0:
+        # only the missing fields are asked again, in a new request
+        print(f"re-prompting metadata agent for {missing_fields=}")
+        retry_metadata = request_paper_metadata_from_agent(
+            markdown_content=markdown_content,
+            modal_markdown_metadata_agent_url=modal_markdown_metadata_agent_url,
+            fields=missing_fields or fields,
+            reprompt_attempts=reprompt_attempts - 1
+        )
+        if not paper_metadata:
+            return retry_metadata
+        for name in missing_fields:
+            if retry_metadata.get(name) is not None:
+                paper_metadata[name] = retry_metadata[name]
+
+    return paper_metadata
+
+def request_paper_metadata_batch_from_agent(
+    documents: list[dict],
+    modal_markdown_metadata_batch_url: str = MODAL_MARKDOWN_METADATA_BATCH_URL,
+    mode: str = "parallel"
+) -> list:
+    """
+    One request for many documents ({"markdown_content", "fields"} each)
+    mode: "parallel" one LLM call per document / "packed" several documents per LLM call
+    Returns per document the parsed metadata, or the Exception that document failed with
+    """
+    response = http_client.post(modal_markdown_metadata_batch_url, "metadata_agent", json={"documents": documents, "mode": mode})
+    response.raise_for_status()
+    result = response.json()
+    if not result.get("success"):
+        raise Exception(f"Modal agent batch error: {result=}")
+
+    batch_metadata = []
+    for document, item in zip(documents, result["results"]):
+        try:
+            if not item.get("success"):
+                raise Exception(f"Modal agent error: {item=}")
+            paper_metadata, _ = parse_paper_metadata_output(item["raw_output"], document.get("fields"))
+            batch_metadata.append(paper_metadata)
+        except Exception as e:
+            batch_metadata.append(e)
+    return batch_metadata
+
+def get_metadata_cache() -> DiskResultCache:
+    return DiskResultCache(
+        namespace="paper_metadata",
+        max_bytes=METADATA_CACHE_MAX_BYTES,
+        ttl_seconds=METADATA_CACHE_TTL_SECONDS
+    )
+
+def make_metadata_cache_key(markdown_content: str) -> str:
+    """Cache key: markdown md5 + model name + hash of the agent instruction + heuristics version"""
+    markdown_md5 = hashlib.md5(markdown_content.encode('utf-8')).hexdigest()
+    prompt_hash = hashlib.sha256(md_paper_metadata_agent_instruction.encode('utf-8')).hexdigest()
+    return make_cache_key(markdown_md5, MODEL, prompt_hash, HEURISTIC_VERSION, ",".join(METADATA_LLM_FIELDS))
+
+
+def heuristic_paper_metadata(markdown_content: str) -> tuple:
+    """(metadata from the local heuristics, low-confidence fields, whether the LLM is needed)"""
+    heuristic_metadata = extract_metadata_heuristics(markdown_content)
+    confidences = {name: round(item['confidence'], 2) for name, item in heuristic_metadata.items()}
+    uncertain_fields = low_confidence_fields(heuristic_metadata)
+    print(f"heuristic metadata confidence: {confidences=} {uncertain_fields=}")
+
+    paper_metadata = {name: item['value'] for name, item in heuristic_metadata.items()}
+    return paper_metadata, uncertain_fields, bool(set(uncertain_fields) & set(METADATA_LLM_FIELDS))
+
+
+def merge_llm_metadata(paper_metadata: dict, llm_metadata: dict, uncertain_fields: list) -> dict:
+    """Confident heuristic values win, the LLM fills the uncertain fields"""
+    for name in uncertain_fields:
+        if llm_metadata.get(name) is not None:
+            paper_metadata[name] = llm_metadata[name]
+    return paper_metadata
+
+
+def generate_paper_metadata(
+    markdown_content: str,
+    modal_markdown_metadata_agent_url: str = MODAL_MARKDOWN_METADATA_AGENT_URL
+) -> dict:
+    """
+    Local heuristics first; the LLM is asked only when a METADATA_LLM_FIELDS field is
+    low confidence, with the title page / abstract / references instead of the whole document.
+    Confident heuristic values win over the LLM's.
+    """
+    paper_metadata, uncertain_fields, needs_llm = heuristic_paper_metadata(markdown_content)
+    if not needs_llm:
+        print("heuristic metadata confident, skipping LLM call")
+        return paper_metadata
+
+    llm_input = trim_markdown_for_llm(markdown_content)
+    print(f"asking LLM for {uncertain_fields=}, input ~{estimate_tokens(llm_input)}/{estimate_tokens(markdown_content)} tokens")
+    llm_metadata = request_paper_metadata_from_agent(
+        markdown_content=llm_input,
+        modal_markdown_metadata_agent_url=modal_markdown_metadata_agent_url,
+        fields=uncertain_fields
+    )
+    return merge_llm_metadata(paper_metadata, llm_metadata, uncertain_fields)
+
+def generate_paper_metadata_cached(
+    markdown_content: str,
+    modal_markdown_metadata_agent_url: str = MODAL_MARKDOWN_METADATA_AGENT_URL,
+    use_cache: bool = True
+) -> dict:
+    """
+    Paper metadata for markdown content, memoized by markdown/model/prompt
+    Plain function so reprocessing flows can call it outside the task
+    use_cache=False forces a new LLM call (the fresh result is still stored)
+    """
+    metadata_cache = get_metadata_cache()
+    cache_key = make_metadata_cache_key(markdown_content)
+    
+    if use_cache:
+        cached_metadata = metadata_cache.get(cache_key)
+        if cached_metadata is not None:
+            print(f"metadata cache hit, skipping LLM call: {cache_key=}")
+            return cached_metadata
     
+    paper_metadata = generate_paper_metadata(
+        markdown_content=markdown_content,
+        modal_markdown_metadata_agent_url=modal_markdown_metadata_agent_url
+    )
+    metadata_cache.set(cache_key, paper_metadata)
     return paper_metadata
+
+def generate_paper_metadata_packed(
+    markdown_contents: list[str],
+    modal_markdown_metadata_batch_url: str = MODAL_MARKDOWN_METADATA_BATCH_URL
+) -> list:
+    """
+    Metadata for many (short) documents: metadata cache, then the local heuristics, then the
+    remaining documents packed several per LLM call by the agent's batch endpoint
+    Returns per document the metadata dict, or the Exception it failed with
+    """
+    metadata_cache = get_metadata_cache()
+    results = [None] * len(markdown_contents)
+    llm_requests = []
+    for index, markdown_content in enumerate(markdown_contents):
+        cache_key = make_metadata_cache_key(markdown_content)
+        cached_metadata = metadata_cache.get(cache_key)
+        if cached_metadata is not None:
+            results[index] = cached_metadata
+            continue
+        paper_metadata, uncertain_fields, needs_llm = heuristic_paper_metadata(markdown_content)
+        if needs_llm:
+            llm_requests.append((index, cache_key, paper_metadata, uncertain_fields))
+        else:
+            results[index] = paper_metadata
+            metadata_cache.set(cache_key, paper_metadata)
+    print(f"packed metadata: {len(markdown_contents)} documents, {len(llm_requests)} need the LLM")
+
+    for start in range(0, len(llm_requests), METADATA_PACKED_REQUEST_SIZE):
+        chunk = llm_requests[start:start + METADATA_PACKED_REQUEST_SIZE]
+        documents = [{"markdown_content": trim_markdown_for_llm(markdown_contents[index])} for index, _, _, _ in chunk]
+        try:
+            batch_metadata = request_paper_metadata_batch_from_agent(documents, modal_markdown_metadata_batch_url, mode="packed")
+        except Exception as e:
+            batch_metadata = [e] * len(chunk)
+        for (index, cache_key, paper_metadata, uncertain_fields), llm_metadata in zip(chunk, batch_metadata):
+            if isinstance(llm_metadata, Exception):
+                results[index] = llm_metadata
+                continue
+            results[index] = merge_llm_metadata(paper_metadata, llm_metadata, uncertain_fields)
+            metadata_cache.set(cache_key, results[index])
+    return results
+
+@task(retries=2, retry_delay_seconds=10)
+def agent_generate_paper_metadata(
+    markdown_file_path: str,
+    modal_markdown_metadata_agent_url: str = MODAL_MARKDOWN_METADATA_AGENT_URL,
+    use_cache: bool = True
+) -> dict:
+    """
+    Generate paper metadata using Modal service
+    Text parsing happens in Prefect for better monitoring
+    Identical markdown with the same model and prompt is served from the metadata cache
+    """
+    # Read markdown content
+    with open(markdown_file_path, 'r', encoding='utf-8') as f:
+        markdown_content = f.read()
+    
+    return generate_paper_metadata_cached(
+        markdown_content=markdown_content,
+        modal_markdown_metadata_agent_url=modal_markdown_metadata_agent_url,
+        use_cache=use_cache
+    )
+
 #%%
 @task
 def save_origin_file_md_to_db(
@@ -224,18 +586,17 @@ def save_origin_file_md_to_db(
     primary_domain: str = 'deepmd',
     api_base_url: str = DJANGO_API_ENDPOINT
 ) -> dict:
-    import requests
-
     print(f"saving paper to db: {origin_file_path=} {markdown_file_path=} {paper_metadata=}")
     
     base_data = paper_metadata.copy()
     base_data["primary_domain"] = primary_domain
     
-    files = {}
-    files['origin_file'] = open(origin_file_path, 'rb')
-    files['markdown_file'] = open(markdown_file_path, 'rb')
-    
-    response = requests.post(f"{api_base_url}/papers", data=base_data, files=files)
+    # streamed from disk, the files are closed once sent
+    files = {
+        'origin_file': (os.path.basename(origin_file_path), origin_file_path, None),
+        'markdown_file': (os.path.basename(markdown_file_path), markdown_file_path, None),
+    }
+    response = http_client.post_multipart(f"{api_base_url}/papers", "papers_api", fields=base_data, files=files)
     
     response.raise_for_status()
 
@@ -247,7 +608,7 @@ def save_origin_file_md_to_db(
 #%%
 
 def update_paper_fastgpt_collection(paper_id: int, fastgpt_collectionId: str):
-    response = requests.patch(f"{DJANGO_API_ENDPOINT}/papers/{paper_id}/fastgpt-collectionId", json={"fastgpt_collectionId": fastgpt_collectionId})
+    response = http_client.patch(f"{DJANGO_API_ENDPOINT}/papers/{paper_id}/fastgpt-collectionId", "papers_api", json={"fastgpt_collectionId": fastgpt_collectionId})
     response.raise_for_status()
     return response.json()
 
@@ -272,21 +633,21 @@ def upload_to_fastgpt_dataset(
     # 获取实际的文件名
     filename = os.path.basename(file_path)
 
-    with open(file_path, 'rb') as f:
-        # 分开传递文件和数据，模拟curl的行为
-        files = {
-            'file': (filename, f, 'text/markdown')
-        }
-        data = {
-            'data': data_json
-        }
-        response = requests.post(
-            f"{fastgpt_weburl}/api/core/dataset/collection/create/localFile", 
-            headers={"Authorization": f"Bearer {fastgpt_developer_api_key}"}, 
-            files=files,
-            data=data  # 分开传递data参数
-        )
-        response.raise_for_status()
+    # 分开传递文件和数据，模拟curl的行为
+    files = {
+        'file': (filename, file_path, 'text/markdown')
+    }
+    data = {
+        'data': data_json
+    }
+    response = http_client.post_multipart(
+        f"{fastgpt_weburl}/api/core/dataset/collection/create/localFile",
+        "fastgpt",
+        fields=data,  # 分开传递data参数
+        files=files,
+        headers={"Authorization": f"Bearer {fastgpt_developer_api_key}"}
+    )
+    response.raise_for_status()
     
     fastgpt_upload_result = response.json()
 
@@ -345,6 +706,44 @@ def get_primary_domain_from_pdf_url(s3_object_url: str) -> str:
 
 
 
+def get_stage_checkpoints(origin_filemd5: str, engine: str, s3_object_url: str) -> StageCheckpoints:
+    """
+    Checkpoints of one origin file; a new engine or PDF_PARSER_ENGINE_VERSION re-runs from the parse,
+    the same bytes at another URL (maybe another primary_domain) re-run from the save
+    """
+    cache = DiskResultCache(
+        namespace="stage_checkpoints",
+        max_bytes=CHECKPOINT_MAX_BYTES,
+        ttl_seconds=CHECKPOINT_TTL_SECONDS,
+        cache_dir=CHECKPOINT_CACHE_DIR
+    )
+    stage_key_parts = {
+        "parse": (engine, PDF_PARSER_FALLBACK_ENGINE, PDF_PARSER_ENGINE_VERSION),
+        "save": (s3_object_url,),
+    }
+    return StageCheckpoints(cache, origin_filemd5, CHECKPOINT_STAGES, stage_key_parts)
+
+
+def make_parse_checkpoint(parse_result: dict) -> dict:
+    """Parse checkpoint keeps the markdown itself, temp dirs do not survive a rerun"""
+    markdown_file_path = parse_result['markdown_file_path']
+    with open(markdown_file_path, 'r', encoding='utf-8') as f:
+        markdown = f.read()
+    return {
+        "markdown_filename": os.path.basename(markdown_file_path),
+        "markdown": markdown,
+        "parser_metadata": parse_result['parser_metadata']
+    }
+
+
+def restore_parse_checkpoint(parse_checkpoint: dict, temp_workdir: str) -> str:
+    """Write the checkpointed markdown into temp_workdir, return its path"""
+    markdown_file_path = os.path.join(temp_workdir, parse_checkpoint['markdown_filename'])
+    with open(markdown_file_path, 'w', encoding='utf-8') as f:
+        f.write(parse_checkpoint['markdown'])
+    return markdown_file_path
+
+
 @flow(
     flow_run_name="process-{s3_object_url}",
     persist_result=False,
@@ -353,6 +752,8 @@ def get_primary_domain_from_pdf_url(s3_object_url: str) -> str:
 )
 def workflow_handle_pdf_to_db_and_fastgpt(
     s3_object_url: str = "https://deepmodeling-docs-r2.deepmd.us/test/test_dpgen.pdf",
+    origin_filemd5: Optional[str] = None,
+    pdf_parser_engine: str = PDF_PARSER_ENGINE,
     # s3_object_key: str = "test.txt",
     # s3_bucket_endpoint: str = "https://deepmodeling-docs-r2.deepmd.us",
 ) -> list[str]:
@@ -360,29 +761,93 @@ def workflow_handle_pdf_to_db_and_fastgpt(
     # s3_object_url = f"{s3_bucket_endpoint}/{s3_object_key}"
     print(f"s3_object_url: {s3_object_url}")
 
-    download_result = download_origin_file_from_s3(s3_object_url)
-    primary_domain = get_primary_domain_from_pdf_url(s3_object_url)
-    
-
-    temp_workdir = download_result['temp_workdir']
-    origin_file_path = download_result['origin_file_path']
-    # markdown_file_path = download_result['markdown_file_path']
-    
-    origin_file_parse_result = parse_origin_file_to_markdown(
-        origin_file_path=origin_file_path,
-        temp_workdir=temp_workdir)
+    # Skip files already stored and uploaded to FastGPT (re-uploads, event replays)
+    # origin_filemd5 comes from the R2 event, otherwise from the object ETag
+    origin_filemd5 = parse_md5_from_etag(origin_filemd5) or get_origin_filemd5_from_s3(s3_object_url)
+    if origin_filemd5:
+        existing_paper = lookup_existing_papers_by_md5([origin_filemd5]).get(origin_filemd5)
+        if existing_paper and existing_paper.get('fastgpt_collectionId'):
+            print(f"already processed, skipping: {origin_filemd5=} {existing_paper=}")
+            return {
+                "skipped": True,
+                "origin_filemd5": origin_filemd5,
+                "existing_paper": existing_paper
+            }
+
+    download_result = None
+    if not origin_filemd5:
+        # no usable ETag: hash the downloaded file to find its checkpoints
+        download_result = download_origin_file_from_s3(s3_object_url)
+        origin_filemd5 = download_result['origin_filemd5']
+
+    checkpoints = get_stage_checkpoints(origin_filemd5, pdf_parser_engine, s3_object_url)
+    resume_stage = checkpoints.first_incomplete_stage()
+    print(f"stage checkpoints: {origin_filemd5=} {resume_stage=}")
+    upload_checkpoint = checkpoints.get("upload")
+    if resume_stage is None and upload_checkpoint.get("s3_object_url") == s3_object_url:
+        print("all stages checkpointed, nothing to do")
+        return upload_checkpoint
 
-    markdown_file_path = origin_file_parse_result['markdown_file_path']
-    
-    paper_metadata = agent_generate_paper_metadata(markdown_file_path=markdown_file_path)
+    primary_domain = get_primary_domain_from_pdf_url(s3_object_url)
 
-    print(f"primary_domain: {primary_domain=}")
+    parse_checkpoint = checkpoints.get("parse")
+    save_result = checkpoints.get("save")
+
+    # PDFs are fetched by the parser itself when it can reach them, the worker no longer re-uploads the bytes
+    parser_pdf_url, parse_input = None, "upload"
+    if parse_checkpoint is not None:
+        parse_input = "checkpoint"
+    elif PDF_PARSE_BY_URL and urlparse(s3_object_url).path.lower().endswith('.pdf'):
+        parser_pdf_url, parse_input = get_parser_pdf_url(s3_object_url)
+
+    # the origin file is only needed for the DB save, or to parse when the parser cannot fetch the URL;
+    # the download runs concurrently with the URL parse
+    download_future = None
+    if download_result is not None:
+        temp_workdir = download_result['temp_workdir']
+    else:
+        temp_workdir = make_download_workdir()
+        if save_result is None or (parse_checkpoint is None and parser_pdf_url is None):
+            download_future = download_origin_file_from_s3.submit(s3_object_url, temp_workdir)
+    print(f"{parse_input=} downloading={download_result is not None or download_future is not None}")
 
-    save_result = save_origin_file_md_to_db(
-        origin_file_path=origin_file_path,
-        markdown_file_path=markdown_file_path,
-        primary_domain=primary_domain,
-        paper_metadata=paper_metadata)
+    if parse_checkpoint is not None:
+        markdown_file_path = restore_parse_checkpoint(parse_checkpoint, temp_workdir)
+    else:
+        if parser_pdf_url:
+            origin_file_parse_result = parse_origin_url_to_markdown(
+                s3_object_url=s3_object_url,
+                pdf_url=parser_pdf_url,
+                origin_filemd5=origin_filemd5,
+                temp_workdir=temp_workdir,
+                engine=pdf_parser_engine)
+        else:
+            if download_result is None:
+                download_result = download_future.result()
+            origin_file_parse_result = parse_origin_file_to_markdown(
+                origin_file_path=download_result['origin_file_path'],
+                temp_workdir=temp_workdir,
+                engine=pdf_parser_engine)
+        markdown_file_path = origin_file_parse_result['markdown_file_path']
+        checkpoints.set("parse", make_parse_checkpoint(origin_file_parse_result))
+
+    if download_result is None and download_future is not None:
+        download_result = download_future.result()
+
+    if save_result is None:
+        paper_metadata = checkpoints.get("metadata")
+        if paper_metadata is None:
+            paper_metadata = agent_generate_paper_metadata(markdown_file_path=markdown_file_path)
+            checkpoints.set("metadata", paper_metadata)
+
+        print(f"primary_domain: {primary_domain=}")
+
+        save_result = save_origin_file_md_to_db(
+            origin_file_path=download_result['origin_file_path'],
+            markdown_file_path=markdown_file_path,
+            primary_domain=primary_domain,
+            paper_metadata=paper_metadata)
+        checkpoints.set("save", save_result)
 
     paper_id = save_result['id']
 
@@ -397,9 +862,16 @@ def workflow_handle_pdf_to_db_and_fastgpt(
     # print(f"upload_result: {upload_result=}")
 
     workflow_result = {
+        "s3_object_url": s3_object_url,
         "save_result": save_result,
-        "upload_result": upload_result
+        "upload_result": upload_result,
+        # how the parser got the file: pdf_url / presigned_url / upload / checkpoint
+        "parse_input": parse_input,
+        "downloaded": download_result is not None
     }
+    checkpoints.set("upload", workflow_result)
+    # item finished, free its disk space (failed runs keep their workdir until the disk budget evicts it)
+    shutil.rmtree(temp_workdir, ignore_errors=True)
     # summary = f"Processed PDF: {s3_object_url}"
 
     return workflow_result